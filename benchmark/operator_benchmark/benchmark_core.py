@@ -1,14 +1,23 @@
 import functools
+import math
 import numpy as np
-import timeit
 import json
 import torch
 import copy
 import ast
+import contextlib
+import io
+import multiprocessing
+import os
+import time
+import traceback
+from multiprocessing import connection as mp_connection
 
 # needs to be imported after torch
 import torch.utils.cpp_extension as cpp_extension  # noqa: F401
 
+import benchmark_replay
+import benchmark_timer
 import benchmark_utils
 from collections import namedtuple
 import benchmark_res as res_keys
@@ -167,6 +176,37 @@ def _build_test(
             )
 
 
+def _median_ci(samples, z=1.96):
+    """Distribution-free confidence interval of the median from order statistics,
+    z=1.96 gives the 95% interval.
+    """
+    x = np.sort(samples)
+    n = len(x)
+    half_width = z * math.sqrt(n) / 2
+    low = max(math.floor(n / 2 - half_width) - 1, 0)
+    high = min(math.ceil(n / 2 + half_width), n - 1)
+    return x[low], x[high]
+
+
+def _count_outliers(samples, k=3):
+    """Number of samples outside the Tukey fences of k times the interquartile range"""
+    q1, q3 = np.percentile(samples, [25, 75])
+    iqr = q3 - q1
+    return int(np.count_nonzero((samples < q1 - k * iqr) | (samples > q3 + k * iqr)))
+
+
+def _warmup_drift(samples):
+    """Relative change of the median from the first to the last quarter of samples,
+    a large drift means the operator was not warmed up or the device throttled.
+    """
+    quarter = len(samples) // 4
+    if quarter < 2:
+        return None
+    first = np.median(samples[:quarter])
+    last = np.median(samples[-quarter:])
+    return float((last - first) / np.median(samples))
+
+
 class BenchmarkRunner:
     """BenchmarkRunner is responsible for benchmarking all the registered
     benchmark test groups.
@@ -186,8 +226,15 @@ class BenchmarkRunner:
         self.iters = 100
         self.has_explicit_iteration_count = False
         self.multiplier = 2
-        self.predefined_minimum_secs = 1
         self.max_iters = 1e6
+        # a batch of iterations is timed as one sample, it should be long enough
+        # for the timer and the synchronization not to matter
+        self.min_batch_secs = 0.01
+        self.min_batches = 10
+        self.max_batches = 10000
+        # relative change of the median between the first and the last quarter of
+        # the batches reported as warm-up drift
+        self.drift_threshold = 0.05
         self.use_jit = args.use_jit
         self.num_runs = args.num_runs
         self.print_per_iter = False
@@ -257,41 +304,40 @@ class BenchmarkRunner:
                             run, mode, reported_run_time_us[run]
                         )
                     )
-                print()
             else:
                 print(
-                    "{} Execution Time (us) : {:.3f}\n".format(
+                    "{} Execution Time (us) : {:.3f}".format(
                         mode, reported_run_time_us[0]
                     )
                 )
+            if test_case.get_device_time() is not None:
+                print(
+                    "Host Time (us) : {:.3f}, Device Time (us) : {:.3f}".format(
+                        test_case.get_host_time(), test_case.get_device_time()
+                    )
+                )
+            if test_case.get_replay_time() is not None:
+                print(
+                    "out= Reuse Execution Time (us) : {:.3f}".format(
+                        test_case.get_replay_time()
+                    )
+                )
+            print()
 
     def _predict_num_iter_needed(self, i):
         return i * self.multiplier
 
-    def _iteration_result_is_significant(
-        self, iters, run_time_sec, curr_test_total_time, has_explicit_iteration_count
-    ):
-        """This function decides whether the measured time can be reported based on the
-        following conditions: 1) the number of iterations is larger than the max_iters.
-        2) the execution time is larger than the predefined minimum_time
-        3) the execution time is larger than user defined minimum_time
-        """
-        return (
-            iters > self.max_iters
-            or run_time_sec > self.predefined_minimum_secs
-            or has_explicit_iteration_count
-        ) and curr_test_total_time > self.args.min_time_per_test
-
     def _launch_forward(self, test_case, iters, print_per_iter):
-        """Use Python's timeit module to measure execution time (unit: second)."""
-        cuda_sync = "musa" in test_case.test_config.test_name
+        """Use the timer of the test case to measure execution time (unit: second)."""
+        # the timer synchronizes after the batch, run_forward only has to
+        # synchronize when it times every iteration
+        cuda_sync = print_per_iter and test_case.device_type() == "musa"
         func = test_case.run_forward
         if self.use_jit:
             func = test_case.run_jit_forward
-        forward_time = timeit.timeit(
-            functools.partial(func, iters, print_per_iter, cuda_sync), number=1
+        return test_case.get_timer().time(
+            functools.partial(func, iters, print_per_iter, cuda_sync)
         )
-        return forward_time
 
     def _launch_backward(self, test_case, iters, print_per_iter=False):
         """This function runs forward path of an op to get an output. Then the backward path is executed
@@ -300,38 +346,99 @@ class BenchmarkRunner:
         test_case.run_forward(num_runs=1, print_per_iter=False, cuda_sync=False)
         if test_case.framework == "PyTorch":
             test_case._output_mean()
-        backward_time = timeit.timeit(
-            functools.partial(test_case.run_backward, iters, print_per_iter), number=1
+        return test_case.get_timer().time(
+            functools.partial(test_case.run_backward, iters, print_per_iter)
         )
-        return backward_time
 
-    def _measure_time(self, launch_test, test_case, iters, print_per_iter):
+    def _launch_replay(self, test_case, iters, print_per_iter=False):
+        """Runs a batch of <iters> forward iterations with out= reuse, creating
+        the preallocated output is not timed.
         """
-        This function execute the operator for <iters> iterations then look at the time.
-        If it's not significant, the number of iterations will be increased before rerun.
-        The execution stops when the time becomes significant.
+        replay = test_case.get_replay(iters)
+        return test_case.get_timer().time(replay.replay)
+
+    def _calibrate_iters(self, launch_test, test_case, iters, print_per_iter):
+        """Grows the number of iterations of a batch until a batch lasts at least
+        min_batch_secs. The batches run here are not kept as samples.
         """
-        curr_test_total_time = 0
+        if self.has_explicit_iteration_count:
+            return iters
+        while iters < self.max_iters:
+            batch_time = launch_test(test_case, iters, print_per_iter)
+            if batch_time.latency >= self.min_batch_secs:
+                break
+            iters = self._predict_num_iter_needed(iters)
+        return int(iters)
+
+    def _collect_samples(self, launch_test, test_case, iters, print_per_iter):
+        """
+        This function executes the operator in batches of <iters> iterations, the
+        average time of an iteration in a batch is one sample, <iters> comes from
+        _calibrate_iters. Batches are collected until the 95% confidence interval of the median is
+        narrower than +-target_ci of the median, or until the time budget of the
+        test is used up. Returns the samples of latency, host and device time (us)
+        and the statistics of sampling. A timer which measures the device time over
+        all the batches gives a single device time sample.
+        """
+        timer = test_case.get_timer()
+        start = time.perf_counter()
         time_trace = []
-        while True:
-            run_time_sec = launch_test(test_case, iters, print_per_iter)
-            curr_test_total_time += run_time_sec
-            # Analyze time after each run to decide if the result is stable
-            results_are_significant = self._iteration_result_is_significant(
-                iters,
-                run_time_sec,
-                curr_test_total_time,
-                self.has_explicit_iteration_count,
-            )
+        host_trace = []
+        device_trace = []
+        ci_half_width = None
+        with timer.window():
+            while True:
+                batch_time = launch_test(test_case, iters, print_per_iter)
+                elapsed = time.perf_counter() - start
+
+                report_run_time = 1e6 * batch_time.latency / iters
+                time_trace.append(report_run_time)
+                host_trace.append(1e6 * batch_time.host / iters)
+                if batch_time.device is not None:
+                    device_trace.append(1e6 * batch_time.device / iters)
+                if elapsed < self.args.min_time_per_test:
+                    continue
+                if len(time_trace) >= self.min_batches:
+                    low, high = _median_ci(time_trace)
+                    ci_half_width = (high - low) / 2 / np.median(time_trace)
+                    if ci_half_width <= self.args.target_ci:
+                        stop_reason = "converged"
+                        break
+                if elapsed >= self.args.max_time_per_test:
+                    stop_reason = "time_budget"
+                    break
+                if len(time_trace) >= self.max_batches:
+                    stop_reason = "max_batches"
+                    break
+        if timer.window_device is not None:
+            device_trace.append(1e6 * timer.window_device / iters / len(time_trace))
+
+        sample_stats = {
+            "batch_iters": iters,
+            "num_batches": len(time_trace),
+            "ci_half_width": ci_half_width,
+            "stop_reason": stop_reason,
+            "num_outliers": _count_outliers(np.array(time_trace)),
+            "warmup_drift": _warmup_drift(time_trace),
+        }
+        return time_trace, host_trace, device_trace, sample_stats
 
-            report_run_time = 1e6 * run_time_sec / iters
-            time_trace.append(report_run_time)
-            # Print out the time spent in each epoch in ms
-            if self.args.report_aibench:
-                mode = "JIT" if self.use_jit else "Eager"
-                test_name = "_".join(
-                    [test_case.framework, test_case.test_config.test_name, mode]
-                )
+    def _measure_time(self, launch_test, test_case, iters, print_per_iter):
+        """
+        This function samples the latency of the operator, see _collect_samples,
+        and reports the median latency, outliers and drift of the samples together
+        with the median host and device time of an iteration measured by the timer.
+        """
+        time_trace, host_trace, device_trace, sample_stats = self._collect_samples(
+            launch_test, test_case, iters, print_per_iter
+        )
+        # Print out the time spent in each epoch in ms
+        if self.args.report_aibench:
+            mode = "JIT" if self.use_jit else "Eager"
+            test_name = "_".join(
+                [test_case.framework, test_case.test_config.test_name, mode]
+            )
+            for report_run_time in time_trace:
                 print(
                     "PyTorchObserver "
                     + json.dumps(
@@ -343,13 +450,8 @@ class BenchmarkRunner:
                         }
                     )
                 )
-            if results_are_significant:
-                break
-
-            # Re-estimate the hopefully-sufficient
-            # iteration count, and run the benchmark again...
-            iters = self._predict_num_iter_needed(iters)
 
+        test_case.add_samples(time_trace)
         time_trace = np.array(time_trace)
         reported_run_time_us = np.around(np.percentile(time_trace, 50), decimals=3)
         times_percentile = np.percentile(time_trace, [0, 25, 50, 75, 100])
@@ -360,14 +462,49 @@ class BenchmarkRunner:
             var=var,
             percentile=np.around(times_percentile, decimals=3).tolist(),
         )
+        num_outliers = sample_stats["num_outliers"]
+        drift = sample_stats["warmup_drift"]
+        if not self.args.report_aibench:
+            if num_outliers:
+                print(
+                    "# Warning: {} of {} batches are outliers".format(
+                        num_outliers, len(time_trace)
+                    )
+                )
+            if drift is not None and abs(drift) > self.drift_threshold:
+                print(
+                    "# Warning: latency drifted by {:+.1%} from the first to the "
+                    "last batches, consider more warmup iterations".format(drift)
+                )
 
         # calc macs
         test_case.set_macs(test_case.op_bench.calc_flops())
         test_case.set_reported_time(reported_run_time_us)
         test_case.set_time_metric(time_metirc)
+        test_case.set_sample_stats(sample_stats)
+        test_case.set_host_time(np.around(np.median(host_trace), decimals=3))
+        if device_trace:
+            test_case.set_device_time(np.around(np.median(device_trace), decimals=3))
 
         return reported_run_time_us
 
+    def _measure_replay_time(self, test_case):
+        """
+        This function samples the latency of the forward path run with out= reuse,
+        see benchmark_replay, and reports its median. Ops without a usable out=
+        variant are skipped.
+        """
+        try:
+            test_case.get_replay(self.iters)
+        except benchmark_replay.NotReplayableError as e:
+            print("# out= reuse is not supported: {}".format(e))
+            return
+        iters = self._calibrate_iters(self._launch_replay, test_case, self.iters, False)
+        time_trace, _, _, _ = self._collect_samples(
+            self._launch_replay, test_case, iters, False
+        )
+        test_case.set_replay_time(np.around(np.median(time_trace), decimals=3))
+
     def _check_keep(self, test_flag, cmd_flag):
         return cmd_flag is None or test_flag == cmd_flag
 
@@ -439,72 +576,330 @@ class BenchmarkRunner:
 
         return False
 
-    def run(self):
+    def _iter_tests(self):
+        """Yields (test group index, config index, full test id, test case) of
+        every test case kept by the filters, in a deterministic order.
         """
-        Run operator benchmark and return the result.
+        for group_index, test_metainfo in enumerate(BENCHMARK_TESTER):
+            configs = test_metainfo[0]
+            for config_index, config in enumerate(configs):
+                for full_test_id, test_case in _build_test(
+                    [config], *test_metainfo[1:]
+                ):
+                    if not self._keep_test(test_case):
+                        continue
+                    yield group_index, config_index, full_test_id, test_case
+
+    def _build_test_case(self, group_index, config_index, test_name):
+        """Builds the test case named test_name from a single config of a test
+        group and returns (full test id, test case), or None if there is none.
         """
-        self._print_header()
+        test_metainfo = BENCHMARK_TESTER[group_index]
+        config = test_metainfo[0][config_index]
+        for full_test_id, test_case in _build_test([config], *test_metainfo[1:]):
+            if test_case.test_config.test_name == test_name:
+                return full_test_id, test_case
+        return None
+
+    def _run_test_case(self, full_test_id, test_case):
+        """Benchmarks a single test case and returns its result."""
+        op_test_config = test_case.test_config
+        # To reduce variance, fix a numpy randseed to the test case,
+        # so that the randomly generated input tensors remain the
+        # same for each test case.
+        # The random seed is limited to 32-bit because of numpy
+        # requirement.
+        np.random.seed(seed=hash(full_test_id) & ((1 << 32) - 1))
+        test_case.set_timer(
+            benchmark_timer.create_timer(self.args.timer, test_case.device_type())
+        )
+
+        print(
+            "# Benchmarking {}: {}".format(
+                test_case.framework, test_case.op_bench.module_name()
+            )
+        )
+
+        if op_test_config.run_backward:
+            launch_func = self._launch_backward
+        else:
+            launch_func = self._launch_forward
+
+        # Warmup
+        launch_func(test_case, self.args.warmup_iterations, print_per_iter=False)
+        # The batch size is calibrated once so that all the runs share it
+        iters = self._calibrate_iters(
+            launch_func, test_case, self.iters, self.print_per_iter
+        )
+        # Actual Execution
+        reported_time = [
+            self._measure_time(launch_func, test_case, iters, self.print_per_iter)
+            for _ in range(self.num_runs)
+        ]
+        if self.args.out_reuse and not op_test_config.run_backward:
+            self._measure_replay_time(test_case)
+
+        self._print_perf_result(reported_time, test_case)
+
+        # return the benchmark res
+        return test_case.dump_res()
+
+    def _new_results(self):
         benchmark_results = {}
         benchmark_results["musa_stack"] = {
             "musa": sw_stack_detection.get_musa_stack_version(),
             "driver": sw_stack_detection.get_ddk_version(),
         }
         benchmark_results["benchmark_result"] = []
+        return benchmark_results
+
+    def _add_test_case_res(self, perf_res_dict, op_name, test_case_res):
+        if res_keys.KEY_OP_NAME not in perf_res_dict:
+            perf_res_dict[res_keys.KEY_OP_NAME] = op_name
+            perf_res_dict[res_keys.KEY_MODE] = "JIT" if self.args.use_jit else "Eager"
+        if res_keys.KEY_TEST_CASES not in perf_res_dict:
+            perf_res_dict[res_keys.KEY_TEST_CASES] = [test_case_res]
+        else:
+            perf_res_dict[res_keys.KEY_TEST_CASES].append(test_case_res)
+
+    def run(self):
+        """
+        Run operator benchmark and return the result.
+        """
+        self._print_header()
+        if (
+            self.args.num_workers > 0
+            and not self.args.list_tests
+            and not self.args.list_ops
+        ):
+            return self._run_parallel()
+        benchmark_results = self._new_results()
         for test_metainfo in BENCHMARK_TESTER:
             perf_res_dict = {}
             for test in _build_test(*test_metainfo):
                 full_test_id, test_case = test
-                op_test_config = test_case.test_config
                 if self._print_test_case_info(test_case):
                     continue
 
                 if not self._keep_test(test_case):
                     continue
 
-                # To reduce variance, fix a numpy randseed to the test case,
-                # so that the randomly generated input tensors remain the
-                # same for each test case.
-                # The random seed is limited to 32-bit because of numpy
-                # requirement.
-                np.random.seed(seed=hash(full_test_id) & ((1 << 32) - 1))
-
-                print(
-                    "# Benchmarking {}: {}".format(
-                        test_case.framework, test_case.op_bench.module_name()
-                    )
+                test_case_res = self._run_test_case(full_test_id, test_case)
+                self._add_test_case_res(
+                    perf_res_dict, test_case.op_bench.module_name(), test_case_res
                 )
 
-                if op_test_config.run_backward:
-                    launch_func = self._launch_backward
-                else:
-                    launch_func = self._launch_forward
+            benchmark_results["benchmark_result"].append(perf_res_dict)
+        return benchmark_results
 
-                # Warmup
-                launch_func(
-                    test_case, self.args.warmup_iterations, print_per_iter=False
+    def _worker_num_threads(self):
+        """Number of threads of each worker process."""
+        return self.args.omp_num_threads or max(
+            1, (os.cpu_count() or 1) // self.args.num_workers
+        )
+
+    def _setup_worker(self, worker_id):
+        """Sets the number of threads and the device of a worker process."""
+        torch.set_num_threads(self._worker_num_threads())
+        if self.args.device_ids is not None:
+            device_ids = benchmark_utils.process_arg_list(self.args.device_ids)
+            torch.musa.set_device(int(device_ids[worker_id % len(device_ids)]))
+
+    def _run_parallel(self):
+        """
+        Run the test cases in worker processes and merge their results.
+
+        Test cases are handed out one at a time to --num-workers processes. A test
+        case which raises, crashes its worker or runs longer than --case-timeout
+        seconds is recorded under "failed_test_cases", and a crashed or timed out
+        worker is replaced by a new one, so the rest of the sweep goes on.
+        """
+        benchmark_results = self._new_results()
+        test_infos = []
+        num_groups = len(BENCHMARK_TESTER)
+        for group_index, config_index, _, test_case in self._iter_tests():
+            test_infos.append(
+                (
+                    group_index,
+                    config_index,
+                    test_case.op_bench.module_name(),
+                    test_case.test_config.test_name,
                 )
-                # Actual Execution
-                reported_time = [
-                    self._measure_time(
-                        launch_func, test_case, self.iters, self.print_per_iter
-                    )
-                    for _ in range(self.num_runs)
-                ]
-
-                self._print_perf_result(reported_time, test_case)
-
-                # return the benchmark res
-                test_case_res = test_case.dump_res()
-                benchmark_name = test_case.op_bench.module_name()
-                if res_keys.KEY_OP_NAME not in perf_res_dict:
-                    perf_res_dict[res_keys.KEY_OP_NAME] = benchmark_name
-                    perf_res_dict[res_keys.KEY_MODE] = (
-                        "JIT" if self.args.use_jit else "Eager"
-                    )
-                if res_keys.KEY_TEST_CASES not in perf_res_dict:
-                    perf_res_dict[res_keys.KEY_TEST_CASES] = [test_case_res]
-                else:
-                    perf_res_dict[res_keys.KEY_TEST_CASES].append(test_case_res)
+            )
+        print(
+            "# Running {} test cases in {} workers\n".format(
+                len(test_infos), self.args.num_workers
+            )
+        )
 
-            benchmark_results["benchmark_result"].append(perf_res_dict)
+        # OpenMP and MKL read these when the worker loads them, so they are
+        # set here to be inherited by the workers
+        num_threads = self._worker_num_threads()
+        benchmark_utils.set_omp_threads(num_threads)
+        benchmark_utils.set_mkl_threads(self.args.mkl_num_threads or num_threads)
+        # spawn instead of fork, the parent has already initialized the device
+        ctx = multiprocessing.get_context("spawn")
+        pending = list(range(len(test_infos)))
+        pending.reverse()
+        workers = [None] * self.args.num_workers
+        results = {}
+        failures = {}
+
+        def fail(worker, status, message):
+            _, _, op_name, test_name = test_infos[worker.index]
+            failures[worker.index] = {
+                res_keys.KEY_OP_NAME: op_name,
+                res_keys.KEY_TEST_NAME: test_name,
+                res_keys.KEY_STATUS: status,
+                res_keys.KEY_ERROR: message,
+            }
+            print("# Failed ({}): {}\n{}".format(status, test_name, message))
+            worker.index = None
+
+        try:
+            while True:
+                for worker_id, worker in enumerate(workers):
+                    if worker is not None and worker.index is not None:
+                        continue
+                    if not pending:
+                        if worker is not None:
+                            worker.close()
+                            workers[worker_id] = None
+                        continue
+                    if worker is None:
+                        worker = _Worker(ctx, self.args, worker_id)
+                        workers[worker_id] = worker
+                    index = pending.pop()
+                    worker.assign(index, test_infos[index], self.args.case_timeout)
+
+                busy = [worker for worker in workers if worker is not None]
+                if not busy:
+                    break
+                deadlines = [w.deadline for w in busy if w.deadline is not None]
+                timeout = None
+                if deadlines:
+                    timeout = max(0, min(deadlines) - time.monotonic())
+                ready = mp_connection.wait(
+                    [w.conn for w in busy] + [w.process.sentinel for w in busy],
+                    timeout,
+                )
+
+                for worker in busy:
+                    message = None
+                    if worker.conn in ready:
+                        try:
+                            message = worker.conn.recv()
+                        except EOFError:
+                            pass
+                    if message is not None:
+                        index, test_case_res, error, output = message
+                        print(output, end="")
+                        if error is None:
+                            results[index] = test_case_res
+                            worker.index = None
+                        else:
+                            fail(worker, res_keys.STATUS_ERROR, error)
+                        if worker.process.sentinel not in ready:
+                            continue
+                        worker.kill()
+                    elif worker.conn in ready or worker.process.sentinel in ready:
+                        worker.kill()
+                        fail(
+                            worker,
+                            res_keys.STATUS_CRASH,
+                            "worker exited with code {}".format(
+                                worker.process.exitcode
+                            ),
+                        )
+                    elif worker.deadline is not None and (
+                        time.monotonic() >= worker.deadline
+                    ):
+                        worker.kill()
+                        fail(
+                            worker,
+                            res_keys.STATUS_TIMEOUT,
+                            "exceeded {} seconds".format(self.args.case_timeout),
+                        )
+                    else:
+                        continue
+                    workers[workers.index(worker)] = None
+        finally:
+            for worker in workers:
+                if worker is not None:
+                    worker.kill()
+
+        perf_res_dicts = [{} for _ in range(num_groups)]
+        for index in sorted(results):
+            group_index, _, op_name, _ = test_infos[index]
+            self._add_test_case_res(
+                perf_res_dicts[group_index], op_name, results[index]
+            )
+        benchmark_results["benchmark_result"] = perf_res_dicts
+        benchmark_results[res_keys.KEY_FAILED_TEST_CASES] = [
+            failures[index] for index in sorted(failures)
+        ]
         return benchmark_results
+
+
+class _Worker:
+    """A worker process of BenchmarkRunner which runs one test case at a time."""
+
+    def __init__(self, ctx, args, worker_id):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main, args=(args, worker_id, child_conn), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.index = None
+        self.deadline = None
+
+    def assign(self, index, test_info, timeout):
+        group_index, config_index, _, test_name = test_info
+        self.index = index
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.conn.send((index, group_index, config_index, test_name))
+
+    def close(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout=10)
+        self.kill()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+def _worker_main(args, worker_id, conn):
+    """Entry of a worker process, runs the test cases it receives.
+
+    A test case is received as its index, test group, config and test name, and
+    only that config of the test group is built. The output of a test case is
+    captured and sent back with its result.
+    """
+    runner = BenchmarkRunner(args)
+    runner._setup_worker(worker_id)
+    while True:
+        message = conn.recv()
+        if message is None:
+            return
+        index, group_index, config_index, test_name = message
+        test = runner._build_test_case(group_index, config_index, test_name)
+        if test is None:
+            conn.send((index, None, "test case not found in worker", ""))
+            continue
+        full_test_id, test_case = test
+        output = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(output):
+                test_case_res = runner._run_test_case(full_test_id, test_case)
+            conn.send((index, test_case_res, None, output.getvalue()))
+        except Exception:
+            conn.send((index, None, traceback.format_exc(), output.getvalue()))
+        # drop the inputs of the finished test case
+        del test, test_case
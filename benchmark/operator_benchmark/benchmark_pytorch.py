@@ -2,6 +2,7 @@ import time
 import json
 import torch
 import copy
+import benchmark_replay
 import benchmark_utils
 import benchmark_cpp_extension  # noqa: F401
 import benchmark_res as res_keys
@@ -98,6 +99,18 @@ class TorchBenchmarkBase(torch.nn.Module):
         for _ in range(iters):
             torch.ops.operator_benchmark._consume(self.forward_impl())
 
+    def forward_out(self, *args, out):
+        """Same as forward, but writes the result into out. It is used to run the
+        op with out= reuse. By default it calls op_func with out= if the benchmark
+        has one, other ops override it with their out= variant.
+        """
+        op_func = getattr(self, "op_func", None)
+        if op_func is None:
+            raise benchmark_replay.NotReplayableError(
+                "{} has no out= variant".format(self.module_name())
+            )
+        return op_func(*args, out=out)
+
     def module_name(self):
         """this is used to label the operator being benchmarked"""
         if self.user_given_name:
@@ -155,6 +168,13 @@ class PyTorchOperatorTestCase:
         self._reported_time = None
         self._test_case_name = None
         self._time_metric = None
+        self._samples = []
+        self._sample_stats = None
+        self._timer = None
+        self._host_time = None
+        self._device_time = None
+        self._replay = None
+        self._replay_time = None
 
     def _generate_jit_forward_graph(self):
         """generate a graph for the forward function via scripting"""
@@ -195,6 +215,64 @@ class PyTorchOperatorTestCase:
     def get_time_metric(self):
         return self._time_metric
 
+    def add_samples(self, samples):
+        """Keep the per-iteration latencies (us) of a run, used to compare results"""
+        self._samples.extend(samples)
+
+    def get_samples(self):
+        return self._samples
+
+    def device_type(self):
+        """Device type of the inputs of the op, "cpu" if it has no tensor input"""
+        for value in (self.op_bench.inputs or {}).values():
+            if isinstance(value, torch.Tensor):
+                return value.device.type
+        for param in self.op_bench.parameters():
+            return param.device.type
+        return "cpu"
+
+    def set_timer(self, timer):
+        self._timer = timer
+
+    def get_timer(self):
+        return self._timer
+
+    def set_host_time(self, host_time):
+        """Time (us) the host spent in launching an iteration"""
+        self._host_time = host_time
+
+    def get_host_time(self):
+        return self._host_time
+
+    def set_device_time(self, device_time):
+        """Time (us) the device spent in an iteration, None if not measured"""
+        self._device_time = device_time
+
+    def get_device_time(self):
+        return self._device_time
+
+    def get_replay(self, iters):
+        """Returns the out= reuse of <iters> forward iterations, it is created
+        again if the number of iterations changes.
+        """
+        if self._replay is None or self._replay.iters != iters:
+            # release the previous output before allocating it again
+            self._replay = None
+            self._replay = benchmark_replay.create_replay(self.op_bench, iters)
+        return self._replay
+
+    def set_replay_time(self, latency):
+        self._replay_time = latency
+
+    def get_replay_time(self):
+        return self._replay_time
+
+    def set_sample_stats(self, sample_stats):
+        self._sample_stats = sample_stats
+
+    def get_sample_stats(self):
+        return self._sample_stats
+
     def get_reported_time(self):
         return self._reported_time
 
@@ -268,6 +346,12 @@ class PyTorchOperatorTestCase:
         res[res_keys.KEY_FLOPS] = self.get_flops()
         res[res_keys.KEY_IS_BACKWARD] = self.test_config.run_backward
         res[res_keys.KEY_TIME_METRIC] = self.get_time_metric()
+        res[res_keys.KEY_SAMPLES] = [round(t, 3) for t in self.get_samples()]
+        res[res_keys.KEY_SAMPLE_STATS] = self.get_sample_stats()
+        res[res_keys.KEY_TIMER] = self.get_timer().name if self.get_timer() else None
+        res[res_keys.KEY_HOST_TIME] = self.get_host_time()
+        res[res_keys.KEY_DEVICE_TIME] = self.get_device_time()
+        res[res_keys.KEY_OUT_REUSE_LATENCY] = self.get_replay_time()
         res[res_keys.KEY_INPUT_CONFIG] = benchmark_utils.init_dict_to_serializable(
             self.op_bench.get_init_dict()
         )
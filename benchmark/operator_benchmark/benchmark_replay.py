@@ -0,0 +1,52 @@
+import functools
+
+import torch
+
+"""out= reuse of the forward path of performance microbenchmarks.
+
+For tiny ops the eager latency is dominated by Python, the dispatcher and the
+kernel launch. Running a batch of iterations of an op through its out= variant
+into one preallocated output skips forward_impl and the output allocation, so
+that comparing its latency with the eager latency tells whether an op is bound
+by overhead around the kernel.
+"""
+
+
+class NotReplayableError(Exception):
+    """Raised if the forward path of an op can't be run with out= reuse."""
+
+
+class OutReplay:
+    """Runs the out= variant of the op on the inputs <iters> times, so that every
+    iteration reuses one preallocated output and skips forward_impl. The op must
+    implement forward_out.
+    """
+
+    name = "out"
+
+    def __init__(self, op_bench, iters):
+        self.iters = iters
+        inputs = op_bench.get_inputs()
+        output = op_bench.forward(*inputs)
+        if not isinstance(output, torch.Tensor):
+            raise NotReplayableError("the output of the op is not a single tensor")
+        self.out = torch.empty_like(output)
+        self._run = functools.partial(op_bench.forward_out, *inputs, out=self.out)
+        try:
+            self._run()
+        except (TypeError, RuntimeError) as e:
+            # op_func has no out= overload or rejects the preallocated output
+            raise NotReplayableError(
+                "the out= variant of the op failed: {}".format(e)
+            ) from e
+
+    def replay(self):
+        for _ in range(self.iters):
+            self._run()
+
+
+def create_replay(op_bench, iters):
+    """Creates the out= reuse of <iters> iterations of the forward path of
+    op_bench. Raises NotReplayableError if the op has no usable out= variant.
+    """
+    return OutReplay(op_bench, iters)
@@ -20,9 +20,22 @@ KEY_INPUT_CONFIG = "test_config"
 KEY_TEST_CASES = "test_cases"
 KEY_MODE = "mode"
 KEY_TIME_METRIC = "time_metric"
+KEY_SAMPLES = "samples"
+KEY_SAMPLE_STATS = "sample_stats"
+KEY_TIMER = "timer"
+KEY_HOST_TIME = "host_time"
+KEY_DEVICE_TIME = "device_time"
+KEY_OUT_REUSE_LATENCY = "out_reuse_latency"
+KEY_FAILED_TEST_CASES = "failed_test_cases"
+KEY_STATUS = "status"
+KEY_ERROR = "error"
 
 
 # constant val
 KEY_LATENCY_UNIT = "us"
+STATUS_ERROR = "error"
+STATUS_CRASH = "crash"
+STATUS_TIMEOUT = "timeout"
 
-TIME_METRIC = namedtuple("metric", "mean, var, percentile")
+# named as the variable so that results can be pickled back from worker processes
+TIME_METRIC = namedtuple("TIME_METRIC", "mean, var, percentile")
@@ -2,9 +2,11 @@ import argparse
 import json
 import torch
 import os
+import sys
 
 import benchmark_core
 import benchmark_utils
+from utils import op_bench_compare
 
 """Performance microbenchmarks's main binary.
 
@@ -62,7 +64,7 @@ def parse_args():
 
     parser.add_argument(
         "--iterations",
-        help="Repeat each operator for the number of iterations",
+        help="Number of iterations of the operator timed as one sample, by default increased until a sample takes 10ms",
         type=int,
     )
 
@@ -82,6 +84,29 @@ def parse_args():
         default=0,
     )
 
+    parser.add_argument(
+        "--max-time-per-test",
+        "--max_time_per_test",
+        help="Stop sampling a test after this time (unit: seconds) even if the median has not converged",
+        type=float,
+        default=10,
+    )
+
+    parser.add_argument(
+        "--target-ci",
+        "--target_ci",
+        help="Stop sampling a test once the half width of the 95%% confidence interval of the median is below this fraction of the median",
+        type=float,
+        default=0.01,
+    )
+
+    parser.add_argument(
+        "--timer",
+        help="Timer of MUSA test cases: host clock only, a pair of MUSA events, or the sum of the kernels traced by the profiler. Other devices always use the host timer",
+        choices=["host", "event", "profiler"],
+        default="event",
+    )
+
     parser.add_argument(
         "--warmup-iterations",
         "--warmup_iterations",
@@ -126,6 +151,15 @@ def parse_args():
         help="Run operators with PyTorch JIT mode",
     )
 
+    parser.add_argument(
+        "--out-reuse",
+        type=benchmark_utils.str2bool,
+        nargs="?",
+        const=True,
+        default=False,
+        help="Also report the latency of the forward path run through the out= variant of the op into one preallocated output",
+    )
+
     parser.add_argument(
         "--forward-only",
         "--forward_only",
@@ -148,6 +182,29 @@ def parse_args():
         default="None",
     )
 
+    parser.add_argument(
+        "--num-workers",
+        "--num_workers",
+        help="Run test cases in this number of worker processes (0 runs them in this process)",
+        default=0,
+        type=int,
+    )
+
+    parser.add_argument(
+        "--case-timeout",
+        "--case_timeout",
+        help="Fail a test case running longer than this (unit: seconds) in a worker process, 0 for no limit",
+        default=0,
+        type=float,
+    )
+
+    parser.add_argument(
+        "--device-ids",
+        "--device_ids",
+        help="Comma-delimited list of device indices the worker processes are pinned to in turn",
+        default=None,
+    )
+
     parser.add_argument("--res-dir", type=str, default=None)
 
     parser.add_argument("--res-file-name", type=str, default=None)
@@ -174,6 +231,9 @@ def parse_args():
 
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "compare":
+        # compare two saved results, e.g. `python -m benchmark_runner compare a b`
+        sys.exit(op_bench_compare.main(sys.argv[2:]))
     args = parse_args()
     benchmark_res = benchmark_core.BenchmarkRunner(args).run()
     if args.res_dir is not None and args.res_file_name is not None:
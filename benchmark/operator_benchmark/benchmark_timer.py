@@ -0,0 +1,111 @@
+import contextlib
+import time
+from collections import namedtuple
+
+import torch
+from torch.profiler import DeviceType, ProfilerActivity
+
+"""Timing backends of performance microbenchmarks.
+
+A timer runs one batch of iterations of a test case and measures its latency on
+the host clock until the device finished the batch. It also measures the time
+the host spent in launching the batch, and timers of MUSA devices measure the
+time the device was busy, either per batch or over the window of all batches.
+"""
+
+"""
+Times of a batch in seconds, device is None if the timer doesn't measure it.
+An example is:
+BatchTime(latency=0.0102, host=0.0031, device=0.0098)
+"""
+BatchTime = namedtuple("BatchTime", "latency host device")
+
+
+class HostTimer:
+    """Times a batch with the host clock only, a MUSA device is synchronized at the
+    end of the batch. This timer works on every device.
+    """
+
+    name = "host"
+
+    def __init__(self, device_type):
+        self.synchronize = device_type == "musa"
+        # device seconds of all the batches of the last window
+        self.window_device = None
+
+    @contextlib.contextmanager
+    def window(self):
+        """Context of all the batches sampled for a test case, timers which can't
+        measure the device time of a single batch measure it over the window.
+        """
+        yield
+
+    def time(self, run):
+        start = time.perf_counter()
+        run()
+        launched = time.perf_counter()
+        if self.synchronize:
+            torch.musa.synchronize()
+        end = time.perf_counter()
+        return BatchTime(end - start, launched - start, None)
+
+
+class EventTimer(HostTimer):
+    """Measures the device time of a batch between a pair of MUSA events recorded
+    before and after the batch on the current stream.
+    """
+
+    name = "event"
+
+    def __init__(self, device_type):
+        super().__init__(device_type)
+        self.start_event = torch.musa.Event(enable_timing=True)
+        self.end_event = torch.musa.Event(enable_timing=True)
+
+    def time(self, run):
+        self.start_event.record()
+        start = time.perf_counter()
+        run()
+        launched = time.perf_counter()
+        self.end_event.record()
+        self.end_event.synchronize()
+        end = time.perf_counter()
+        # elapsed_time is in milliseconds
+        device = self.start_event.elapsed_time(self.end_event) / 1e3
+        return BatchTime(end - start, launched - start, device)
+
+
+class ProfilerTimer(HostTimer):
+    """Measures the device time of a window as the sum of the durations of the
+    MUSA kernels traced by a single profiler session over all of its batches, gaps
+    between kernels are not counted. A batch is timed like the host timer, so the
+    iterations are calibrated without the profiler. Tracing slows down the host,
+    so latency and host time of the batches in a window are overestimated.
+    """
+
+    name = "profiler"
+
+    @contextlib.contextmanager
+    def window(self):
+        self.window_device = None
+        with torch.profiler.profile(activities=[ProfilerActivity.MUSA]) as prof:
+            yield
+        kernel_us = sum(
+            event.duration_us()
+            for event in prof.profiler.kineto_results.events()
+            if event.device_type() != DeviceType.CPU
+            and "mem" not in event.name().lower()
+        )
+        self.window_device = kernel_us / 1e6
+
+
+TIMERS = {timer.name: timer for timer in (HostTimer, EventTimer, ProfilerTimer)}
+
+
+def create_timer(name, device_type):
+    """Creates the timer of a test case running on device_type. Only the host
+    timer works without a MUSA device, so it is used for the other devices.
+    """
+    if device_type != "musa":
+        return HostTimer(device_type)
+    return TIMERS[name](device_type)
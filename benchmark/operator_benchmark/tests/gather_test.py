@@ -41,6 +41,9 @@ class GatherBenchmark(op_bench.TorchBenchmarkBase):
     def forward(self, input_one, dim: int, index):
         return torch.gather(input_one, dim, index)
 
+    def forward_out(self, input_one, dim: int, index, out):
+        return torch.gather(input_one, dim, index, out=out)
+
 
 op_bench.generate_pt_test(gather_configs_short + gather_configs_long, GatherBenchmark)
 
@@ -0,0 +1,266 @@
+import argparse
+import json
+import math
+import sys
+
+import numpy as np
+
+"""Tool to find regressions between two results of operator benchmark.
+
+Test cases of the baseline and candidate JSON results are matched by op, mode,
+test_name and test_config. The latency samples of a test case are compared with a
+two-sided Mann-Whitney U test, or with a bootstrap confidence interval of the
+ratio of medians, and a case regresses if the candidate is significantly slower
+and its median is more than the threshold above the baseline. Results written
+before samples were recorded, and cases whose samples are averages over batches
+of different sizes, are compared by their median latency alone.
+
+Usage:
+    python utils/op_bench_compare.py baseline.json candidate.json --threshold 0.05
+    python -m benchmark_runner compare baseline.json candidate.json
+"""
+
+STATUS_REGRESSION = "REGRESSION"
+STATUS_IMPROVEMENT = "improvement"
+STATUS_UNCHANGED = "unchanged"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compare two results of operator benchmark in JSON format.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("baseline", help="file path of the baseline result.")
+    parser.add_argument("candidate", help="file path of the candidate result.")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.05,
+        help="minimum relative slowdown of the median reported as regression",
+    )
+    parser.add_argument(
+        "--alpha", type=float, default=0.05, help="significance level of the tests"
+    )
+    parser.add_argument(
+        "--method",
+        choices=["mannwhitney", "bootstrap"],
+        default="mannwhitney",
+        help="statistical test used on the samples of a test case",
+    )
+    parser.add_argument(
+        "--bootstrap-samples",
+        type=int,
+        default=2000,
+        help="number of resamples of the bootstrap",
+    )
+    parser.add_argument(
+        "--output", default=None, help="file path to save the report as JSON"
+    )
+    return parser.parse_args(argv)
+
+
+def load_cases(json_file_path):
+    """Returns the test cases of a result keyed by op, mode, test_name and config"""
+    with open(json_file_path, "r") as f:
+        res = json.load(f)
+    cases = {}
+    for op_res in res["benchmark_result"]:
+        if not op_res:
+            continue
+        for test_case in op_res["test_cases"]:
+            key = (
+                op_res["op"],
+                op_res["mode"],
+                test_case["test_name"],
+                json.dumps(test_case["test_config"], sort_keys=True),
+            )
+            cases[key] = test_case
+    return res.get("musa_stack", {}), cases
+
+
+def _rank(data):
+    """Ranks starting at 1, ties get the average of their ranks"""
+    _, inverse, counts = np.unique(data, return_inverse=True, return_counts=True)
+    average_ranks = np.cumsum(counts) - (counts - 1) / 2
+    return average_ranks[inverse], counts
+
+
+def mann_whitney_u(x, y):
+    """Two-sided Mann-Whitney U test of x and y.
+
+    Returns the U statistic of x and the p-value from the normal approximation with
+    tie and continuity corrections.
+    """
+    n1, n2 = len(x), len(y)
+    ranks, tie_counts = _rank(np.concatenate([x, y]))
+    u1 = ranks[:n1].sum() - n1 * (n1 + 1) / 2
+    n = n1 + n2
+    tie_term = (tie_counts**3 - tie_counts).sum() / (n * (n - 1))
+    sigma = math.sqrt(n1 * n2 / 12 * ((n + 1) - tie_term))
+    if sigma == 0:
+        return u1, 1.0
+    z = max(abs(u1 - n1 * n2 / 2) - 0.5, 0) / sigma
+    return u1, math.erfc(z / math.sqrt(2))
+
+
+def bootstrap_ratio_ci(x, y, alpha, num_resamples, seed=0):
+    """Percentile bootstrap interval of median(y) / median(x)"""
+    rng = np.random.default_rng(seed)
+    x_medians = np.median(rng.choice(x, (num_resamples, len(x))), axis=1)
+    y_medians = np.median(rng.choice(y, (num_resamples, len(y))), axis=1)
+    ratios = y_medians / x_medians
+    low, high = np.percentile(ratios, [100 * alpha / 2, 100 * (1 - alpha / 2)])
+    return float(low), float(high)
+
+
+def _batch_iters(case):
+    return (case.get("sample_stats") or {}).get("batch_iters")
+
+
+def samples_comparable(base, cand):
+    """Whether the samples of two results of a test case can be tested against each
+    other, which needs at least two samples on each side. A sample is the average
+    of a batch of iterations, and averages of batches of different sizes spread
+    differently, so both results must have used the same batch size."""
+    base_samples = base.get("samples")
+    cand_samples = cand.get("samples")
+    if not base_samples or not cand_samples:
+        return False
+    if min(len(base_samples), len(cand_samples)) < 2:
+        return False
+    return _batch_iters(base) == _batch_iters(cand)
+
+
+def compare_case(base, cand, args):
+    """Compares the latencies of the same test case in two results"""
+    base_samples = base.get("samples")
+    cand_samples = cand.get("samples")
+    base_median = base["latency"]
+    cand_median = cand["latency"]
+    row = {"p_value": None}
+    significant_slower = significant_faster = True
+    if samples_comparable(base, cand):
+        x = np.asarray(base_samples, dtype=np.float64)
+        y = np.asarray(cand_samples, dtype=np.float64)
+        base_median = float(np.median(x))
+        cand_median = float(np.median(y))
+        if args.method == "mannwhitney":
+            u1, p_value = mann_whitney_u(x, y)
+            row["method"] = "mannwhitney"
+            row["p_value"] = p_value
+            # U of x above its mean means the baseline is mostly the slower one
+            significant_slower = p_value < args.alpha and u1 < len(x) * len(y) / 2
+            significant_faster = p_value < args.alpha and u1 > len(x) * len(y) / 2
+        else:
+            low, high = bootstrap_ratio_ci(x, y, args.alpha, args.bootstrap_samples)
+            row["method"] = "bootstrap"
+            row["ci"] = [low, high]
+            significant_slower = low > 1
+            significant_faster = high < 1
+    else:
+        row["method"] = "median"
+
+    ratio = cand_median / base_median if base_median > 0 else math.inf
+    row["baseline"] = base_median
+    row["candidate"] = cand_median
+    row["ratio"] = ratio
+    if significant_slower and ratio > 1 + args.threshold:
+        row["status"] = STATUS_REGRESSION
+    elif significant_faster and ratio < 1 / (1 + args.threshold):
+        row["status"] = STATUS_IMPROVEMENT
+    else:
+        row["status"] = STATUS_UNCHANGED
+    return row
+
+
+def _flatten(prefix, value, out):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            _flatten(f"{prefix}.{key}" if prefix else key, item, out)
+    else:
+        out[prefix] = value
+    return out
+
+
+def stack_changes(base_stack, cand_stack):
+    """Returns the entries of the MUSA software stacks which differ"""
+    base = _flatten("", base_stack, {})
+    cand = _flatten("", cand_stack, {})
+    return {
+        key: [base.get(key), cand.get(key)]
+        for key in sorted(set(base) | set(cand))
+        if base.get(key) != cand.get(key)
+    }
+
+
+def compare(args):
+    base_stack, base_cases = load_cases(args.baseline)
+    cand_stack, cand_cases = load_cases(args.candidate)
+    rows = []
+    for key in base_cases.keys() & cand_cases.keys():
+        row = compare_case(base_cases[key], cand_cases[key], args)
+        row["op"], row["mode"], row["test_name"] = key[:3]
+        row["test_config"] = json.loads(key[3])
+        rows.append(row)
+    rows.sort(key=lambda row: row["ratio"], reverse=True)
+    only_in_baseline = base_cases.keys() - cand_cases.keys()
+    only_in_candidate = cand_cases.keys() - base_cases.keys()
+    return {
+        "stack_changes": stack_changes(base_stack, cand_stack),
+        "only_in_baseline": sorted(key[2] for key in only_in_baseline),
+        "only_in_candidate": sorted(key[2] for key in only_in_candidate),
+        "cases": rows,
+    }
+
+
+def print_report(report):
+    for key, (base, cand) in report["stack_changes"].items():
+        print("# {}: {} -> {}".format(key, base, cand))
+    print(
+        "{:>12} {:>8} {:>12} {:>12} {:>10}  {}".format(
+            "status", "ratio", "baseline", "candidate", "p/ci", "test_name"
+        )
+    )
+    for row in report["cases"]:
+        if row["method"] == "mannwhitney":
+            evidence = "{:.2g}".format(row["p_value"])
+        elif row["method"] == "bootstrap":
+            evidence = "{:.2f}-{:.2f}".format(*row["ci"])
+        else:
+            evidence = "-"
+        print(
+            "{:>12} {:>8.3f} {:>12.3f} {:>12.3f} {:>10}  {} ({})".format(
+                row["status"],
+                row["ratio"],
+                row["baseline"],
+                row["candidate"],
+                evidence,
+                row["test_name"],
+                row["mode"],
+            )
+        )
+    for name in report["only_in_baseline"]:
+        print("# only in baseline: {}".format(name))
+    for name in report["only_in_candidate"]:
+        print("# only in candidate: {}".format(name))
+    num_regressions = sum(r["status"] == STATUS_REGRESSION for r in report["cases"])
+    print(
+        "# {} test cases compared, {} regressions".format(
+            len(report["cases"]), num_regressions
+        )
+    )
+    return num_regressions
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = compare(args)
+    num_regressions = print_report(report)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 1 if num_regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""Compare the line by line and the whole-file transform of musify_text.
+
+Usage:
+    python benchmark/porting/bench_musify_text.py --lines 60000 --repeat 3
+
+A CUDA source mixing mapping keys, plain code and MUSIFY_EXCL_* blocks is
+generated and transformed by `transform_file` and by `transform_file_whole`,
+keeping the fastest of --repeat runs of each. The script reports both times and
+exits with 1 if the outputs differ, including for an empty source, or if the
+whole-file transform is not faster than the line by line one.
+"""
+
+import argparse
+import filecmp
+import glob
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from torch_musa.utils import musify_text
+from torch_musa.utils.simple_porting_via_musify import SEFL_PATH
+
+FILLERS = [
+    "int idx = blockIdx.x * blockDim.x + threadIdx.x;",
+    "if (idx >= numel) return;",
+    "out[idx] = a[idx] + b[idx];",
+    "",
+]
+
+
+def generate_source(path: str, keys: list, num_lines: int, seed: int):
+    """Generate a source with mapping keys, exclusion lines and blocks"""
+    rng = random.Random(seed)
+    lines = []
+    for i in range(num_lines):
+        if i % 1000 == 0:
+            lines.append("// MUSIFY_EXCL_START")
+        elif i % 1000 == 10:
+            lines.append("// MUSIFY_EXCL_STOP")
+        elif rng.random() < 0.5:
+            lines.append(rng.choice(FILLERS))
+        else:
+            words = rng.choices(keys, k=rng.randint(1, 3))
+            line = "  " + rng.choice(["(", "::", " "]).join(words) + ");"
+            if rng.random() < 0.01:
+                line += " // MUSIFY_EXCL_LINE"
+            lines.append(line)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def run(transform, src: str, dst: str, args) -> float:
+    """Transform a copy of src into dst, return the elapsed time"""
+    shutil.copyfile(src, dst)
+    start = time.perf_counter()
+    transform(dst, args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", maxsplit=1)[0])
+    parser.add_argument("--lines", type=int, default=60000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    porting_args = argparse.Namespace(
+        mapping=glob.glob(os.path.join(SEFL_PATH, "mapping", "*.json")),
+        extra_mapping={},
+        direction="c2m",
+        output_method="create",
+    )
+    musify_text.init_ac_automaton(porting_args)
+    keys = [key.decode() for key in musify_text.automaton.values]
+    logging.disable(logging.INFO)
+
+    work_dir = tempfile.mkdtemp(prefix="bench_musify_text_")
+    try:
+        src = os.path.join(work_dir, "src.cu")
+        generate_source(src, keys, args.lines, args.seed)
+        empty = os.path.join(work_dir, "empty.cu")
+        open(empty, "w", encoding="utf-8").close()
+
+        num_diff = 0
+        for source in (src, empty):
+            times = {}
+            outputs = {}
+            for transform in (
+                musify_text.transform_file,
+                musify_text.transform_file_whole,
+            ):
+                name = transform.__name__
+                dst = os.path.join(work_dir, f"{name}.cu")
+                times[name] = min(
+                    run(transform, source, dst, porting_args)
+                    for _ in range(args.repeat)
+                )
+                outputs[name] = dst + ".mt"
+            if not all(map(os.path.exists, outputs.values())) or not filecmp.cmp(
+                *outputs.values(), shallow=False
+            ):
+                print(f"outputs differ for {os.path.basename(source)}")
+                num_diff += 1
+            if source == src:
+                src_times = times
+    finally:
+        shutil.rmtree(work_dir)
+
+    print(f"{args.lines} lines, {len(keys)} mapping rules")
+    for name, elapsed in src_times.items():
+        print(f"{name:>22}: {elapsed:.3f}s")
+    speedup = src_times["transform_file"] / src_times["transform_file_whole"]
+    print(f"{'speedup':>22}: {speedup:.2f}x")
+    sys.exit(1 if num_diff or speedup <= 1 else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Compare the replacing engines of SimplePorting on a synthetic CUDA tree.
+
+Usage:
+    python benchmark/porting/bench_simple_porting.py --files 200 --lines 500
+
+Both engines port the same generated tree, the script reports the wall time of
+each engine and every line on which their outputs differ, and exits with 1 if
+there is any difference.
+"""
+
+import argparse
+import filecmp
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from torch_musa.utils.simple_porting import SimplePorting
+
+FILLERS = [
+    "int idx = blockIdx.x * blockDim.x + threadIdx.x;",
+    "if (idx >= numel) return;",
+    "out[idx] = a[idx] + b[idx];",
+    "auto stream = at::cuda::getCurrentCUDAStream();",
+    "#include <cub/cub.cuh>",
+    "// cudaMemcpy in comment line",
+    "* cudaFree in doc comment",
+    "",
+]
+
+
+def generate_tree(root: str, keys: list, num_files: int, num_lines: int, seed: int):
+    """Generate .cu/.cuh/.cpp files mixing mapping keys with plain code"""
+    rng = random.Random(seed)
+    exts = ["cu", "cuh", "cpp", "h"]
+    for i in range(num_files):
+        sub_dir = os.path.join(root, f"ops_{i % 8}")
+        os.makedirs(sub_dir, exist_ok=True)
+        lines = []
+        for _ in range(num_lines):
+            if rng.random() < 0.5:
+                lines.append(rng.choice(FILLERS))
+            else:
+                words = rng.choices(keys, k=rng.randint(1, 4))
+                lines.append("  " + rng.choice(["(", "::", ""]).join(words) + ");")
+        file_name = f"kernel_{i}.{exts[i % len(exts)]}"
+        with open(os.path.join(sub_dir, file_name), "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+def run_engine(cuda_dir: str, engine: str, output_dir: str) -> float:
+    """Port cuda_dir with engine and move result to output_dir"""
+    start = time.perf_counter()
+    porting = SimplePorting(cuda_dir_path=cuda_dir, engine=engine)
+    porting.run()
+    elapsed = time.perf_counter() - start
+    shutil.move(porting.musa_dir_path, output_dir)
+    return elapsed
+
+
+def diff_trees(lhs: str, rhs: str, max_report: int) -> int:
+    """Print differing lines of two trees, return number of differing files"""
+    num_diff = 0
+    for root, _, files in os.walk(lhs):
+        for file in files:
+            lhs_file = os.path.join(root, file)
+            rhs_file = os.path.join(rhs, os.path.relpath(lhs_file, lhs))
+            if filecmp.cmp(lhs_file, rhs_file, shallow=False):
+                continue
+            num_diff += 1
+            with open(lhs_file, encoding="utf-8") as f_l, open(
+                rhs_file, encoding="utf-8"
+            ) as f_r:
+                for line_no, (line_l, line_r) in enumerate(zip(f_l, f_r), 1):
+                    if line_l != line_r and max_report > 0:
+                        max_report -= 1
+                        print(f"{os.path.relpath(lhs_file, lhs)}:{line_no}")
+                        print(f"  replace:     {line_l.rstrip()}")
+                        print(f"  single_pass: {line_r.rstrip()}")
+    return num_diff
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", maxsplit=1)[0])
+    parser.add_argument("--files", type=int, default=100)
+    parser.add_argument("--lines", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-report", type=int, default=20)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="bench_simple_porting_")
+    try:
+        porting = SimplePorting(cuda_dir_path=os.path.join(work_dir, "probe"))
+        porting.load_replaced_mapping()
+        keys = [k for k, _ in porting.mapping_rule]
+
+        cuda_dir = os.path.join(work_dir, "cuda")
+        generate_tree(cuda_dir, keys, args.files, args.lines, args.seed)
+        print(f"{args.files} files x {args.lines} lines, {len(keys)} mapping rules")
+
+        outputs = {}
+        for engine in ("replace", "single_pass"):
+            outputs[engine] = os.path.join(work_dir, f"out_{engine}")
+            elapsed = run_engine(cuda_dir, engine, outputs[engine])
+            print(f"{engine:>12}: {elapsed:.3f}s")
+
+        num_diff = diff_trees(
+            outputs["replace"], outputs["single_pass"], args.max_report
+        )
+        print(f"{num_diff} of {args.files} files differ")
+    finally:
+        shutil.rmtree(work_dir)
+    sys.exit(1 if num_diff else 0)
+
+
+if __name__ == "__main__":
+    main()
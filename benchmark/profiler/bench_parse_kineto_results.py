@@ -0,0 +1,430 @@
+"""Compare profile._parse_kineto_results with the former three-pass parser.
+
+Usage:
+    python benchmark/profiler/bench_parse_kineto_results.py --events 5000000
+
+The synthetic profiler result mimics the one of Kineto: op events nesting child ops,
+each child launching a kernel through a runtime call linked by correlation id, and
+memory records, most of them within ops and some at the top level. Like the
+bindings of the real result, its `events()` creates new event objects on every
+call. The script reports the parse time and the peak Python memory traced by
+tracemalloc of both parsers, and exits with 1 if the parsed events differ.
+"""
+
+import argparse
+import gc
+import hashlib
+import random
+import sys
+import time
+import tracemalloc
+from array import array
+from typing import Dict, List
+
+from torch.autograd import DeviceType
+
+from torch_musa.autograd.profiler import profile
+from torch_musa.autograd.profiler_util import (
+    _filter_name,
+    _filter_stack_entry,
+    _rewrite_name,
+    FunctionEvent,
+    MEMORY_EVENT_NAME,
+    MemRecordsAcc,
+    OUT_OF_MEMORY_EVENT_NAME,
+)
+
+OP_NAMES = ["aten::linear", "aten::conv2d", "aten::layer_norm", "aten::softmax"]
+CHILD_NAMES = ["aten::addmm", "aten::mul", "aten::add", "aten::copy_", "aten::empty"]
+KERNEL_NAMES = [
+    "void at::native::vectorized_elementwise_kernel<4, at::native::MulFunctor<float>>",
+    "void at::native::reduce_kernel<512, 1, at::native::ReduceOp<float>>",
+    "mudnn::gemm_kernel<float, 128, 128, 32>",
+]
+RUNTIME_NAME = "musaLaunchKernel"
+MAIN_THREAD = 1
+RUNTIME_THREAD = 2
+
+# fields of a synthetic event, one array each
+FIELDS = (
+    "name",  # index into the names of the result
+    "start_us",
+    "duration_us",
+    "thread",
+    "correlation_id",
+    "linked_correlation_id",
+    "device_type",  # 0 for CPU, 1 for MUSA
+    "nbytes",
+    "is_async",
+)
+
+
+class SyntheticKinetoEvent:
+    """The methods of a KinetoEvent read by the parser, backed by the result"""
+
+    __slots__ = ("_result", "_index")
+
+    def __init__(self, result, index):
+        self._result = result
+        self._index = index
+
+    def _field(self, name):
+        return self._result.columns[name][self._index]
+
+    def name(self):
+        return self._result.names[self._field("name")]
+
+    def start_us(self):
+        return self._field("start_us")
+
+    def duration_us(self):
+        return self._field("duration_us")
+
+    def start_thread_id(self):
+        return self._field("thread")
+
+    def end_thread_id(self):
+        return self._field("thread")
+
+    def fwd_thread_id(self):
+        return 0
+
+    def is_async(self):
+        return bool(self._field("is_async"))
+
+    def correlation_id(self):
+        return self._field("correlation_id")
+
+    def linked_correlation_id(self):
+        return self._field("linked_correlation_id")
+
+    def device_type(self):
+        return DeviceType.CPU if self._field("device_type") == 0 else DeviceType.MUSA
+
+    def device_index(self):
+        return 0
+
+    def shapes(self):
+        return [[16, 32]] if self._field("device_type") == 0 else []
+
+    def stack(self):
+        return []
+
+    def scope(self):
+        return 0
+
+    def sequence_nr(self):
+        return -1
+
+    def flops(self):
+        return 0
+
+    def cuda_elapsed_us(self):
+        return -1
+
+    def nbytes(self):
+        return self._field("nbytes")
+
+
+class SyntheticResult:
+    def __init__(self, names: List[str], columns: Dict[str, array]):
+        self.names = names
+        self.columns = columns
+
+    def trace_start_us(self):
+        return 1000
+
+    def events(self):
+        return [SyntheticKinetoEvent(self, i) for i in range(len(self.columns["name"]))]
+
+
+def generate_result(num_events: int, seed: int) -> SyntheticResult:
+    rng = random.Random(seed)
+    names = (
+        OP_NAMES
+        + CHILD_NAMES
+        + KERNEL_NAMES
+        + [RUNTIME_NAME, MEMORY_EVENT_NAME, OUT_OF_MEMORY_EVENT_NAME, "aten::is_leaf"]
+    )
+    name_ids = {name: i for i, name in enumerate(names)}
+    columns = {field: array("q") for field in FIELDS}
+
+    def add(name, start_us, duration_us, **fields):
+        columns["name"].append(name_ids[name])
+        columns["start_us"].append(start_us)
+        columns["duration_us"].append(duration_us)
+        for field in FIELDS[3:]:
+            columns[field].append(fields.get(field, 0))
+
+    now = 1000
+    correlation_id = 0
+    while len(columns["name"]) < num_events:
+        op_start = now
+        correlation_id += 1
+        add(
+            rng.choice(OP_NAMES),
+            op_start,
+            40,
+            thread=MAIN_THREAD,
+            correlation_id=correlation_id,
+        )
+        for i in range(rng.randint(1, 3)):
+            child_start = op_start + 2 + 12 * i
+            correlation_id += 1
+            add(
+                rng.choice(CHILD_NAMES),
+                child_start,
+                10,
+                thread=MAIN_THREAD,
+                correlation_id=correlation_id,
+            )
+            add(
+                RUNTIME_NAME,
+                child_start + 2,
+                3,
+                thread=RUNTIME_THREAD,
+                linked_correlation_id=correlation_id,
+            )
+            add(
+                rng.choice(KERNEL_NAMES),
+                child_start + 50,
+                rng.randint(1, 20),
+                device_type=1,
+                linked_correlation_id=correlation_id,
+            )
+            if rng.random() < 0.5:
+                add(
+                    MEMORY_EVENT_NAME,
+                    child_start + 1,
+                    0,
+                    thread=MAIN_THREAD,
+                    nbytes=rng.choice([-4096, 4096, 65536]),
+                )
+        if rng.random() < 0.1:
+            add("aten::is_leaf", op_start + 1, 1, thread=MAIN_THREAD)
+        if rng.random() < 0.05:
+            add(rng.choice(CHILD_NAMES), op_start, 30, thread=MAIN_THREAD, is_async=1)
+        # memory records outside of any op
+        if rng.random() < 0.2:
+            add(MEMORY_EVENT_NAME, op_start + 41, 0, thread=MAIN_THREAD, nbytes=512)
+        if rng.random() < 0.001:
+            add(OUT_OF_MEMORY_EVENT_NAME, op_start + 42, 0, thread=MAIN_THREAD)
+        now += 44
+    return SyntheticResult(names, columns)
+
+
+# pylint: disable=invalid-name
+def parse_kineto_results_reference(result):
+    """The former implementation, calling result.events() three times"""
+    trace_start_us = result.trace_start_us()
+    mem_records = [
+        [evt, False] for evt in result.events() if evt.name() == MEMORY_EVENT_NAME
+    ]
+    oom_records = [
+        evt for evt in result.events() if evt.name() == OUT_OF_MEMORY_EVENT_NAME
+    ]
+    mem_records_acc = MemRecordsAcc(mem_records)
+
+    def _cpu_memory_usage(mem_record):
+        return (
+            mem_record.nbytes()
+            if mem_record.device_type()
+            in [DeviceType.CPU, DeviceType.MKLDNN, DeviceType.IDEEP]
+            else 0
+        )
+
+    def _musa_memory_usage(mem_record):
+        return mem_record.nbytes()
+
+    function_events = []
+    musa_corr_map: Dict[int, List[FunctionEvent]] = {}
+    max_evt_id = 0
+    for kineto_event in result.events():
+        if _filter_name(kineto_event.name()):
+            continue
+        rel_start_us = kineto_event.start_us() - trace_start_us
+        rel_end_us = rel_start_us + kineto_event.duration_us()
+        abs_end_us = kineto_event.start_us() + kineto_event.duration_us()
+
+        cpu_memory_usage = 0
+        musa_memory_usage = 0
+        if kineto_event.device_type() == DeviceType.CPU:
+            for mem_record in mem_records_acc.in_interval(
+                kineto_event.start_us(), abs_end_us
+            ):
+                cpu_memory_usage += _cpu_memory_usage(mem_record[0])
+                musa_memory_usage += _musa_memory_usage(mem_record[0])
+                mem_record[1] = True
+
+        is_async = kineto_event.is_async() or (
+            kineto_event.start_thread_id() != kineto_event.end_thread_id()
+        )
+
+        function_event = FunctionEvent(
+            id=kineto_event.correlation_id(),
+            name=_rewrite_name(name=kineto_event.name(), with_wildcard=True),
+            trace_name=_rewrite_name(name=kineto_event.name(), with_wildcard=False),
+            thread=kineto_event.start_thread_id(),
+            start_us=rel_start_us,
+            end_us=rel_end_us,
+            fwd_thread=kineto_event.fwd_thread_id(),
+            input_shapes=kineto_event.shapes(),
+            stack=[
+                entry for entry in kineto_event.stack() if _filter_stack_entry(entry)
+            ],
+            scope=kineto_event.scope(),
+            cpu_memory_usage=cpu_memory_usage,
+            musa_memory_usage=musa_memory_usage,
+            is_async=is_async,
+            sequence_nr=kineto_event.sequence_nr(),
+            device_type=kineto_event.device_type(),
+            device_index=kineto_event.device_index(),
+            flops=kineto_event.flops(),
+        )
+        max_evt_id = function_event.id if function_event.id > max_evt_id else max_evt_id
+        if function_event.device_type == DeviceType.CPU and not function_event.is_async:
+            musa_time = kineto_event.cuda_elapsed_us()
+            if musa_time > 0:
+                function_event.append_kernel(
+                    function_event.name, function_event.device_index, musa_time
+                )
+                function_event.is_legacy = True
+        function_events.append(function_event)
+        corr_id = kineto_event.linked_correlation_id()
+        if corr_id > 0:
+            if corr_id not in musa_corr_map:
+                musa_corr_map[corr_id] = []
+            musa_corr_map[corr_id].append(function_event)
+
+    for function_event in function_events:
+        if (
+            function_event.device_type == DeviceType.CPU
+            and not function_event.is_async
+            and function_event.id in musa_corr_map
+        ):
+            for f_evt in musa_corr_map[function_event.id]:
+                if f_evt.device_type != DeviceType.CPU:
+                    function_event.append_kernel(
+                        f_evt.name,
+                        f_evt.device_index,
+                        f_evt.time_range.end - f_evt.time_range.start,
+                    )
+                elif f_evt.device_type == DeviceType.CPU:
+                    f_evt.thread = function_event.thread
+
+    def createFunctionEventForMemoryEvents(evt):
+        rel_start_us = evt.start_us() - trace_start_us
+        return FunctionEvent(
+            id=max_evt_id,
+            name=evt.name(),
+            trace_name=None,
+            thread=evt.start_thread_id(),
+            start_us=rel_start_us,
+            end_us=rel_start_us,
+            fwd_thread=evt.start_thread_id(),
+            input_shapes=[],
+            stack=[],
+            scope=0,
+            cpu_memory_usage=_cpu_memory_usage(evt),
+            musa_memory_usage=_musa_memory_usage(evt),
+            is_async=False,
+            sequence_nr=-1,
+            device_type=DeviceType.CPU,
+            device_index=0,
+        )
+
+    for mem_record in mem_records:
+        if not mem_record[1]:
+            max_evt_id += 1
+            function_events.append(createFunctionEventForMemoryEvents(mem_record[0]))
+
+    for oom_record in oom_records:
+        max_evt_id += 1
+        function_events.append(createFunctionEventForMemoryEvents(oom_record))
+
+    function_events.sort(key=lambda evt: [evt.time_range.start, -evt.time_range.end])
+    return function_events
+
+
+def parse_kineto_results(result):
+    return profile(enabled=False)._parse_kineto_results(result)
+
+
+def signature(events: List[FunctionEvent]) -> str:
+    """Digest of the parsed events, so that no copy of them is kept alive"""
+    digest = hashlib.sha256()
+    for evt in events:
+        fields = (
+            evt.id,
+            evt.name,
+            evt.trace_name,
+            evt.thread,
+            evt.time_range.start,
+            evt.time_range.end,
+            evt.device_type,
+            evt.is_async,
+            evt.is_legacy,
+            evt.cpu_memory_usage,
+            evt.musa_memory_usage,
+            evt.input_shapes,
+            evt.kernels,
+        )
+        digest.update(repr(fields).encode())
+    return digest.hexdigest()
+
+
+def measure_time(parse_fn, result):
+    gc.collect()
+    start = time.perf_counter()
+    events = parse_fn(result)
+    return time.perf_counter() - start, events
+
+
+def measure_peak_memory(parse_fn, result) -> int:
+    gc.collect()
+    tracemalloc.start()
+    try:
+        events = parse_fn(result)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del events
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", maxsplit=1)[0])
+    parser.add_argument("--events", type=int, default=5000000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--skip-memory", action="store_true", help="do not trace peak memory"
+    )
+    args = parser.parse_args()
+
+    result = generate_result(args.events, args.seed)
+    print(f"events: {len(result.columns['name'])}")
+
+    reference_time, reference = measure_time(parse_kineto_results_reference, result)
+    reference_signature = signature(reference)
+    del reference
+    single_pass_time, single_pass = measure_time(parse_kineto_results, result)
+    num_diff = int(signature(single_pass) != reference_signature)
+    del single_pass, reference_signature
+    if num_diff:
+        print("parsed events differ")
+
+    print(f"{'parser':>12} {'time':>10} {'peak memory':>14}")
+    rows = [
+        ("reference", reference_time, parse_kineto_results_reference),
+        ("single_pass", single_pass_time, parse_kineto_results),
+    ]
+    for name, elapsed, parse_fn in rows:
+        peak = ""
+        if not args.skip_memory:
+            peak = f"{measure_peak_memory(parse_fn, result) / 2**20:.1f}MB"
+        print(f"{name:>12} {elapsed:>9.3f}s {peak:>14}")
+    sys.exit(1 if num_diff else 0)
+
+
+if __name__ == "__main__":
+    main()
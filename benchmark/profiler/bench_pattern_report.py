@@ -0,0 +1,141 @@
+"""Compare TorchTidy report generation with the former per-pattern tree walks.
+
+Usage:
+    python benchmark/profiler/bench_pattern_report.py --steps 200 --layers 8
+
+A small conv/linear model is trained on CPU under the profiler with stacks and
+shapes recorded, which triggers several of the anti-patterns. The reference
+matches every pattern separately, each one with its own event tree, traversal
+and linear sibling scans, as report_all_anti_patterns used to do. The single
+pass builds one shared EventTreeIndex and dispatches every event once with
+match_patterns(). The script reports both wall times and the time of a whole
+report_all_anti_patterns() call, and exits with 1 if the matched events differ.
+"""
+
+import argparse
+import sys
+import time
+
+import torch
+from torch import nn
+from torch.profiler import profile
+from torch.profiler._utils import traverse_dfs
+
+from torch_musa.profiler._pattern_matcher import (
+    Conv2dBiasFollowedByBatchNorm2dPattern,
+    EventTreeIndex,
+    ExtraMUSACopyPattern,
+    FP32MatMulPattern,
+    GradNotSetToNonePattern,
+    MatMulDimInFP16Pattern,
+    OptimizerSingleTensorPattern,
+    SynchronizedDataLoaderPattern,
+    event_tree_index,
+    match_patterns,
+    report_all_anti_patterns,
+)
+
+PATTERNS = [
+    ExtraMUSACopyPattern,
+    FP32MatMulPattern,
+    OptimizerSingleTensorPattern,
+    SynchronizedDataLoaderPattern,
+    GradNotSetToNonePattern,
+    Conv2dBiasFollowedByBatchNorm2dPattern,
+    MatMulDimInFP16Pattern,
+]
+
+
+class LinearScanIndex(EventTreeIndex):
+    """The former lookups: a fresh DFS per walk and linear sibling scans"""
+
+    # pylint: disable=super-init-not-called
+    def __init__(self, event_tree):
+        self.event_tree = event_tree
+        self.tid_root = {}
+        for event in event_tree:
+            self.tid_root.setdefault(event.start_tid, []).append(event)
+        self._positions = {}
+
+    @property
+    def events(self):
+        return traverse_dfs(self.event_tree)
+
+
+def make_model(layers: int) -> nn.Module:
+    blocks = []
+    for _ in range(layers):
+        blocks += [nn.Conv2d(8, 8, 3, 1, 1), nn.BatchNorm2d(8), nn.ReLU()]
+    return nn.Sequential(*blocks, nn.Flatten(), nn.Linear(8 * 8 * 8, 10))
+
+
+def run_workload(steps: int, layers: int) -> profile:
+    model = make_model(layers)
+    optimizer = torch.optim.Adam(model.parameters(), foreach=False)
+    dataset = torch.rand((steps * 4, 8, 8, 8))
+    loader = torch.utils.data.DataLoader(dataset, batch_size=4)
+    with profile(with_stack=True, record_shapes=True) as prof:
+        for x in loader:
+            loss = model(x).sum()
+            loss.backward()
+            optimizer.step()
+            optimizer.zero_grad(set_to_none=False)
+    return prof
+
+
+def reference(prof: profile):
+    matched = []
+    for pattern_cls in PATTERNS:
+        pattern = pattern_cls(prof)
+        pattern.event_tree_index = LinearScanIndex(
+            prof.profiler.kineto_results.experimental_event_tree()
+        )
+        matched.append(pattern.matched_events())
+    return matched
+
+
+def single_pass(prof: profile):
+    prof.profiler._event_tree_index = None
+    return match_patterns([pattern_cls(prof) for pattern_cls in PATTERNS])
+
+
+def signature(matched):
+    return [[event.id for event in events] for events in matched]
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", maxsplit=1)[0])
+    parser.add_argument("--steps", type=int, default=200)
+    parser.add_argument("--layers", type=int, default=8)
+    args = parser.parse_args()
+
+    prof = run_workload(args.steps, args.layers)
+    # Build the shared tree once so that both sides find the result wrappers warm.
+    num_events = len(event_tree_index(prof).events)
+
+    reference_matched, reference_time = timed(reference, prof)
+    single_pass_matched, single_pass_time = timed(single_pass, prof)
+    prof.profiler._event_tree_index = None
+    _, report_time = timed(report_all_anti_patterns, prof, False, False)
+
+    print(f"{'events':>10} {'reference':>12} {'single_pass':>12} {'report':>12}")
+    print(
+        f"{num_events:>10} {reference_time:>11.3f}s {single_pass_time:>11.3f}s "
+        f"{report_time:>11.3f}s"
+    )
+    for pattern_cls, events in zip(PATTERNS, single_pass_matched):
+        print(f"  {pattern_cls.__name__}: {len(events)} events matched")
+    if signature(reference_matched) != signature(single_pass_matched):
+        print("matched events differ")
+        sys.exit(1)
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Compare EventList._remove_dup_nodes with the former fixed-point loop.
+
+Usage:
+    python benchmark/profiler/bench_remove_dup_nodes.py --events 1000000 --depth 16
+
+The synthetic event list nests every op in a chain of same-named wrappers sharing
+its time range, like autograd `*Backward` wrappers, listed innermost first as
+Kineto reports them. Both implementations run on lists of doubling size, the script
+reports their wall times and the time per event of the single pass, which stays
+flat when it scales linearly, and exits with 1 if the resulting trees differ.
+"""
+
+import argparse
+import random
+import sys
+import time
+
+from torch_musa.autograd.profiler_util import EventList, FunctionEvent
+
+NAMES = [
+    "MulBackward0",
+    "AddBackward0",
+    "autograd::engine::evaluate_function: MulBackward0",
+    "aten::linear",
+    "aten::conv2d",
+]
+LEAF_NAMES = ["aten::empty", "aten::mul", "aten::add_", "aten::copy_"]
+
+
+def remove_dup_nodes_reference(events: EventList):
+    """The former implementation, scanning the list until nothing is merged"""
+    while True:
+        to_delete = set()
+        # pylint: disable=consider-using-enumerate
+        for idx in range(len(events)):
+            if (
+                events[idx].cpu_parent is not None
+                and events[idx].cpu_parent.name == events[idx].name
+                and len(events[idx].cpu_parent.cpu_children) == 1
+            ):
+                events[idx].cpu_parent.cpu_children = events[idx].cpu_children
+                events[idx].cpu_parent.kernels = events[idx].kernels
+                for child in events[idx].cpu_children:
+                    child.cpu_parent = events[idx].cpu_parent
+                to_delete.add(idx)
+        if len(to_delete) == 0:
+            break
+        new_evts = [ev for ind, ev in enumerate(events) if ind not in to_delete]
+        events.clear()
+        events.extend(new_evts)
+
+
+def link(parent: FunctionEvent, child: FunctionEvent):
+    parent.append_cpu_child(child)
+    child.set_cpu_parent(parent)
+
+
+def generate_events(num_events: int, max_depth: int, seed: int) -> EventList:
+    """Generate chains of same-named wrappers around ops with a few leaf children"""
+    rng = random.Random(seed)
+    events = []
+    now = 0
+    while len(events) < num_events:
+        name = rng.choice(NAMES)
+        depth = rng.randint(1, max_depth)
+        chain = []
+        for _ in range(depth):
+            evt = FunctionEvent(
+                id=len(events) + len(chain),
+                name=name,
+                thread=0,
+                start_us=now,
+                end_us=now + 10,
+            )
+            if chain:
+                link(chain[-1], evt)
+            chain.append(evt)
+        # a node of two same-named children is kept
+        num_leaves = rng.choice([0, 1, 2])
+        leaves = []
+        for i in range(num_leaves):
+            leaf = FunctionEvent(
+                id=len(events) + depth + i,
+                name=rng.choice(LEAF_NAMES),
+                thread=0,
+                start_us=now + 1 + 4 * i,
+                end_us=now + 4 + 4 * i,
+            )
+            link(chain[-1], leaf)
+            leaves.append(leaf)
+        for evt in rng.sample(chain + leaves, k=min(2, depth + num_leaves)):
+            evt.append_kernel(f"kernel_{evt.id}", 0, rng.randint(1, 9))
+        # the innermost event ends first and is reported first
+        events.extend(leaves)
+        events.extend(reversed(chain))
+        now += 11
+    return EventList(events)
+
+
+def signature(events: EventList):
+    return [
+        (
+            evt.id,
+            None if evt.cpu_parent is None else evt.cpu_parent.id,
+            [child.id for child in evt.cpu_children],
+            evt.kernels,
+        )
+        for evt in events
+    ]
+
+
+def run(events: EventList, remove_fn) -> float:
+    start = time.perf_counter()
+    remove_fn(events)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", maxsplit=1)[0])
+    parser.add_argument("--events", type=int, default=1000000)
+    parser.add_argument("--depth", type=int, default=16)
+    parser.add_argument("--steps", type=int, default=4, help="number of list sizes")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    num_diff = 0
+    sizes = [args.events >> i for i in reversed(range(args.steps))]
+    print(f"{'events':>10} {'reference':>12} {'single_pass':>12} {'us/event':>10}")
+    for size in sizes:
+        reference = generate_events(size, args.depth, args.seed)
+        single_pass = generate_events(size, args.depth, args.seed)
+        reference_time = run(reference, remove_dup_nodes_reference)
+        single_pass_time = run(single_pass, EventList._remove_dup_nodes)
+        if signature(reference) != signature(single_pass):
+            num_diff += 1
+            print(f"{size}: trees differ")
+        print(
+            f"{size:>10} {reference_time:>11.3f}s {single_pass_time:>11.3f}s "
+            f"{single_pass_time / size * 1e6:>10.3f}"
+        )
+    sys.exit(1 if num_diff else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Measure the overhead of StepTimer on a CPU training loop.
+
+Usage:
+    python benchmark/profiler/bench_step_timer.py --steps 2000 --size 256
+
+A small MLP is trained on CPU with its forward, backward and optimizer step
+wrapped in record_function ranges. The loop runs without a timer, with a timer
+recording step times only, and with a timer also timing the three ranges, each
+repeated and the fastest repetition kept. The script reports the time per step and
+the overhead relative to the loop without a timer, and exits with 1 if the
+overhead of the full timer exceeds --max-overhead.
+"""
+
+import argparse
+import sys
+import time
+
+import torch
+from torch import nn
+
+from torch_musa.profiler import record_function, StepTimer
+
+
+def train(model, optimizer, x, steps: int, timer=None) -> float:
+    start = time.perf_counter()
+    for _ in range(steps):
+        with record_function("forward"):
+            loss = model(x).sum()
+        with record_function("backward"):
+            loss.backward()
+        with record_function("optimizer"):
+            optimizer.step()
+            optimizer.zero_grad()
+        if timer is not None:
+            timer.step()
+    return (time.perf_counter() - start) / steps
+
+
+def best_of(repeat: int, fn, *args, make_timer=None) -> float:
+    times = []
+    for _ in range(repeat):
+        if make_timer is None:
+            times.append(fn(*args))
+            continue
+        with make_timer() as timer:
+            times.append(fn(*args, timer))
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", maxsplit=1)[0])
+    parser.add_argument("--steps", type=int, default=2000)
+    parser.add_argument("--size", type=int, default=256)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--max-overhead", type=float, default=0.01)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    model = nn.Sequential(
+        nn.Linear(args.size, args.size), nn.ReLU(), nn.Linear(args.size, 1)
+    )
+    optimizer = torch.optim.SGD(model.parameters(), lr=1e-3)
+    x = torch.randn(32, args.size)
+    train(model, optimizer, x, args.steps // 10)
+
+    run = (model, optimizer, x, args.steps)
+    baseline = best_of(args.repeat, train, *run)
+    steps_only = best_of(args.repeat, train, *run, make_timer=StepTimer)
+    with_ranges = best_of(
+        args.repeat,
+        train,
+        *run,
+        make_timer=lambda: StepTimer(ranges=["forward", "backward", "optimizer"]),
+    )
+
+    print(f"{'timer':>12} {'us/step':>10} {'overhead':>10}")
+    for name, step_time in (
+        ("none", baseline),
+        ("steps", steps_only),
+        ("ranges", with_ranges),
+    ):
+        overhead = step_time / baseline - 1
+        print(f"{name:>12} {step_time * 1e6:>10.2f} {overhead:>10.2%}")
+    sys.exit(1 if with_ranges / baseline - 1 > args.max_overhead else 0)
+
+
+if __name__ == "__main__":
+    main()
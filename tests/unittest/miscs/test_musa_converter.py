@@ -1,8 +1,14 @@
 """Test musa-converter"""
 
+import argparse
 import os
 import subprocess
 import shutil
+import tempfile
+from unittest import mock
+
+from torch_musa.utils import musa_converter
+from torch_musa.utils.musa_converter import AdvancedMUSAConverter
 
 
 class TestMUSAConverter:
@@ -108,3 +114,84 @@ f_string = f"Use MUSA: {is_musa}"
 
 def test_musa_converter():
     TestMUSAConverter().run()
+
+
+def converter_args(root_path, jobs=1):
+    """arguments of AdvancedMUSAConverter as parsed from command line"""
+    return argparse.Namespace(
+        root_path=root_path,
+        launch_path=None,
+        excluded_path=[],
+        jobs=jobs,
+        no_cache=False,
+    )
+
+
+def write_tree(root_path, num_files=8):
+    """write python files, one of them has nothing to be converted"""
+    for i in range(num_files):
+        sub_dir = os.path.join(root_path, f"pkg_{i % 2}")
+        os.makedirs(sub_dir, exist_ok=True)
+        with open(os.path.join(sub_dir, f"mod_{i}.py"), "w", encoding="utf-8") as f:
+            if i:
+                f.write(f'import torch.cuda\nx = torch.randn({i}, device="cuda")\n')
+            else:
+                f.write("x = 1\n")
+
+
+def read_tree(root_path):
+    """contents of files under root_path keyed by relative path"""
+    contents = {}
+    for root, _, files in os.walk(root_path):
+        for file in files:
+            path = os.path.join(root, file)
+            with open(path, encoding="utf-8") as f:
+                contents[os.path.relpath(path, root_path)] = f.read()
+    return contents
+
+
+def test_musa_converter_cache():
+    """unchanged files are skipped, changed files are converted again"""
+    with tempfile.TemporaryDirectory() as temp_dir, mock.patch.dict(
+        os.environ, {"TORCH_MUSA_CACHE_DIR": os.path.join(temp_dir, "cache")}
+    ):
+        root_path = os.path.join(temp_dir, "scripts")
+        write_tree(root_path)
+        args = converter_args(root_path)
+        with mock.patch.object(
+            musa_converter,
+            "convert_file_worker",
+            wraps=musa_converter.convert_file_worker,
+        ) as worker:
+            AdvancedMUSAConverter(args).run()
+            assert worker.call_count == 8
+
+            worker.reset_mock()
+            AdvancedMUSAConverter(args).run()
+            assert worker.call_count == 0
+
+            changed = os.path.join(root_path, "pkg_1", "mod_3.py")
+            with open(changed, "a", encoding="utf-8") as f:
+                f.write("y = x.cuda()\n")
+            worker.reset_mock()
+            AdvancedMUSAConverter(args).run()
+            assert [call.args[0] for call in worker.call_args_list] == [
+                os.path.abspath(changed)
+            ]
+        with open(changed, encoding="utf-8") as f:
+            assert f.read().endswith("y = x.musa()\n")
+
+
+def test_musa_converter_parallel():
+    """converting files in parallel gives the same result as serial conversion"""
+    with tempfile.TemporaryDirectory() as temp_dir, mock.patch.dict(
+        os.environ, {"TORCH_MUSA_CACHE_DIR": os.path.join(temp_dir, "cache")}
+    ):
+        results = []
+        for jobs in (1, 4):
+            root_path = os.path.join(temp_dir, f"scripts_{jobs}")
+            write_tree(root_path, num_files=32)
+            AdvancedMUSAConverter(converter_args(root_path, jobs)).run()
+            results.append(read_tree(root_path))
+        assert results[0] == results[1]
+        assert "cuda" not in "".join(results[0].values())
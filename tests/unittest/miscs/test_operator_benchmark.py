@@ -0,0 +1,291 @@
+"""Test helpers of the operator benchmark"""
+
+import argparse
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+OPERATOR_BENCHMARK_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..",
+    "..",
+    "..",
+    "benchmark",
+    "operator_benchmark",
+)
+
+
+def load_module(name, relative_path):
+    """load a module of the operator benchmark, which is not a package"""
+    spec = importlib.util.spec_from_file_location(
+        name, os.path.join(OPERATOR_BENCHMARK_DIR, relative_path)
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# the modules of the operator benchmark import each other by their flat names
+sys.path.append(OPERATOR_BENCHMARK_DIR)
+op_bench_compare = load_module("op_bench_compare", "utils/op_bench_compare.py")
+benchmark_timer = load_module("benchmark_timer", "benchmark_timer.py")
+benchmark_core = load_module("benchmark_core", "benchmark_core.py")
+
+
+SCHEDULER_TEST = """
+import time
+
+import torch
+
+import operator_benchmark as op_bench
+
+configs = op_bench.cross_product_configs(
+    kind=["ok", "raise", "sleep", "last"], device=["cpu"], tags=["short"]
+)
+
+
+class SchedulerBenchmark(op_bench.TorchBenchmarkBase):
+    def init(self, kind, device):
+        self.inputs = {"input_one": torch.rand(8, device=device)}
+        self.kind = kind
+        self.set_module_name("scheduler")
+
+    def forward(self, input_one):
+        if self.kind == "raise":
+            raise RuntimeError("failing test case")
+        if self.kind == "sleep":
+            time.sleep(600)
+        return input_one + 1
+
+
+op_bench.generate_pt_test(configs, SchedulerBenchmark)
+
+
+if __name__ == "__main__":
+    op_bench.benchmark_runner.main()
+"""
+
+
+NO_OUT_TEST = """
+import torch
+
+import operator_benchmark as op_bench
+
+configs = op_bench.cross_product_configs(M=[8], device=["cpu"], tags=["short"])
+
+
+class NoOutBenchmark(op_bench.TorchBenchmarkBase):
+    def init(self, M, device):
+        self.inputs = {"input_one": torch.rand(M, device=device)}
+        self.set_module_name("no_out")
+
+    def forward(self, input_one):
+        return input_one + 1
+
+
+op_bench.generate_pt_test(configs, NoOutBenchmark)
+
+
+if __name__ == "__main__":
+    op_bench.benchmark_runner.main()
+"""
+
+
+def run_benchmark(script, res_dir, *argv):
+    """run a benchmark script in a new process as it is run from the command line,
+    its worker processes import the script again to register the test cases
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        filter(None, [OPERATOR_BENCHMARK_DIR, env.get("PYTHONPATH")])
+    )
+    completed = subprocess.run(
+        [sys.executable, str(script), "--device", "cpu", "--iterations", "10"]
+        + ["--warmup-iterations", "1", "--max-time-per-test", "0.2"]
+        + ["--res-dir", str(res_dir), "--res-file-name", "res"]
+        + list(argv),
+        env=env,
+        stdout=subprocess.PIPE,
+        check=True,
+        text=True,
+    )
+    with open(os.path.join(res_dir, "res.json"), encoding="utf-8") as res_file:
+        return json.load(res_file), completed.stdout
+
+
+def results_by_test_name(benchmark_res):
+    """results of the test cases by test name"""
+    return {
+        test_case["test_name"]: test_case
+        for perf_res in benchmark_res["benchmark_result"]
+        for test_case in perf_res.get("test_cases", [])
+    }
+
+
+def compare_args(method="mannwhitney"):
+    """command line arguments of op_bench_compare"""
+    return argparse.Namespace(
+        method=method, alpha=0.05, threshold=0.05, bootstrap_samples=500
+    )
+
+
+def test_mann_whitney_u():
+    """U statistic and p-value of known samples"""
+    # every value of x is below every value of y
+    u_stat, p_value = op_bench_compare.mann_whitney_u(
+        np.arange(1.0, 6.0), np.arange(6.0, 11.0)
+    )
+    assert u_stat == 0.0
+    # z = (12.5 - 0.5) / sqrt(25 * 11 / 12)
+    assert abs(p_value - 0.01219) < 1e-4
+
+    u_stat, p_value = op_bench_compare.mann_whitney_u(
+        np.array([1.0, 3.0, 5.0]), np.array([2.0, 4.0, 6.0])
+    )
+    assert u_stat == 3.0
+    assert p_value > 0.5
+
+    # all values tied
+    u_stat, p_value = op_bench_compare.mann_whitney_u(np.ones(4), np.ones(4))
+    assert u_stat == 8.0
+    assert p_value == 1.0
+
+
+def test_median_ci():
+    """confidence interval of the median from order statistics"""
+    samples = np.arange(1.0, 101.0)
+    # half width 1.96 * sqrt(100) / 2 = 9.8 ranks around the median
+    assert benchmark_core._median_ci(samples) == (40.0, 61.0)
+    np.random.default_rng(0).shuffle(samples)
+    assert benchmark_core._median_ci(samples) == (40.0, 61.0)
+    low, high = benchmark_core._median_ci(samples, z=1.0)
+    assert 40.0 < low < np.median(samples) < high < 61.0
+
+    # few samples cover the whole range
+    assert benchmark_core._median_ci([3.0, 1.0, 2.0]) == (1.0, 3.0)
+
+
+def test_count_outliers():
+    """samples outside the Tukey fences are counted"""
+    samples = np.arange(20.0)
+    assert benchmark_core._count_outliers(samples) == 0
+    assert benchmark_core._count_outliers(np.append(samples, [-100.0, 1000.0])) == 2
+    assert benchmark_core._count_outliers(np.append(samples, 40.0)) == 0
+    assert benchmark_core._count_outliers(np.append(samples, 40.0), k=1) == 1
+
+
+def test_warmup_drift():
+    """relative change of the median from the first to the last quarter"""
+    assert benchmark_core._warmup_drift([10.0] * 7) is None
+    assert benchmark_core._warmup_drift([10.0] * 20) == 0.0
+    assert benchmark_core._warmup_drift([11.0] * 5 + [10.0] * 15) == -0.1
+    assert benchmark_core._warmup_drift([10.0] * 15 + [12.0] * 5) == 0.2
+
+
+def test_host_timer():
+    """cpu test cases are timed by the host clock whatever timer is selected"""
+    for name in benchmark_timer.TIMERS:
+        timer = benchmark_timer.create_timer(name, "cpu")
+        assert isinstance(timer, benchmark_timer.HostTimer)
+        assert timer.name == "host"
+
+    calls = []
+    timer = benchmark_timer.create_timer("event", "cpu")
+    with timer.window():
+        batch_time = timer.time(lambda: calls.append(sum(range(10000))))
+    assert calls == [sum(range(10000))]
+    assert batch_time.device is None
+    assert timer.window_device is None
+    assert 0 < batch_time.host <= batch_time.latency
+
+
+def test_compare_case():
+    """regressions need significant samples above the threshold"""
+    base = {
+        "latency": 10.0,
+        "samples": [10.0 + 0.01 * i for i in range(20)],
+        "sample_stats": {"batch_iters": 100},
+    }
+    slower = {
+        "latency": 12.0,
+        "samples": [12.0 + 0.01 * i for i in range(20)],
+        "sample_stats": {"batch_iters": 100},
+    }
+    for method in ("mannwhitney", "bootstrap"):
+        args = compare_args(method)
+        row = op_bench_compare.compare_case(base, slower, args)
+        assert row["method"] == method
+        assert row["status"] == op_bench_compare.STATUS_REGRESSION
+        assert abs(row["ratio"] - 1.2) < 1e-2
+        row = op_bench_compare.compare_case(slower, base, args)
+        assert row["status"] == op_bench_compare.STATUS_IMPROVEMENT
+        row = op_bench_compare.compare_case(base, base, args)
+        assert row["status"] == op_bench_compare.STATUS_UNCHANGED
+
+    # slower but below the threshold
+    close = dict(slower, samples=[10.2 + 0.01 * i for i in range(20)])
+    row = op_bench_compare.compare_case(base, close, compare_args())
+    assert row["p_value"] < 0.05
+    assert row["status"] == op_bench_compare.STATUS_UNCHANGED
+
+    # samples from batches of different sizes are not tested against each other
+    other_batches = dict(slower, sample_stats={"batch_iters": 200})
+    row = op_bench_compare.compare_case(base, other_batches, compare_args())
+    assert row["method"] == "median"
+    assert row["ratio"] == 1.2
+    row = op_bench_compare.compare_case(
+        {"latency": 10.0}, {"latency": 10.1}, compare_args()
+    )
+    assert row["method"] == "median"
+    assert row["status"] == op_bench_compare.STATUS_UNCHANGED
+
+
+def test_parallel_runner(tmp_path):
+    """test cases which raise or time out in a worker fail alone"""
+    script = tmp_path / "scheduler_test.py"
+    script.write_text(SCHEDULER_TEST, encoding="utf-8")
+    benchmark_res, _ = run_benchmark(
+        script, tmp_path, "--num-workers", "2", "--case-timeout", "20"
+    )
+
+    test_cases = results_by_test_name(benchmark_res)
+    assert sorted(test_cases) == ["scheduler_kindlast_cpu", "scheduler_kindok_cpu"]
+    for test_case in test_cases.values():
+        assert test_case["latency"] > 0
+
+    failed = {
+        test_case["test_name"]: test_case
+        for test_case in benchmark_res["failed_test_cases"]
+    }
+    assert sorted(failed) == ["scheduler_kindraise_cpu", "scheduler_kindsleep_cpu"]
+    assert failed["scheduler_kindraise_cpu"]["status"] == "error"
+    assert "failing test case" in failed["scheduler_kindraise_cpu"]["error"]
+    assert failed["scheduler_kindsleep_cpu"]["status"] == "timeout"
+
+
+def test_out_reuse(tmp_path):
+    """the latency with out= reuse is reported next to the latency"""
+    script = os.path.join(OPERATOR_BENCHMARK_DIR, "tests", "gather_test.py")
+    benchmark_res, _ = run_benchmark(script, tmp_path, "--out-reuse")
+    test_cases = results_by_test_name(benchmark_res)
+    assert sorted(test_cases) == [
+        "gather_M256_N512_dim0_cpu",
+        "gather_M512_N512_dim1_cpu",
+    ]
+    for test_case in test_cases.values():
+        assert test_case["out_reuse_latency"] > 0
+
+
+def test_out_reuse_skipped(tmp_path):
+    """ops without an out= variant are benchmarked without out= reuse"""
+    script = tmp_path / "no_out_test.py"
+    script.write_text(NO_OUT_TEST, encoding="utf-8")
+    benchmark_res, output = run_benchmark(script, tmp_path, "--out-reuse")
+    test_case = results_by_test_name(benchmark_res)["no_out_M8_cpu"]
+    assert test_case["latency"] > 0
+    assert test_case["out_reuse_latency"] is None
+    assert "out= reuse is not supported" in output
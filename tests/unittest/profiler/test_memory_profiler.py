@@ -2,9 +2,12 @@
 import functools
 import gc
 import itertools as it
+import os
+import tempfile
 import textwrap
 from typing import Callable, Dict, Iterator, List, Optional, Tuple
 
+import numpy as np
 import torch
 import torch_musa
 from torch._C._profiler import _EventType, _TensorMetadata
@@ -1463,6 +1466,77 @@ class TestMemoryProfilerE2E(TestCase):
             destroy                    GRADIENT                    13(v0)         1024 kB""",
         )
 
+    def test_memory_curves(self) -> None:
+        model = torch.nn.Sequential(
+            torch.nn.Linear(64, 512, bias=True),
+            torch.nn.ReLU(),
+            torch.nn.Linear(512, 512, bias=False),
+        )
+        optimizer = torch.optim.SGD(model.parameters(), lr=0.1, momentum=0.9)
+
+        with profile() as prof:
+            x = torch.ones((256, 64))
+            model(x).sum().backward()
+            optimizer.step()
+            optimizer.zero_grad()
+
+        memory_profile = prof._memory_profile()
+        arrays = memory_profile.timeline_arrays
+        keys = memory_profile._data_flow_graph.keys
+        self.assertEqual(
+            memory_profile.timeline,
+            tuple(
+                (t, _memory_profiler.Action(a), (keys[k], v), size)
+                for t, a, k, v, size in zip(
+                    arrays.times.tolist(),
+                    arrays.actions.tolist(),
+                    arrays.keys.tolist(),
+                    arrays.versions.tolist(),
+                    arrays.sizes.tolist(),
+                )
+            ),
+        )
+
+        # Accumulate the timeline one event at a time for reference.
+        categories = (None,) + tuple(_memory_profiler.Category)
+        in_use = dict.fromkeys(categories, 0)
+        expected = []
+        for t, action, (key, version), size in memory_profile.timeline:
+            category = memory_profile._categories.get(key, version)
+            if action == _memory_profiler.Action.DESTROY:
+                in_use[category] -= size
+            elif action == _memory_profiler.Action.INCREMENT_VERSION:
+                in_use[category] -= size
+                in_use[memory_profile._categories.get(key, version + 1)] += size
+            else:
+                in_use[category] += size
+            row = [in_use[c] for c in categories]
+            if expected and expected[-1][0] == t:
+                expected[-1] = (t, row)
+            else:
+                expected.append((t, row))
+
+        curves = memory_profile.memory_curves()
+        self.assertEqual(curves.categories, categories)
+        self.assertEqual(curves.times.tolist(), [t for t, _ in expected])
+        self.assertEqual(curves.sizes.tolist(), [row for _, row in expected])
+        peak = curves.peak()
+        self.assertEqual(peak["TOTAL"], max(sum(row) for _, row in expected))
+        self.assertGreater(peak["PARAMETER"], 0)
+        self.assertEqual(
+            len(memory_profile.memory_curves("cpu").times), len(curves.times)
+        )
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "curves.npz")
+            self.assertEqual(prof.export_memory_curves(path), peak)
+            saved = np.load(path)
+            self.assertEqual(saved["time_ns"].tolist(), curves.times.tolist())
+            column = curves.categories.index(_memory_profiler.Category.PARAMETER)
+            self.assertEqual(
+                saved["PARAMETER"].tolist(), curves.sizes[:, column].tolist()
+            )
+
 
 if __name__ == "__main__":
     run_tests()
@@ -2,10 +2,12 @@
 """Unittests for torch musa profiler functionality."""
 import collections
 import gc
+import gzip
 import io
 import json
 import os
 import re
+import signal
 import subprocess
 import sys
 import tempfile
@@ -30,7 +32,15 @@ from torch.autograd import (
     _record_function_with_args_enter,
     _record_function_with_args_exit,
 )
-from torch.autograd.profiler import KinetoStepTracker
+from torch.autograd.profiler import (
+    ColumnarEventList,
+    EventList,
+    FunctionEvent,
+    KinetoStepTracker,
+    QuantileSketch,
+    RunningKeyAverages,
+    _attribute_mem_records,
+)
 from torch.autograd.profiler import profile as _profile
 from torch.autograd.profiler_legacy import profile as _profile_legacy
 from torch.profiler import (
@@ -42,14 +52,19 @@ from torch.profiler import (
     ProfilerAction,
     ProfilerActivity,
     record_function,
+    StepTimer,
     supported_activities,
 )
+from torch.profiler._trace_merge import analyze_traces, write_merged_trace
+from torch.profiler._trace_reader import iter_trace_events
+from torch.profiler._trace_writer import get_codec, write_compressed
 from torch.profiler._pattern_matcher import (
     Conv2dBiasFollowedByBatchNorm2dPattern,
     ExtraMUSACopyPattern,
     ForLoopIndexingPattern,
     FP32MatMulPattern,
     GradNotSetToNonePattern,
+    match_patterns,
     MatMulDimInFP16Pattern,
     NamePattern,
     OptimizerSingleTensorPattern,
@@ -82,6 +97,7 @@ import pickle
 
 from torch._C._profiler import _ExperimentalConfig, _ExtraFields_PyCall
 
+
 @unittest.skip(reason="not stable on concurrent environment")
 @unittest.skipIf(not HAS_PSUTIL, "Requires psutil to run")
 @unittest.skipIf(TEST_WITH_ASAN, "Cannot test with ASAN")
@@ -1368,6 +1384,318 @@ class TestProfiler(TestCase):
                 file_num += 1
             self.assertEqual(file_num, 3)
 
+        # test case for gzip file format exported in background
+        with TemporaryDirectoryName() as dname:
+            with profile(
+                activities=[torch.profiler.ProfilerActivity.CPU],
+                schedule=torch.profiler.schedule(wait=1, warmup=1, active=2, repeat=2),
+                on_trace_ready=torch.profiler.tensorboard_trace_handler(
+                    dname, codec="gzip", background=True
+                ),
+            ) as p:
+                for _ in range(12):
+                    self.payload()
+                    p.step()
+
+            file_names = os.listdir(dname)
+            self.assertEqual(len(file_names), 2)
+            for file_name in file_names:
+                self.assertTrue(file_name.endswith(".pt.trace.json.gz"))
+                with gzip.open(os.path.join(dname, file_name), "rt") as f:
+                    self.assertIn("traceEvents", json.load(f))
+
+    def test_trace_writer_write_compressed(self):
+        events = [{"name": "x" * 8, "i": i} for i in range(1000)]
+        content = json.dumps({"traceEvents": events})
+
+        def save(path):
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(content)
+            return len(content)
+
+        def save_rename(path):
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(path + ".tmp", path)
+
+        def save_fail(path):
+            raise ValueError(path)
+
+        with TemporaryDirectoryName() as dname:
+            os.makedirs(dname, exist_ok=True)
+            path = os.path.join(dname, "trace.json.gz")
+            codec = get_codec(None, path)
+            self.assertEqual(codec.name, "gzip")
+            self.assertEqual(write_compressed(save, path, codec), len(content))
+            with gzip.open(path, "rt") as f:
+                self.assertEqual(f.read(), content)
+
+            write_compressed(save_rename, path, codec)
+            with gzip.open(path, "rt") as f:
+                self.assertEqual(f.read(), content)
+
+            with self.assertRaises(ValueError):
+                write_compressed(save_fail, path, codec)
+            self.assertFalse(os.path.exists(path))
+        self.assertIsNone(get_codec(None, "trace.json"))
+        with self.assertRaises(ValueError):
+            get_codec("lz4")
+
+    def test_attribute_mem_records(self):
+        outer = FunctionEvent(id=1, name="outer", thread=0, start_us=0, end_us=10)
+        inner = FunctionEvent(id=2, name="inner", thread=0, start_us=2, end_us=4)
+        # (rel_start_us, thread, cpu_memory_usage, musa_memory_usage)
+        mem_records = [
+            (12, 0, 8, 8),
+            (4, 0, 1, 0),
+            (2, 0, 2, 0),
+            (10, 0, 0, 16),
+            (1, 0, 4, 0),
+        ]
+        attributed = _attribute_mem_records(mem_records, [outer, inner])
+        self.assertEqual(attributed, [False, True, True, True, True])
+        self.assertEqual((outer.cpu_memory_usage, outer.musa_memory_usage), (7, 16))
+        self.assertEqual((inner.cpu_memory_usage, inner.musa_memory_usage), (3, 0))
+        self.assertEqual(_attribute_mem_records([], [outer]), [])
+
+    def test_event_list_remove_dup_nodes(self):
+        # a chain of same-named wrappers reported innermost first
+        wrappers = [
+            FunctionEvent(id=i, name="MulBackward0", thread=0, start_us=0, end_us=10)
+            for i in range(4)
+        ]
+        leaves = [
+            FunctionEvent(id=4, name="aten::mul", thread=0, start_us=1, end_us=4),
+            FunctionEvent(id=5, name="aten::mul", thread=0, start_us=5, end_us=8),
+        ]
+        for parent, child in zip(wrappers, wrappers[1:] + leaves[:1]):
+            parent.append_cpu_child(child)
+            child.set_cpu_parent(parent)
+        wrappers[-1].append_cpu_child(leaves[1])
+        leaves[1].set_cpu_parent(wrappers[-1])
+        wrappers[-1].append_kernel("mul_kernel", 0, 3)
+
+        events = EventList(leaves + wrappers[::-1])
+        events._remove_dup_nodes()
+        self.assertEqual([evt.id for evt in events], [4, 5, 0])
+        self.assertEqual([child.id for child in wrappers[0].cpu_children], [4, 5])
+        self.assertTrue(all(leaf.cpu_parent is wrappers[0] for leaf in leaves))
+        self.assertEqual([k.name for k in wrappers[0].kernels], ["mul_kernel"])
+        # the same-named leaves have a parent of another name
+        events._remove_dup_nodes()
+        self.assertEqual(len(events), 3)
+
+    @unittest.skipIf(not kineto_available(), "Kineto is required")
+    def test_profiler_columnar_events(self):
+        with _profile(use_kineto=True, record_shapes=True, with_stack=True) as p:
+            self.payload()
+        kwargs = {"use_musa": False, "profile_memory": False, "with_flops": False}
+        events = EventList(p._parse_kineto_results(p.kineto_results), **kwargs)
+        events._build_tree()
+        from_events = ColumnarEventList.from_events(
+            p._parse_kineto_results(p.kineto_results), **kwargs
+        )
+        # columns filled directly from the kineto results
+        from_results = ColumnarEventList.from_builder(
+            p._parse_kineto_results_columnar(p.kineto_results), sort=True, **kwargs
+        )
+        for columnar in (from_events, from_results):
+            columnar._build_tree()
+            self._check_columnar_events(events, columnar)
+
+    def _check_columnar_events(self, events, columnar):
+        self.assertEqual(len(events), len(columnar))
+        self.assertEqual(events.table(), columnar.table())
+        self.assertEqual(
+            events.table(sort_by="self_cpu_time_total", top_level_events_only=True),
+            columnar.table(sort_by="self_cpu_time_total", top_level_events_only=True),
+        )
+        for group_by_input_shapes in (False, True):
+            self.assertEqual(
+                events.key_averages(group_by_input_shapes, 5).table(row_limit=-1),
+                columnar.key_averages(group_by_input_shapes, 5).table(row_limit=-1),
+            )
+        self.assertEqual(repr(events.total_average()), repr(columnar.total_average()))
+        for evt, view in zip(events, columnar):
+            self.assertEqual(repr(evt), repr(view))
+            self.assertEqual(evt.stack, view.stack)
+            self.assertEqual(
+                [child.id for child in evt.cpu_children],
+                [child.id for child in view.cpu_children],
+            )
+
+        with TemporaryFileName(mode="w+") as fname:
+            events.export_chrome_trace(fname)
+            with open(fname, encoding="utf-8") as f:
+                expected = f.read()
+            columnar.export_chrome_trace(fname)
+            with open(fname, encoding="utf-8") as f:
+                self.assertEqual(expected, f.read())
+
+            events.export_stacks(fname, "self_cpu_time_total")
+            with open(fname, encoding="utf-8") as f:
+                expected = f.read()
+            columnar.export_stacks(fname, "self_cpu_time_total")
+            with open(fname, encoding="utf-8") as f:
+                self.assertEqual(expected, f.read())
+
+    def test_quantile_sketch(self):
+        values = [float(i) for i in range(1, 1001)]
+        sketch = QuantileSketch(relative_accuracy=0.01)
+        sketch.add(values[:500])
+        other = QuantileSketch(relative_accuracy=0.01)
+        other.add(values[500:])
+        sketch.merge(other)
+        self.assertEqual(sketch.count, 1000)
+        for q in (0.0, 0.5, 0.9, 0.99, 1.0):
+            exact = values[int(q * 999)]
+            self.assertLessEqual(abs(sketch.quantile(q) - exact), 0.01 * exact)
+        restored = QuantileSketch.from_dict(json.loads(json.dumps(sketch.to_dict())))
+        self.assertEqual(restored.quantile(0.5), sketch.quantile(0.5))
+        with self.assertRaises(ValueError):
+            sketch.merge(QuantileSketch(relative_accuracy=0.02))
+
+    @unittest.skipIf(not kineto_available(), "Kineto is required")
+    def test_running_key_averages(self):
+        running = RunningKeyAverages()
+        cycles = []
+
+        def trace_handler(p):
+            running(p)
+            cycles.append(RunningKeyAverages())
+            cycles[-1].update(p.events())
+
+        with profile(
+            activities=[ProfilerActivity.CPU],
+            schedule=torch.profiler.schedule(wait=0, warmup=0, active=1),
+            on_trace_ready=trace_handler,
+        ) as p:
+            for _ in range(4):
+                self.payload()
+                p.step()
+
+        self.assertEqual(running.num_cycles, 4)
+        self.assertEqual(len(cycles), 4)
+        merged = RunningKeyAverages()
+        for cycle in cycles:
+            with TemporaryFileName(mode="w+") as fname:
+                cycle.save(fname)
+                merged.merge(RunningKeyAverages.load(fname))
+        self.assertEqual(merged.num_cycles, 4)
+        self.assertEqual(set(merged.keys()), set(running.keys()))
+        for expected, avg in zip(running.key_averages(), merged.key_averages()):
+            self.assertEqual(expected.key, avg.key)
+            self.assertEqual(expected.count, avg.count)
+            self.assertEqual(expected.cpu_time_total, avg.cpu_time_total)
+            self.assertEqual(expected.self_cpu_time_total, avg.self_cpu_time_total)
+        self.assertIn("aten::mm", running)
+        avg = {avg.key: avg for avg in running.key_averages()}["aten::mm"]
+        self.assertEqual(avg.count, 4)
+        p50 = running.quantile("aten::mm", 0.5)
+        self.assertGreater(p50, 0)
+        self.assertLessEqual(p50, running.quantile("aten::mm", 1.0))
+        self.assertEqual(merged.quantile("aten::mm", 0.5), p50)
+        self.assertIn("aten::mm", running.table(row_limit=-1))
+        self.assertIn("aten::mm", running.key_averages().table())
+
+    def test_step_timer(self):
+        allocated = []
+
+        def memory_stats():
+            allocated.append(len(allocated) * 512)
+            return {"allocated_bytes.all.current": allocated[-1]}
+
+        timer = StepTimer(
+            ranges=["forward", "unused"],
+            capacity=3,
+            memory_keys=["allocated_bytes.all.current", "num_ooms"],
+            memory_stats=memory_stats,
+        )
+        x = torch.ones((10, 10))
+        with timer:
+            for i in range(5):
+                for _ in range(i + 1):
+                    with record_function("forward"):
+                        x = x + 1
+                with record_function("backward"):
+                    x = x * 1
+                timer.step()
+            with record_function("forward"):
+                pass
+        # ranges and steps are not recorded after stop
+        with record_function("forward"):
+            pass
+        timer.step()
+
+        self.assertEqual(timer.num_steps, 5)
+        records = timer.to_dicts()
+        self.assertEqual([r["step"] for r in records], [2, 3, 4])
+        self.assertEqual([r["forward.count"] for r in records], [3, 4, 5])
+        self.assertEqual([r["unused.count"] for r in records], [0, 0, 0])
+        self.assertEqual(
+            [r["allocated_bytes.all.current"] for r in records], [1024, 1536, 2048]
+        )
+        self.assertEqual([r["num_ooms"] for r in records], [0, 0, 0])
+        for r in records:
+            self.assertGreater(r["forward.time_ns"], 0)
+            self.assertGreaterEqual(r["wall_time_ns"], r["forward.time_ns"])
+        self.assertNotIn("backward.count", timer.columns)
+
+        with TemporaryDirectoryName() as dname:
+            timer.dump(os.path.join(dname, "steps.csv"))
+            with open(os.path.join(dname, "steps.csv"), encoding="utf-8") as f:
+                lines = f.read().splitlines()
+            self.assertEqual(lines[0].split(","), timer.columns)
+            self.assertEqual(len(lines), 4)
+            path = os.path.join(dname, "steps.{pid}.json")
+            with timer:
+                timer.dump_on_signal(path)
+                os.kill(os.getpid(), signal.SIGUSR1)
+            with open(path.format(pid=os.getpid()), encoding="utf-8") as f:
+                dump = json.load(f)
+            self.assertEqual(dump["columns"], timer.columns)
+            self.assertEqual(dump["num_steps"], 5)
+            self.assertEqual(dump["records"], timer.records().tolist())
+
+    @unittest.skipIf(not kineto_available(), "Kineto is required")
+    def test_profiler_async_trace_ready(self):
+        release = threading.Event()
+        ready_steps = []
+
+        def trace_handler(p):
+            release.wait()
+            self.assertIsNotNone(p.profiler.function_events)
+            ready_steps.append(p.step_num)
+
+        with profile(
+            activities=[torch.profiler.ProfilerActivity.CPU],
+            schedule=torch.profiler.schedule(wait=0, warmup=0, active=1, repeat=3),
+            on_trace_ready=trace_handler,
+            async_trace_ready=True,
+            max_pending_traces=1,
+        ) as p:
+            for _ in range(3):
+                self.payload()
+                p.step()
+            release.set()
+        # the first trace blocks the handler, the following ones are dropped
+        self.assertEqual(ready_steps, [1])
+        self.assertEqual(p.num_dropped_traces, 2)
+
+        ready_steps.clear()
+        with profile(
+            activities=[torch.profiler.ProfilerActivity.CPU],
+            schedule=torch.profiler.schedule(wait=0, warmup=0, active=1, repeat=3),
+            on_trace_ready=trace_handler,
+            async_trace_ready=True,
+            backpressure="wait",
+        ) as p:
+            for _ in range(3):
+                self.payload()
+                p.step()
+        self.assertEqual(ready_steps, [1, 2, 3])
+        self.assertEqual(p.num_dropped_traces, 0)
+
     @unittest.skipIf(not kineto_available(), "Kineto is required")
     def test_profiler_metadata(self):
         t1, t2 = torch.ones(1), torch.ones(1)
@@ -2810,6 +3138,181 @@ class TestExperimentalUtils(TestCase):
 100000 [CPU (After GPU)]""",
         )
 
+    @staticmethod
+    def dump_mock_trace(profiler, path):
+        trace_events = []
+        for e in profiler.kineto_results.events():
+            is_device = e.device_type() != DeviceType.CPU
+            trace_events.append(
+                {
+                    "ph": "X",
+                    "cat": "kernel" if is_device else "musa_runtime",
+                    "name": e.name,
+                    "pid": 0,
+                    "tid": 7 if is_device else 1,
+                    "ts": e.start_us(),
+                    "dur": e.duration_us(),
+                    "args": {"correlation": e.linked_correlation_id()},
+                }
+            )
+        for e in profiler.kineto_results.experimental_event_tree():
+            trace_events.append(
+                {
+                    "ph": "X",
+                    "cat": "cpu_op",
+                    "name": e.name,
+                    "pid": 0,
+                    "tid": 2,
+                    "ts": e.start_time_ns / 1000,
+                    "dur": e.duration_time_ns / 1000,
+                }
+            )
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            json.dump({"schemaVersion": 1, "traceEvents": trace_events}, f)
+
+    def test_utils_trace_evaluation(self):
+        profiler = self.generate_mock_profile()
+        basic_evaluation = _utils.BasicEvaluation(profiler)
+        with TemporaryFileName(mode="w+") as fname:
+            trace_path = fname + ".json.gz"
+            self.dump_mock_trace(profiler, trace_path)
+            trace_evaluation = _utils.TraceEvaluation(trace_path)
+            os.remove(trace_path)
+
+        def queue_depths(evaluation):
+            return [
+                (data.start, data.end, data.queue_depth)
+                for data in evaluation.queue_depth_list
+            ]
+
+        def host_metrics(evaluation, names):
+            return [
+                (
+                    k.event.name,
+                    evaluation.metrics[k].self_time_ns,
+                    evaluation.metrics[k].queue_depth,
+                    evaluation.metrics[k].idle_time_ns,
+                )
+                for k in evaluation.event_keys
+                if k.event.name in names
+            ]
+
+        cpu_names = {e.name for e in profiler.kineto_results.experimental_event_tree()}
+        self.assertEqual(queue_depths(trace_evaluation), queue_depths(basic_evaluation))
+        self.assertEqual(
+            host_metrics(trace_evaluation, cpu_names),
+            host_metrics(basic_evaluation, cpu_names),
+        )
+
+    def test_utils_iter_trace_events(self):
+        events = [{"ph": "X", "name": f"op_{i}", "ts": i, "dur": 1} for i in range(100)]
+        with TemporaryFileName(mode="w+") as fname:
+            with open(fname, "w", encoding="utf-8") as f:
+                json.dump({"deviceProperties": [], "traceEvents": events}, f)
+            # chunks smaller than a single event
+            self.assertEqual(list(iter_trace_events(fname, chunk_size=7)), events)
+            with open(fname, "w", encoding="utf-8") as f:
+                json.dump(events, f)
+            self.assertEqual(list(iter_trace_events(fname)), events)
+
+    def test_utils_merge_rank_traces(self):
+        def write_trace(path, rank, offset_us, late_us):
+            events = [
+                {"ph": "M", "name": "process_name", "pid": 0, "args": {"name": "GPU 0"}}
+            ]
+            for step in range(4):
+                start = offset_us + step * 200
+                compute_us = 100 + late_us
+                events += [
+                    {
+                        "ph": "X",
+                        "cat": "user_annotation",
+                        "name": f"ProfilerStep#{step}",
+                        "pid": 1,
+                        "tid": 1,
+                        "ts": start,
+                        "dur": compute_us + 60,
+                    },
+                    {
+                        "ph": "X",
+                        "cat": "kernel",
+                        "name": "gemm",
+                        "pid": 0,
+                        "tid": 7,
+                        "ts": start,
+                        "dur": compute_us,
+                    },
+                    # arrives 20us before the end of gemm, ends together on all ranks
+                    {
+                        "ph": "X",
+                        "cat": "kernel",
+                        "name": "mcclKernel_AllReduce",
+                        "pid": 0,
+                        "tid": 8,
+                        "ts": start + compute_us - 20,
+                        "dur": 50 + 30 - late_us + 20,
+                    },
+                ]
+            trace = {"traceEvents": events}
+            if rank is not None:
+                trace = {"distributedInfo": {"rank": rank}, **trace}
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(trace, f)
+
+        with TemporaryDirectoryName() as dname:
+            # rank 1 computes 30us longer than the others
+            for rank, offset_us in ((2, 5000), (0, 1000), (1, 3000)):
+                write_trace(
+                    os.path.join(dname, f"worker{rank}.1.pt.trace.json"),
+                    rank,
+                    offset_us,
+                    30 if rank == 1 else 0,
+                )
+            report = analyze_traces([dname])
+            self.assertEqual([r.rank for r in report.ranks], [0, 1, 2])
+            self.assertEqual(
+                [r.offset_ns for r in report.ranks], [0, -2000000, -4000000]
+            )
+            stats = report.ranks[0].steps[0]
+            self.assertEqual(stats.compute_ns, 100000)
+            self.assertEqual(stats.comm_ns, 100000)
+            self.assertEqual(stats.overlap_ns, 20000)
+            for step in report.steps:
+                self.assertEqual(step.slowest_rank, 1)
+                self.assertEqual(step.straggler_rank, 1)
+                self.assertEqual(step.max_skew_ns, 30000)
+                self.assertEqual(step.wait_ns, {0: 30000, 1: 0, 2: 30000})
+            summary = report.rank_summary()
+            self.assertEqual([row["straggler_steps"] for row in summary], [0, 4, 0])
+
+            merged = os.path.join(dname, "merged.json.gz")
+            write_merged_trace(report.ranks, merged)
+            events = list(iter_trace_events(merged))
+            kernels = [e for e in events if e.get("cat") == "kernel"]
+            self.assertEqual(sorted({e["pid"] for e in kernels}), [0, 1, 2])
+            # collectives of a step end together after alignment
+            ends = {
+                e["pid"]: e["ts"] + e["dur"]
+                for e in kernels
+                if e["name"].startswith("mccl") and e["ts"] < 1200
+            }
+            self.assertEqual(ends, {0: 1180, 1: 1180, 2: 1180})
+            thread_names = {
+                e["args"]["name"] for e in events if e["name"] == "thread_name"
+            }
+            self.assertIn("GPU 0 / 7", thread_names)
+
+        with TemporaryDirectoryName() as dname:
+            # without distributedInfo, ranks follow the worker names
+            for worker in ("b", "a"):
+                path = os.path.join(dname, f"{worker}.1.pt.trace.json")
+                write_trace(path, None, 0, 0)
+            report = analyze_traces([dname])
+            self.assertEqual(
+                [os.path.basename(r.paths[0]) for r in report.ranks],
+                ["a.1.pt.trace.json", "b.1.pt.trace.json"],
+            )
+
     def test_utils_get_optimizable_events(self):
         basic_evaluation = _utils.BasicEvaluation(self.load_mock_profile())
         optimizable_events = basic_evaluation.get_optimizable_events(
@@ -3090,6 +3593,34 @@ aten::mm""",
         finally:
             os.remove("torchtidy_report.json")
 
+    def test_profiler_match_patterns(self):
+        x = torch.randn((1, 3, 32, 32))
+        model = nn.Sequential(
+            nn.Conv2d(3, 3, 3, 1, 1),
+            nn.BatchNorm2d(3),
+            nn.Flatten(),
+            nn.Linear(3 * 32 * 32, 10),
+        )
+        optimizer = torch.optim.Adam(model.parameters(), foreach=False)
+        with profile(with_stack=True, record_shapes=True) as prof:
+            model(x).sum().backward()
+            optimizer.step()
+            optimizer.zero_grad(set_to_none=False)
+        patterns = [
+            Conv2dBiasFollowedByBatchNorm2dPattern(prof),
+            ForLoopIndexingPattern(prof),
+            GradNotSetToNonePattern(prof),
+            NamePattern(prof, "aten::mm"),
+            OptimizerSingleTensorPattern(prof),
+        ]
+        # All patterns of a profile share one event tree.
+        self.assertTrue(all(p.event_tree is patterns[0].event_tree for p in patterns))
+        matched = match_patterns(patterns)
+        self.assertEqual(matched, [p.matched_events() for p in patterns])
+        self.assertEqual(len(matched[0]), 1)
+        self.assertEqual(len(matched[2]), 1)
+        self.assertEqual(len(matched[4]), 1)
+
 
 if __name__ == "__main__":
     run_tests()
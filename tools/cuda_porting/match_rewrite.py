@@ -3,24 +3,81 @@
 
 import os
 import re
+import sys
 import json
+import pickle
+import logging
 import pathlib
 import argparse
 import itertools
 import contextlib
+import importlib.util
 import ahocorasick
 from typing import Dict
 
 
+# bump it whenever the layout of cached automaton changes
+AUTOMATON_CACHE_VERSION = 1
+
+
+def _load_mapping_cache():
+    r"""Loads `torch_musa.utils.mapping_cache` from its file, since torch_musa
+    is not importable before it is built."""
+    path = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        os.pardir,
+        os.pardir,
+        "torch_musa",
+        "utils",
+        "mapping_cache.py",
+    )
+    spec = importlib.util.spec_from_file_location("mapping_cache", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+mapping_cache = _load_mapping_cache()
+
+
+def automaton_cache_path(input_map_files: list) -> str:
+    r"""Returns path of cached automaton, keyed by content of mapping files.
+
+    The cache is kept with the ones of `torch_musa.utils.mapping_cache`.
+
+    Args:
+        input_map_files (list[str]): json files which describe matching and replacing information.
+
+    Returns:
+        path (str): path of the cache file.
+    """
+    key = mapping_cache.mapping_key(
+        "cuda_porting", input_map_files, {"version": AUTOMATON_CACHE_VERSION}
+    )
+    return os.path.join(mapping_cache.cache_dir(), f"cuda_porting-{key[:32]}.pkl")
+
+
 def init_ac_automaton(input_map_files: list) -> ahocorasick.Automaton:
     r"""Returns an instance of Automaton with specific information.
 
+    The built automaton is pickled into a cache and reused until any of
+    the mapping files changes.
+
     Args:
         input_map_files (list[str]): json files which describe matching and replacing information.
 
     Returns:
         an instance of ahocorasick.Automaton.
     """
+    cache_path = automaton_cache_path(input_map_files)
+    try:
+        with open(cache_path, "rb") as handle:
+            return pickle.loads(handle.read())
+    except FileNotFoundError:
+        pass
+    except (OSError, pickle.UnpicklingError, EOFError, ValueError) as exception:
+        logging.warning("Ignore broken automaton cache %s: %s", cache_path, exception)
+
     automaton = ahocorasick.Automaton()
 
     def read_mapping(path):
@@ -32,6 +89,15 @@ def init_ac_automaton(input_map_files: list) -> ahocorasick.Automaton:
         automaton.add_word(cuda, (len(cuda), musa))
 
     automaton.make_automaton()
+
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as handle:
+            pickle.dump(automaton, handle, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError as exception:
+        logging.warning("Failed to write automaton cache %s: %s", cache_path, exception)
     return automaton
 
 
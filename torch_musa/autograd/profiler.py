@@ -1,8 +1,11 @@
 """Torch musa autograd profiler."""
 
+import bisect
+import itertools
 import sqlite3
+import time
 from collections import defaultdict
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from warnings import warn
 
 import torch
@@ -22,6 +25,8 @@ from torch.autograd import (
 )
 from torch.futures import Future
 
+from .profiler_columnar import _ColumnBuilder, ColumnarEventList
+from .profiler_running import QuantileSketch, RunningKeyAverages
 from .profiler_util import (
     _filter_name,
     _filter_stack_entry,
@@ -43,8 +48,11 @@ __all__ = [
     "parse_nvprof_trace",
     "KinetoStepTracker",
     "EventList",
+    "ColumnarEventList",
     "FunctionEvent",
     "MemRecordsAcc",
+    "QuantileSketch",
+    "RunningKeyAverages",
 ]
 
 try:
@@ -169,11 +177,13 @@ class profile:
         use_kineto=False,
         use_cpu=True,
         experimental_config=None,
+        columnar_events=False,
     ):
         self.enabled: bool = enabled
         if not self.enabled:
             return
         self.use_musa = use_musa
+        self.columnar_events = columnar_events
         self.function_events: Optional[EventList] = None
         self.entered = False
         self.record_shapes = record_shapes
@@ -244,18 +254,37 @@ class profile:
     def __exit__(self, exc_type, exc_val, exc_tb):
         if not self.enabled:
             return None
+        self._stop_trace()
+        self._process_results()
+        return False
+
+    def _stop_trace(self):
+        """Stops collecting events, leaving the results unprocessed"""
         if self.use_musa:
             torch.musa.synchronize()
         self.kineto_results = _disable_profiler()
-        parsed_results = self._parse_kineto_results(self.kineto_results)
-        self.function_events = EventList(
-            parsed_results,
-            use_musa=self.use_musa,
-            profile_memory=self.profile_memory,
-            with_flops=self.with_flops,
-        )
+        self.function_events = None
+
+    def _process_results(self):
+        """Builds function events from the results of a stopped trace"""
+        if self.function_events is not None or self.kineto_results is None:
+            return
+        kwargs = {
+            "use_musa": self.use_musa,
+            "profile_memory": self.profile_memory,
+            "with_flops": self.with_flops,
+        }
+        if self.columnar_events:
+            self.function_events = ColumnarEventList.from_builder(
+                self._parse_kineto_results_columnar(self.kineto_results),
+                sort=True,
+                **kwargs,
+            )
+        else:
+            self.function_events = EventList(
+                self._parse_kineto_results(self.kineto_results), **kwargs
+            )
         self.function_events._build_tree()
-        return False
 
     def __repr__(self):
         if self.function_events is None:
@@ -335,158 +364,350 @@ class profile:
         return self.function_events.self_cpu_time_total
 
     def _parse_kineto_results(self, result):
-        # result.events() has most of the events - PyTorch op-level and device-level events
-
-        trace_start_us = result.trace_start_us()
-        mem_records = [
-            [evt, False] for evt in result.events() if evt.name() == MEMORY_EVENT_NAME
-        ]
-        oom_records = [
-            evt for evt in result.events() if evt.name() == OUT_OF_MEMORY_EVENT_NAME
-        ]
-        mem_records_acc = MemRecordsAcc(mem_records)
-
-        def _cpu_memory_usage(mem_record):
-            return (
-                mem_record.nbytes()
-                if mem_record.device_type()
-                in [DeviceType.CPU, DeviceType.MKLDNN, DeviceType.IDEEP]
-                else 0
-            )
+        # result.events() has most of the events - PyTorch op-level and device-level
+        # events. It creates Python objects of all events on every call, so events are
+        # read in a single pass, see _walk_kineto_results
+        front_end = _FunctionEventFrontEnd()
+        _walk_kineto_results(result, front_end)
+        function_events = front_end.events
+        function_events.sort(
+            key=lambda evt: [evt.time_range.start, -evt.time_range.end]
+        )
+        return function_events
 
-        def _musa_memory_usage(mem_record):
-            return mem_record.nbytes()
-
-        # Create and return FunctionEvent list
-        function_events = []
-        musa_corr_map: Dict[int, List[FunctionEvent]] = {}
-        max_evt_id = 0
-        for kineto_event in result.events():
-            if _filter_name(kineto_event.name()):
-                continue
-            rel_start_us = kineto_event.start_us() - trace_start_us
-            rel_end_us = rel_start_us + kineto_event.duration_us()
-            abs_end_us = kineto_event.start_us() + kineto_event.duration_us()
-
-            cpu_memory_usage = 0
-            musa_memory_usage = 0
-            if kineto_event.device_type() == DeviceType.CPU:
-                # find the corresponding memory allocation events
-                for mem_record in mem_records_acc.in_interval(
-                    kineto_event.start_us(), abs_end_us
-                ):
-                    cpu_memory_usage += _cpu_memory_usage(mem_record[0])
-                    musa_memory_usage += _musa_memory_usage(mem_record[0])
-                    mem_record[1] = True
-
-            is_async = kineto_event.is_async() or (
-                kineto_event.start_thread_id() != kineto_event.end_thread_id()
-            )
+    def _parse_kineto_results_columnar(self, result) -> _ColumnBuilder:
+        """Parses result as _parse_kineto_results, but appends the events to the
+        columns of a ColumnarEventList instead of creating a FunctionEvent for each
+        of them, the rows are left unsorted"""
+        builder = _ColumnBuilder()
+        _walk_kineto_results(result, _ColumnarFrontEnd(builder))
+        return builder
 
-            function_event = FunctionEvent(
-                id=kineto_event.correlation_id(),
-                name=_rewrite_name(name=kineto_event.name(), with_wildcard=True),
-                trace_name=_rewrite_name(name=kineto_event.name(), with_wildcard=False),
-                thread=kineto_event.start_thread_id(),
-                start_us=rel_start_us,
-                end_us=rel_end_us,
-                fwd_thread=kineto_event.fwd_thread_id(),
-                input_shapes=kineto_event.shapes(),
-                stack=[
-                    entry
-                    for entry in kineto_event.stack()
-                    if _filter_stack_entry(entry)
-                ],
-                scope=kineto_event.scope(),
-                cpu_memory_usage=cpu_memory_usage,
-                musa_memory_usage=musa_memory_usage,
-                is_async=is_async,
-                sequence_nr=kineto_event.sequence_nr(),
-                device_type=kineto_event.device_type(),
-                device_index=kineto_event.device_index(),
-                flops=kineto_event.flops(),
-            )
-            max_evt_id = (
-                function_event.id if function_event.id > max_evt_id else max_evt_id
+
+def _walk_kineto_results(result, front_end):
+    """Reads the events of result in a single pass and stores them with front_end.
+
+    The pass collects memory records and the events linked by correlation ids, both
+    are attributed to CPU events afterwards. Memory records attributed to no CPU
+    event and out of memory records are stored as top-level memory events.
+    """
+    trace_start_us = result.trace_start_us()
+
+    # memory records are kept as
+    # (rel_start_us, thread, cpu_memory_usage, musa_memory_usage) tuples
+    mem_records = []
+    oom_records = []
+    # (event, id, is_async) of CPU events and their time ranges
+    cpu_events = []
+    cpu_starts_us = []
+    cpu_ends_us = []
+    # (event, is_cpu) of linked events
+    musa_corr_map: Dict[int, List[Tuple]] = defaultdict(list)
+    # kernel names in particular repeat a lot, so each name is demangled once
+    # and all of its events share the strings
+    names: Dict[str, Tuple[str, str]] = {}
+
+    max_evt_id = 0
+    for kineto_event in result.events():
+        name = kineto_event.name()
+        if name in (MEMORY_EVENT_NAME, OUT_OF_MEMORY_EVENT_NAME):
+            record = _memory_record(kineto_event, trace_start_us)
+            if name == MEMORY_EVENT_NAME:
+                mem_records.append(record)
+            else:
+                oom_records.append(record)
+            continue
+        if _filter_name(name):
+            continue
+        rewritten_names = names.get(name)
+        if rewritten_names is None:
+            rewritten_names = names[name] = (
+                _rewrite_name(name=name, with_wildcard=True),
+                _rewrite_name(name=name, with_wildcard=False),
             )
-            if (
-                function_event.device_type == DeviceType.CPU
-                and not function_event.is_async
-            ):
+        rel_start_us = kineto_event.start_us() - trace_start_us
+        rel_end_us = rel_start_us + kineto_event.duration_us()
+
+        is_async = kineto_event.is_async() or (
+            kineto_event.start_thread_id() != kineto_event.end_thread_id()
+        )
+        evt_id = kineto_event.correlation_id()
+        is_cpu = kineto_event.device_type() == DeviceType.CPU
+        event = front_end.append(
+            kineto_event, rewritten_names, rel_start_us, rel_end_us, is_async
+        )
+        max_evt_id = evt_id if evt_id > max_evt_id else max_evt_id
+        if is_cpu:
+            cpu_events.append((event, evt_id, is_async))
+            cpu_starts_us.append(rel_start_us)
+            cpu_ends_us.append(rel_end_us)
+            if not is_async:
                 # Check if we have MUSA time as a fallback
                 # TODO: The following is not adapted to MUSA temporarily
                 musa_time = kineto_event.cuda_elapsed_us()
                 if musa_time > 0:
-                    function_event.append_kernel(
-                        function_event.name, function_event.device_index, musa_time
+                    front_end.append_legacy_kernel(
+                        event,
+                        rewritten_names[0],
+                        kineto_event.device_index(),
+                        musa_time,
                     )
-                    function_event.is_legacy = True
-            function_events.append(function_event)
-            corr_id = kineto_event.linked_correlation_id()
-            if corr_id > 0:
-                if corr_id not in musa_corr_map:
-                    musa_corr_map[corr_id] = []
-                musa_corr_map[corr_id].append(function_event)
-
-        # associate MUSA kernels and MUSA runtime (CPU) with CPU events
-        for function_event in function_events:
-            if (
-                function_event.device_type == DeviceType.CPU
-                and not function_event.is_async
-                and function_event.id in musa_corr_map
-            ):
-                for f_evt in musa_corr_map[function_event.id]:
-                    if f_evt.device_type != DeviceType.CPU:
-                        function_event.append_kernel(
-                            f_evt.name,
-                            f_evt.device_index,
-                            f_evt.time_range.end - f_evt.time_range.start,
-                        )
-                    elif f_evt.device_type == DeviceType.CPU:
-                        # make sure that 'thread' of a CPU Kineto (e.g. MUSA Runtime) event is
-                        # associated with the 'thread' of the corresponding linked PyTorch event
-                        # to properly track parents and children
-                        f_evt.thread = function_event.thread
-
-        # pylint: disable=C0103
-        def createFunctionEventForMemoryEvents(evt):
-            rel_start_us = evt.start_us() - trace_start_us
-            func_event = FunctionEvent(
-                id=max_evt_id,
-                name=evt.name(),
+        corr_id = kineto_event.linked_correlation_id()
+        if corr_id > 0:
+            musa_corr_map[corr_id].append((event, is_cpu))
+
+    # associate MUSA kernels and MUSA runtime (CPU) with CPU events
+    for event, evt_id, is_async in cpu_events:
+        linked_events = musa_corr_map.get(evt_id)
+        if is_async or linked_events is None:
+            continue
+        for linked, is_cpu in linked_events:
+            if not is_cpu:
+                front_end.append_linked_kernel(event, linked)
+            else:
+                # make sure that 'thread' of a CPU Kineto (e.g. MUSA Runtime) event is
+                # associated with the 'thread' of the corresponding linked PyTorch event
+                # to properly track parents and children
+                front_end.set_thread(linked, front_end.thread(event))
+
+    # find the memory allocation events of CPU events
+    usages, attributed = _mem_usage_in_ranges(mem_records, cpu_starts_us, cpu_ends_us)
+    for (event, _, _), usage in zip(cpu_events, usages):
+        if usage is not None:
+            front_end.set_memory_usage(event, usage)
+
+    # output top-level memory events
+    for mem_record, is_attributed in zip(mem_records, attributed):
+        if not is_attributed:
+            max_evt_id += 1
+            front_end.append_memory_event(max_evt_id, MEMORY_EVENT_NAME, mem_record)
+    for oom_record in oom_records:
+        max_evt_id += 1
+        front_end.append_memory_event(max_evt_id, OUT_OF_MEMORY_EVENT_NAME, oom_record)
+
+
+def _filtered_stack(kineto_event):
+    return [entry for entry in kineto_event.stack() if _filter_stack_entry(entry)]
+
+
+class _FunctionEventFrontEnd:
+    """Stores the events of _walk_kineto_results as FunctionEvents"""
+
+    def __init__(self):
+        self.events: List[FunctionEvent] = []
+
+    def append(self, kineto_event, names, rel_start_us, rel_end_us, is_async):
+        """Appends a FunctionEvent of kineto_event and returns it"""
+        function_event = FunctionEvent(
+            id=kineto_event.correlation_id(),
+            name=names[0],
+            trace_name=names[1],
+            thread=kineto_event.start_thread_id(),
+            start_us=rel_start_us,
+            end_us=rel_end_us,
+            fwd_thread=kineto_event.fwd_thread_id(),
+            input_shapes=kineto_event.shapes(),
+            stack=_filtered_stack(kineto_event),
+            scope=kineto_event.scope(),
+            is_async=is_async,
+            sequence_nr=kineto_event.sequence_nr(),
+            device_type=kineto_event.device_type(),
+            device_index=kineto_event.device_index(),
+            flops=kineto_event.flops(),
+        )
+        self.events.append(function_event)
+        return function_event
+
+    @staticmethod
+    def append_linked_kernel(function_event, linked):
+        function_event.append_kernel(
+            linked.name,
+            linked.device_index,
+            linked.time_range.end - linked.time_range.start,
+        )
+
+    @staticmethod
+    def append_legacy_kernel(function_event, name, device_index, duration_us):
+        function_event.append_kernel(name, device_index, duration_us)
+        function_event.is_legacy = True
+
+    @staticmethod
+    def thread(function_event):
+        return function_event.thread
+
+    @staticmethod
+    def set_thread(function_event, thread):
+        function_event.thread = thread
+
+    @staticmethod
+    def set_memory_usage(function_event, usage):
+        function_event.cpu_memory_usage, function_event.musa_memory_usage = usage
+
+    def append_memory_event(self, evt_id, name, record):
+        rel_start_us, thread, cpu_memory_usage, musa_memory_usage = record
+        self.events.append(
+            FunctionEvent(
+                id=evt_id,
+                name=name,
                 trace_name=None,  # not outputting in the trace
-                thread=evt.start_thread_id(),
+                thread=thread,
                 start_us=rel_start_us,
                 end_us=rel_start_us,  # no duration
-                fwd_thread=evt.start_thread_id(),
+                fwd_thread=thread,
                 input_shapes=[],
                 stack=[],
                 scope=0,  # RecordScope::FUNCTION
-                cpu_memory_usage=_cpu_memory_usage(evt),
-                musa_memory_usage=_musa_memory_usage(evt),
+                cpu_memory_usage=cpu_memory_usage,
+                musa_memory_usage=musa_memory_usage,
                 is_async=False,
                 sequence_nr=-1,
                 device_type=DeviceType.CPU,
                 device_index=0,
             )
-            return func_event
+        )
 
-        # output top-level memory events
-        for mem_record in mem_records:
-            if not mem_record[1]:
-                max_evt_id += 1
-                function_event = createFunctionEventForMemoryEvents(mem_record[0])
-                function_events.append(function_event)
 
-        for oom_record in oom_records:
-            max_evt_id += 1
-            function_event = createFunctionEventForMemoryEvents(oom_record)
-            function_events.append(function_event)
+class _ColumnarFrontEnd:
+    """Stores the events of _walk_kineto_results as rows of a _ColumnBuilder"""
+
+    def __init__(self, builder: _ColumnBuilder):
+        self.builder = builder
+
+    def append(self, kineto_event, names, rel_start_us, rel_end_us, is_async):
+        """Appends a row of kineto_event and returns its index"""
+        return self.builder.append(
+            kineto_event.correlation_id(),
+            names[0],
+            kineto_event.start_thread_id(),
+            rel_start_us,
+            rel_end_us,
+            fwd_thread=kineto_event.fwd_thread_id(),
+            input_shapes=kineto_event.shapes(),
+            stack=_filtered_stack(kineto_event),
+            scope=kineto_event.scope(),
+            is_async=is_async,
+            sequence_nr=kineto_event.sequence_nr(),
+            device_type=kineto_event.device_type(),
+            device_index=kineto_event.device_index(),
+            flops=kineto_event.flops(),
+            trace_name=names[1],
+        )
 
-        function_events.sort(
-            key=lambda evt: [evt.time_range.start, -evt.time_range.end]
+    def append_linked_kernel(self, row, linked):
+        ints, times = self.builder.ints, self.builder.times
+        self.builder.append_kernel(
+            row,
+            self.builder.names.values[ints["name"][linked]],
+            ints["device_index"][linked],
+            times["end"][linked] - times["start"][linked],
+        )
+
+    def append_legacy_kernel(self, row, name, device_index, duration_us):
+        self.builder.append_kernel(row, name, device_index, duration_us)
+        self.builder.bools["is_legacy"][row] = True
+
+    def thread(self, row):
+        return self.builder.ints["thread"][row]
+
+    def set_thread(self, row, thread):
+        self.builder.ints["thread"][row] = thread
+
+    def set_memory_usage(self, row, usage):
+        ints = self.builder.ints
+        ints["cpu_memory_usage"][row], ints["musa_memory_usage"][row] = usage
+
+    def append_memory_event(self, evt_id, name, record):
+        rel_start_us, thread, cpu_memory_usage, musa_memory_usage = record
+        self.builder.append(
+            evt_id,
+            name,
+            thread,
+            rel_start_us,
+            rel_start_us,
+            fwd_thread=thread,
+            input_shapes=[],
+            stack=[],
+            cpu_memory_usage=cpu_memory_usage,
+            musa_memory_usage=musa_memory_usage,
         )
-        return function_events
+
+
+def _memory_record(kineto_event, trace_start_us):
+    """Returns (rel_start_us, thread, cpu_memory_usage, musa_memory_usage) of a
+    memory or out of memory event"""
+    nbytes = kineto_event.nbytes()
+    cpu_memory_usage = (
+        nbytes
+        if kineto_event.device_type()
+        in [DeviceType.CPU, DeviceType.MKLDNN, DeviceType.IDEEP]
+        else 0
+    )
+    return (
+        kineto_event.start_us() - trace_start_us,
+        kineto_event.start_thread_id(),
+        cpu_memory_usage,
+        nbytes,
+    )
+
+
+def _attribute_mem_records(mem_records, cpu_events) -> List[bool]:
+    """Adds the memory usage of the memory records starting within the time range of
+    every CPU event to the event, returns whether each record was attributed."""
+    usages, attributed = _mem_usage_in_ranges(
+        mem_records,
+        [evt.time_range.start for evt in cpu_events],
+        [evt.time_range.end for evt in cpu_events],
+    )
+    for function_event, usage in zip(cpu_events, usages):
+        if usage is not None:
+            function_event.cpu_memory_usage, function_event.musa_memory_usage = usage
+    return attributed
+
+
+def _mem_usage_in_ranges(mem_records, starts_us, ends_us):
+    """Sums the memory usage of the memory records starting within each time range.
+
+    With the records sorted by start time, the usage of a range is a difference of
+    prefix sums, and a sweep over the records counts the ranges covering each one.
+
+    Returns:
+    tuple: ((cpu_memory_usage, musa_memory_usage) of each range or None if no record
+    starts within it, whether each record starts within any range)
+    """
+    usages = [None] * len(starts_us)
+    if not mem_records:
+        return usages, []
+    order = sorted(range(len(mem_records)), key=lambda i: mem_records[i][0])
+    starts = [mem_records[i][0] for i in order]
+    cpu_prefix = list(
+        itertools.accumulate((mem_records[i][2] for i in order), initial=0)
+    )
+    musa_prefix = list(
+        itertools.accumulate((mem_records[i][3] for i in order), initial=0)
+    )
+    # number of ranges covering the records from each position on
+    coverage = [0] * (len(order) + 1)
+    for index, (start_us, end_us) in enumerate(zip(starts_us, ends_us)):
+        lo = bisect.bisect_left(starts, start_us)
+        hi = bisect.bisect_right(starts, end_us)
+        if lo < hi:
+            usages[index] = (
+                cpu_prefix[hi] - cpu_prefix[lo],
+                musa_prefix[hi] - musa_prefix[lo],
+            )
+            coverage[lo] += 1
+            coverage[hi] -= 1
+    attributed = [False] * len(order)
+    num_covering = 0
+    for pos, idx in enumerate(order):
+        num_covering += coverage[pos]
+        attributed[idx] = num_covering > 0
+    return usages, attributed
+
+
+# Called with the name and the duration in ns of every record_function range
+# exiting, without a profiler running, see `torch_musa.profiler.StepTimer`.
+_record_function_observers: List[Callable[[str, int], None]] = []
 
 
 # pylint: disable=C0103
@@ -537,11 +758,15 @@ class record_function(_ContextDecorator):
         self.record = torch.jit.annotate(
             Optional["torch.classes.profiler._RecordFunction"], None
         )
+        self.start_ns: int = 0
 
     def __enter__(self):
         self.record = torch.ops.profiler._record_function_enter_new(
             self.name, self.args
         )
+        if not torch.jit.is_scripting():
+            if _record_function_observers:
+                self.start_ns = time.perf_counter_ns()
         return self
 
     def __exit__(self, exc_type: Any, exc_value: Any, traceback: Any):
@@ -557,6 +782,10 @@ class record_function(_ContextDecorator):
         if not torch.jit.is_scripting():
             with torch._C.DisableTorchFunctionSubclass():
                 torch.ops.profiler._record_function_exit._RecordFunction(record)
+            if _record_function_observers and self.start_ns:
+                duration_ns = time.perf_counter_ns() - self.start_ns
+                for observer in _record_function_observers:
+                    observer(self.name, duration_ns)
         else:
             torch.ops.profiler._record_function_exit(record)
 
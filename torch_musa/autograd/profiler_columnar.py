@@ -0,0 +1,911 @@
+"""Columnar (struct of arrays) storage of profiler events.
+
+`ColumnarEventList` keeps the fields of all `FunctionEvent`s in NumPy arrays, with
+names, input shapes and stacks interned, so that building the event tree and
+summarizing millions of events are array operations instead of walks over Python
+objects. `FunctionEvent` views are only created for the events a caller indexes.
+"""
+
+# pylint: disable=protected-access
+
+import itertools
+from array import array
+from collections.abc import Sequence
+from typing import Dict, List, Optional
+
+try:
+    import numpy as np
+except ModuleNotFoundError:
+    np = None  # pylint: disable=invalid-name
+from torch.autograd import DeviceType
+
+from .profiler_util import (
+    _build_table,
+    EventList,
+    FunctionEvent,
+    FunctionEventAvg,
+    Interval,
+    Kernel,
+    TableSummary,
+)
+
+__all__ = ["ColumnarEventList"]
+
+_INT_COLUMNS = (
+    "id",
+    "node_id",
+    "thread",
+    "fwd_thread",  # -1 for None
+    "sequence_nr",
+    "device_index",
+    "scope",
+    "cpu_memory_usage",
+    "musa_memory_usage",
+    "flops",  # 0 for None
+)
+_TIME_COLUMNS = ("start", "end")
+# ids of interned values
+_ID_COLUMNS = ("name", "trace_name", "input_shapes", "stack", "device_type")
+_BOOL_COLUMNS = ("is_async", "is_remote", "is_legacy")
+
+# per event metrics, as the properties of FunctionEvent with the same names
+_METRICS = (
+    "cpu_time_total",
+    "musa_time_total",
+    "self_cpu_time_total",
+    "self_musa_time_total",
+    "cpu_memory_usage",
+    "musa_memory_usage",
+    "self_cpu_memory_usage",
+    "self_musa_memory_usage",
+    "flops",
+)
+
+_UNSET = object()
+_CHROME_TRACE_CHUNK = 4096
+
+
+def _check_numpy():
+    if np is None:
+        raise ModuleNotFoundError("columnar profiler events require numpy")
+
+
+class _Interner:
+    """Maps hashable keys to dense ids, keeping the first value seen for each key"""
+
+    def __init__(self):
+        self.ids: Dict = {}
+        self.values: List = []
+
+    def add(self, key, value=_UNSET):
+        idx = self.ids.get(key)
+        if idx is None:
+            idx = self.ids[key] = len(self.values)
+            self.values.append(key if value is _UNSET else value)
+        return idx
+
+    def __len__(self):
+        return len(self.values)
+
+
+def _group_sum(values, groups, num_groups):
+    """Sums values by group ids, keeping integer values integral"""
+    sums = np.bincount(groups, weights=values, minlength=num_groups)
+    if np.issubdtype(values.dtype, np.integer):
+        return np.rint(sums).astype(values.dtype)
+    return sums
+
+
+def _to_python(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+class _ColumnarFunctionEvent(FunctionEvent):
+    """A FunctionEvent view of one row of a ColumnarEventList.
+
+    Tree links, kernels and metrics are resolved from the columns when accessed,
+    assigning them detaches the view from the columns.
+    """
+
+    # pylint: disable=super-init-not-called
+    def __init__(self, events: "ColumnarEventList", index: int):
+        c = events.columns
+        self._events = events
+        self._index = index
+        self.id = int(c["id"][index])
+        self.node_id = int(c["node_id"][index])
+        self.name = events._names.values[c["name"][index]]
+        self.trace_name = events._names.values[c["trace_name"][index]]
+        self.time_range = Interval(c["start"][index].item(), c["end"][index].item())
+        self.thread = int(c["thread"][index])
+        fwd_thread = int(c["fwd_thread"][index])
+        self.fwd_thread = None if fwd_thread < 0 else fwd_thread
+        self.count = 1
+        self.input_shapes = events._shapes.values[c["input_shapes"][index]]
+        stack = events._stacks.values[c["stack"][index]]
+        self.stack = None if stack is None else list(stack)
+        self.scope = int(c["scope"][index])
+        self.cpu_memory_usage = int(c["cpu_memory_usage"][index])
+        self.musa_memory_usage = int(c["musa_memory_usage"][index])
+        self.is_async = bool(c["is_async"][index])
+        self.is_remote = bool(c["is_remote"][index])
+        self.sequence_nr = int(c["sequence_nr"][index])
+        self.device_type = events._device_types.values[c["device_type"][index]]
+        self.device_index = int(c["device_index"][index])
+        self.is_legacy = bool(c["is_legacy"][index])
+        self.flops = int(c["flops"][index])
+        self._cpu_parent = _UNSET
+        self._cpu_children = _UNSET
+        self._kernels = _UNSET
+
+    @property
+    def cpu_parent(self):
+        if self._cpu_parent is _UNSET:
+            parent = int(self._events.columns["parent"][self._index])
+            self._cpu_parent = None if parent < 0 else self._events[parent]
+        return self._cpu_parent
+
+    @cpu_parent.setter
+    def cpu_parent(self, value):
+        self._cpu_parent = value
+
+    @property
+    def cpu_children(self):
+        if self._cpu_children is _UNSET:
+            self._cpu_children = [
+                self._events[i] for i in self._events._children_of(self._index)
+            ]
+        return self._cpu_children
+
+    @cpu_children.setter
+    def cpu_children(self, value):
+        self._cpu_children = value
+
+    @property
+    def kernels(self):
+        if self._kernels is _UNSET:
+            self._kernels = self._events._kernels_of(self._index)
+        return self._kernels
+
+    @kernels.setter
+    def kernels(self, value):
+        self._kernels = value
+
+    def _metric(self, name):
+        return _to_python(self._events._metrics()[name][self._index])
+
+    @property
+    def self_cpu_memory_usage(self):
+        return self._metric("self_cpu_memory_usage")
+
+    @property
+    def self_musa_memory_usage(self):
+        return self._metric("self_musa_memory_usage")
+
+    @property
+    def self_cpu_time_total(self):
+        return self._metric("self_cpu_time_total")
+
+    @property
+    def musa_time_total(self):
+        return self._metric("musa_time_total")
+
+    @property
+    def self_musa_time_total(self):
+        return self._metric("self_musa_time_total")
+
+    @property
+    def cpu_time_total(self):
+        return self._metric("cpu_time_total")
+
+
+class _ColumnBuilder:
+    """Appends events row by row to typed arrays, so that the columns of a
+    ColumnarEventList are filled without creating a FunctionEvent per event"""
+
+    def __init__(self):
+        _check_numpy()
+        self.names, self.shapes, self.stacks, self.device_types = (
+            _Interner() for _ in range(4)
+        )
+        self.ints = {name: array("q") for name in _INT_COLUMNS + _ID_COLUMNS}
+        self.times = {name: array("d") for name in _TIME_COLUMNS}
+        self.bools = {name: array("b") for name in _BOOL_COLUMNS}
+        self.kernels = {name: array("q") for name in ("owner", "name", "device")}
+        self.kernel_durations = array("d")
+
+    def __len__(self):
+        return len(self.ints["id"])
+
+    # pylint: disable=C0103,redefined-builtin
+    def append(
+        self,
+        id,
+        name,
+        thread,
+        start_us,
+        end_us,
+        fwd_thread=None,
+        input_shapes=None,
+        stack=None,
+        scope=0,
+        cpu_memory_usage=0,
+        musa_memory_usage=0,
+        is_async=False,
+        is_remote=False,
+        sequence_nr=-1,
+        node_id=-1,
+        device_type=DeviceType.CPU,
+        device_index=0,
+        is_legacy=False,
+        flops=None,
+        trace_name=None,
+    ) -> int:
+        """Appends an event given by the arguments of FunctionEvent, returns its row"""
+        ints = self.ints
+        ints["id"].append(id)
+        ints["node_id"].append(node_id)
+        ints["thread"].append(thread)
+        ints["fwd_thread"].append(-1 if fwd_thread is None else fwd_thread)
+        ints["sequence_nr"].append(sequence_nr)
+        ints["device_index"].append(device_index)
+        ints["scope"].append(scope)
+        ints["cpu_memory_usage"].append(cpu_memory_usage)
+        ints["musa_memory_usage"].append(musa_memory_usage)
+        ints["flops"].append(flops or 0)
+        ints["name"].append(self.names.add(name))
+        ints["trace_name"].append(self.names.add(trace_name))
+        ints["input_shapes"].append(self.shapes.add(str(input_shapes), input_shapes))
+        ints["stack"].append(self.stacks.add(None if stack is None else tuple(stack)))
+        ints["device_type"].append(self.device_types.add(device_type))
+        self.times["start"].append(start_us)
+        self.times["end"].append(end_us)
+        self.bools["is_async"].append(is_async)
+        self.bools["is_remote"].append(is_remote)
+        self.bools["is_legacy"].append(is_legacy)
+        return len(ints["id"]) - 1
+
+    def append_kernel(self, owner: int, name: str, device: int, duration):
+        """Appends a kernel of the event at row owner"""
+        self.kernels["owner"].append(owner)
+        self.kernels["name"].append(self.names.add(name))
+        self.kernels["device"].append(device)
+        self.kernel_durations.append(duration)
+
+    def append_event(self, evt: FunctionEvent) -> int:
+        """Appends a FunctionEvent with its kernels, returns its row"""
+        index = self.append(
+            evt.id,
+            evt.name,
+            evt.thread,
+            evt.time_range.start,
+            evt.time_range.end,
+            fwd_thread=evt.fwd_thread,
+            input_shapes=evt.input_shapes,
+            stack=evt.stack,
+            scope=evt.scope,
+            cpu_memory_usage=evt.cpu_memory_usage,
+            musa_memory_usage=evt.musa_memory_usage,
+            is_async=evt.is_async,
+            is_remote=evt.is_remote,
+            sequence_nr=evt.sequence_nr,
+            node_id=evt.node_id,
+            device_type=evt.device_type,
+            device_index=evt.device_index,
+            is_legacy=evt.is_legacy,
+            flops=evt.flops,
+            trace_name=evt.trace_name,
+        )
+        for kernel in evt.kernels:
+            self.append_kernel(index, kernel.name, kernel.device, kernel.duration)
+        return index
+
+    def columns(self, sort=False):
+        """Returns (event columns, kernel columns) of the appended rows"""
+        columns = {
+            name: np.frombuffer(values, np.int64) for name, values in self.ints.items()
+        }
+        for name in _BOOL_COLUMNS:
+            columns[name] = np.frombuffer(self.bools[name], np.int8).astype(bool)
+        for name in _TIME_COLUMNS:
+            columns[name] = np.frombuffer(self.times[name], np.float64)
+        kernel_columns = {
+            name: np.frombuffer(values, np.int64)
+            for name, values in self.kernels.items()
+        }
+        kernel_columns["duration"] = np.frombuffer(self.kernel_durations, np.float64)
+        num_events = len(columns["id"])
+
+        if sort:
+            # stable, as sorting FunctionEvents by (start, -end)
+            order = np.lexsort((-columns["end"], columns["start"]))
+            columns = {name: values[order] for name, values in columns.items()}
+            new_index = np.empty_like(order)
+            new_index[order] = np.arange(num_events)
+            kernel_columns["owner"] = new_index[kernel_columns["owner"]]
+        # kernels of an event stay in append order
+        kernel_order = np.argsort(kernel_columns["owner"], kind="stable")
+        kernel_columns = {
+            name: values[kernel_order] for name, values in kernel_columns.items()
+        }
+
+        # keep integral timestamps integral, as in FunctionEvent
+        if all(np.array_equal(columns[n], np.trunc(columns[n])) for n in _TIME_COLUMNS):
+            for name in _TIME_COLUMNS:
+                columns[name] = columns[name].astype(np.int64)
+        columns["parent"] = np.full(num_events, -1, np.int64)
+        # events whose kernels are reported, which changes when duplicates are merged
+        columns["kernel_source"] = np.arange(num_events, dtype=np.int64)
+
+        if np.array_equal(
+            kernel_columns["duration"], np.trunc(kernel_columns["duration"])
+        ):
+            kernel_columns["duration"] = kernel_columns["duration"].astype(np.int64)
+        # kernels of event i are rows [offsets[i], offsets[i + 1])
+        kernel_columns["offsets"] = np.concatenate(
+            ([0], np.cumsum(np.bincount(kernel_columns["owner"], minlength=num_events)))
+        )
+        return columns, kernel_columns
+
+
+class ColumnarEventList(Sequence):
+    """A list of events stored column by column, with the interface of EventList.
+
+    Indexing or iterating creates `FunctionEvent` views, all the other operations run
+    on the columns.
+    """
+
+    def __init__(
+        self,
+        columns: Dict[str, "np.ndarray"],
+        kernel_columns: Dict[str, "np.ndarray"],
+        names: _Interner,
+        shapes: _Interner,
+        stacks: _Interner,
+        device_types: _Interner,
+        use_musa: bool = True,
+        profile_memory: bool = False,
+        with_flops: bool = False,
+    ):
+        _check_numpy()
+        self.columns = columns
+        self.kernel_columns = kernel_columns
+        self._names = names
+        self._shapes = shapes
+        self._stacks = stacks
+        self._device_types = device_types
+        self._use_musa = use_musa
+        self._profile_memory = profile_memory
+        self._with_flops = with_flops
+        self._tree_built = False
+        self._views: Dict[int, _ColumnarFunctionEvent] = {}
+        self._metrics_cache: Optional[Dict[str, "np.ndarray"]] = None
+        self._children_index = None
+
+    @classmethod
+    def from_events(
+        cls, events, use_musa=True, profile_memory=False, with_flops=False
+    ) -> "ColumnarEventList":
+        """Creates a columnar list from FunctionEvents, which may be a generator, so
+        that events are released as soon as they are stored"""
+        builder = _ColumnBuilder()
+        for evt in events:
+            builder.append_event(evt)
+        return cls.from_builder(
+            builder,
+            use_musa=use_musa,
+            profile_memory=profile_memory,
+            with_flops=with_flops,
+        )
+
+    @classmethod
+    def from_builder(
+        cls,
+        builder: "_ColumnBuilder",
+        sort=False,
+        use_musa=True,
+        profile_memory=False,
+        with_flops=False,
+    ) -> "ColumnarEventList":
+        """Creates a columnar list from the rows appended to builder, sorted by start
+        time and then by descending end time if sort is set"""
+        columns, kernel_columns = builder.columns(sort)
+        return cls(
+            columns,
+            kernel_columns,
+            builder.names,
+            builder.shapes,
+            builder.stacks,
+            builder.device_types,
+            use_musa=use_musa,
+            profile_memory=profile_memory,
+            with_flops=with_flops,
+        )
+
+    def __len__(self):
+        return len(self.columns["id"])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("event index out of range")
+        view = self._views.get(index)
+        if view is None:
+            view = self._views[index] = _ColumnarFunctionEvent(self, index)
+        return view
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __str__(self):
+        return self.table()
+
+    def _is_cpu(self):
+        cpu = self._device_types.ids.get(DeviceType.CPU, -1)
+        return self.columns["device_type"] == cpu
+
+    def _kernels_of(self, index):
+        source = int(self.columns["kernel_source"][index])
+        offsets = self.kernel_columns["offsets"]
+        begin, end = int(offsets[source]), int(offsets[source + 1])
+        names = self._names.values
+        return [
+            Kernel(names[name], device, duration)
+            for name, device, duration in zip(
+                self.kernel_columns["name"][begin:end].tolist(),
+                self.kernel_columns["device"][begin:end].tolist(),
+                self.kernel_columns["duration"][begin:end].tolist(),
+            )
+        ]
+
+    def _children_of(self, index):
+        if self._children_index is None:
+            parent = self.columns["parent"]
+            children = np.nonzero(parent >= 0)[0]
+            children = children[np.argsort(parent[children], kind="stable")]
+            offsets = np.searchsorted(parent[children], np.arange(len(self) + 1))
+            self._children_index = (children, offsets)
+        children, offsets = self._children_index
+        return children[offsets[index] : offsets[index + 1]].tolist()
+
+    def _build_tree(self):
+        """Links CPU events into trees, merges nested events of the same name and
+        propagates forward stacks to backward events, as EventList._build_tree"""
+        c = self.columns
+        num_events = len(self)
+        sync = self._is_cpu() & ~c["is_async"]
+        candidates = np.nonzero(sync)[0]
+        # parents come before their children in this order
+        order = candidates[
+            np.lexsort(
+                (
+                    -c["end"][candidates],
+                    c["start"][candidates],
+                    c["node_id"][candidates],
+                    c["thread"][candidates],
+                )
+            )
+        ].tolist()
+
+        parent = [-1] * num_events
+        starts, ends = c["start"].tolist(), c["end"].tolist()
+        threads, nodes = c["thread"].tolist(), c["node_id"].tolist()
+        current = None
+        stack: List[int] = []
+        for i in order:
+            if (threads[i], nodes[i]) != current:
+                current = (threads[i], nodes[i])
+                stack.clear()
+            while stack:
+                top = stack[-1]
+                if starts[i] >= ends[top] or ends[i] > ends[top]:
+                    stack.pop()
+                else:
+                    parent[i] = top
+                    break
+            stack.append(i)
+
+        # an only child with the name of its parent is merged into the parent, which
+        # takes its kernels and children
+        num_children = np.bincount(
+            np.array([p for p in parent if p >= 0], dtype=np.int64),
+            minlength=num_events,
+        ).tolist()
+        names = c["name"].tolist()
+        kernel_source = c["kernel_source"].tolist()
+        merged_into: Dict[int, int] = {}
+        for i in order:
+            p = parent[i]
+            if p < 0:
+                continue
+            # a merged parent was merged into an event which is not merged itself,
+            # since that one was visited before
+            p = parent[i] = merged_into.get(p, p)
+            if names[p] == names[i] and num_children[p] == 1:
+                num_children[p] = num_children[i]
+                kernel_source[p] = kernel_source[i]
+                merged_into[i] = p
+
+        keep = np.ones(num_events, dtype=bool)
+        keep[list(merged_into)] = False
+        new_index = np.cumsum(keep) - 1
+        parent_array = np.array(parent, dtype=np.int64)
+        parent_array = np.where(parent_array >= 0, new_index[parent_array], -1)
+        c["parent"] = parent_array
+        c["kernel_source"] = np.array(kernel_source, dtype=np.int64)
+        for name in list(c):
+            c[name] = c[name][keep]
+        self._views.clear()
+        self._metrics_cache = None
+        self._children_index = None
+
+        self._set_backward_stacktraces()
+        self._tree_built = True
+
+    def _levels(self):
+        """Returns event indices grouped by depth in the trees, roots first"""
+        parent = self.columns["parent"]
+        depth = np.zeros(len(self), dtype=np.int64)
+        ancestor = parent.copy()
+        while True:
+            has_ancestor = ancestor >= 0
+            if not has_ancestor.any():
+                break
+            depth += has_ancestor
+            ancestor[has_ancestor] = parent[ancestor[has_ancestor]]
+        by_depth = np.argsort(depth, kind="stable")
+        bounds = np.cumsum(np.bincount(depth))
+        return np.split(by_depth, bounds[:-1])
+
+    def _set_backward_stacktraces(self):
+        c = self.columns
+        parent = c["parent"]
+        # closest backward function (scope 1) among ancestors including self
+        bw_parent = np.where(c["scope"] == 1, np.arange(len(self)), -1)
+        for level in self._levels()[1:]:
+            inherit = level[bw_parent[level] < 0]
+            bw_parent[inherit] = bw_parent[parent[inherit]]
+
+        none_stack = self._stacks.ids.get(None, -1)
+        forward = np.nonzero((bw_parent < 0) & (c["stack"] != none_stack))[0]
+        backward = np.nonzero(bw_parent >= 0)[0]
+        if len(backward) == 0:
+            return
+        owners = bw_parent[backward]
+        keys = np.concatenate(
+            (
+                np.stack((c["sequence_nr"][forward], c["thread"][forward]), axis=1),
+                np.stack((c["sequence_nr"][owners], c["fwd_thread"][owners]), axis=1),
+            )
+        )
+        uniq, inverse = np.unique(keys, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        # the first forward stack of each (sequence_nr, thread)
+        key_stack = np.full(len(uniq), self._stacks.add(()), dtype=np.int64)
+        forward_keys, first = np.unique(inverse[: len(forward)], return_index=True)
+        key_stack[forward_keys] = c["stack"][forward][first]
+        c["stack"] = c["stack"].copy()
+        c["stack"][backward] = key_stack[inverse[len(forward) :]]
+
+    def _metrics(self) -> Dict[str, "np.ndarray"]:
+        """Computes metrics of all events from the current tree"""
+        if self._metrics_cache is not None:
+            return self._metrics_cache
+        c = self.columns
+        parent = c["parent"]
+        has_parent = parent >= 0
+        num_events = len(self)
+        is_cpu = self._is_cpu()
+        sync = is_cpu & ~c["is_async"]
+
+        def children_sum(values):
+            return _group_sum(values[has_parent], parent[has_parent], num_events)
+
+        elapsed = c["end"] - c["start"]
+        cpu_time_total = np.where(is_cpu, elapsed, 0)
+        self_cpu_time_total = np.where(
+            sync, cpu_time_total - children_sum(cpu_time_total), 0
+        )
+
+        kernel_durations = _group_sum(
+            self.kernel_columns["duration"],
+            self.kernel_columns["owner"],
+            len(self.kernel_columns["offsets"]) - 1,
+        )
+        # kernels of CPU events plus the ones of their children, except legacy events
+        musa_time_total = kernel_durations[c["kernel_source"]].astype(
+            np.result_type(kernel_durations, elapsed)
+        )
+        for level in reversed(self._levels()[1:]):
+            level = level[~c["is_legacy"][parent[level]]]
+            np.add.at(musa_time_total, parent[level], musa_time_total[level])
+        musa_time_total = np.where(is_cpu, musa_time_total, elapsed)
+        musa_time_total[c["is_async"]] = 0
+        self_musa_time_total = np.where(
+            is_cpu, musa_time_total - children_sum(musa_time_total), musa_time_total
+        )
+        self_musa_time_total[c["is_async"]] = 0
+
+        self._metrics_cache = {
+            "cpu_time_total": cpu_time_total,
+            "musa_time_total": musa_time_total,
+            "self_cpu_time_total": self_cpu_time_total,
+            "self_musa_time_total": self_musa_time_total,
+            "cpu_memory_usage": c["cpu_memory_usage"],
+            "musa_memory_usage": c["musa_memory_usage"],
+            "self_cpu_memory_usage": np.where(
+                sync, c["cpu_memory_usage"] - children_sum(c["cpu_memory_usage"]), 0
+            ),
+            "self_musa_memory_usage": np.where(
+                sync, c["musa_memory_usage"] - children_sum(c["musa_memory_usage"]), 0
+            ),
+            "flops": c["flops"],
+            "count": np.ones(num_events, dtype=np.int64),
+        }
+        self._metrics_cache["cpu_time"] = self._metrics_cache["cpu_time_total"]
+        self._metrics_cache["musa_time"] = self._metrics_cache["musa_time_total"]
+        return self._metrics_cache
+
+    def _metric(self, name):
+        metrics = self._metrics()
+        if name in metrics:
+            return metrics[name]
+        return np.array([getattr(evt, name) for evt in self])
+
+    @property
+    def self_cpu_time_total(self):
+        return _to_python(self._metrics()["self_cpu_time_total"].sum())
+
+    def _table_summary(self):
+        c = self.columns
+        metrics = self._metrics()
+        names = self._names.values
+        used_names = np.unique(c["name"])
+        used_shapes = np.unique(c["input_shapes"])
+        used_stacks = np.unique(c["stack"])
+        shapes = [self._shapes.values[i] for i in used_shapes.tolist()]
+        stack_entry_lens = [
+            len(entry)
+            for i in used_stacks.tolist()
+            if self._stacks.values[i] is not None
+            for entry in self._stacks.values[i]
+        ]
+        flops = c["flops"][c["flops"] > 0]
+        musa_events = ~self._is_cpu() | c["is_legacy"]
+        return TableSummary(
+            has_musa_time=bool((metrics["self_musa_time_total"] > 0).any()),
+            has_musa_mem=bool((metrics["self_musa_memory_usage"] > 0).any()),
+            has_input_shapes=any(s is not None and len(s) > 0 for s in shapes),
+            max_name_len=max(len(names[i]) for i in used_names.tolist()),
+            max_shapes_len=max(len(str(s)) for s in shapes),
+            max_stack_entry_len=max(stack_entry_lens) if stack_entry_lens else None,
+            min_flops=_to_python(flops.min()) if len(flops) > 0 else None,
+            append_node_id=bool((c["node_id"] != -1).any()),
+            sum_self_cpu_time_total=_to_python(metrics["self_cpu_time_total"].sum()),
+            sum_self_musa_time_total=_to_python(
+                metrics["self_musa_time_total"][musa_events].sum()
+            ),
+        )
+
+    def table(
+        self,
+        sort_by=None,
+        row_limit=100,
+        max_src_column_width=75,
+        max_name_column_width=55,
+        max_shapes_column_width=80,
+        header=None,
+        top_level_events_only=False,
+    ):
+        """Prints the list as a nicely formatted table, as EventList.table.
+
+        Rows are selected and sorted on the columns, only printed rows are turned into
+        events.
+        """
+        if len(self) == 0:
+            return ""
+        rows = np.arange(len(self))
+        if sort_by is not None:
+            rows = np.argsort(-self._metric(sort_by), kind="stable")
+        if top_level_events_only:
+            rows = rows[self.columns["parent"][rows] < 0]
+        if row_limit >= 0:
+            rows = rows[:row_limit]
+        return _build_table(
+            [self[i] for i in rows.tolist()],
+            row_limit=row_limit,
+            max_src_column_width=max_src_column_width,
+            max_name_column_width=max_name_column_width,
+            max_shapes_column_width=max_shapes_column_width,
+            header=header,
+            profile_memory=self._profile_memory,
+            with_flops=self._with_flops,
+            top_level_events_only=top_level_events_only,
+            summary=self._table_summary(),
+        )
+
+    def _chrome_trace_events(self):
+        c = self.columns
+        names = self._names.values
+        offsets = self.kernel_columns["offsets"]
+        num_kernels = (offsets[1:] - offsets[:-1])[c["kernel_source"]]
+        rows = np.nonzero(c["trace_name"] != self._names.ids.get(None, -1))[0]
+        next_id = 0
+        for trace_name, start, end, thread, is_remote, node_id, kernels in zip(
+            c["trace_name"][rows].tolist(),
+            c["start"][rows].tolist(),
+            c["end"][rows].tolist(),
+            c["thread"][rows].tolist(),
+            c["is_remote"][rows].tolist(),
+            c["node_id"][rows].tolist(),
+            num_kernels[rows].tolist(),
+        ):
+            trace_name = names[trace_name]
+            yield (
+                '{"name": "%s", '
+                '"ph": "X", '
+                '"ts": %s, '
+                '"dur": %s, '
+                '"tid": %s, '
+                '"pid": "CPU functions", '
+                '"args": {}}'
+                % (
+                    trace_name,
+                    start,
+                    end - start,
+                    (
+                        thread
+                        if not is_remote
+                        else f'" node_id:{node_id}, thread_id:{thread} "'
+                    ),
+                )
+            )
+            for _ in range(kernels):
+                # 's' and 'f' draw Flow arrows from
+                # the CPU launch to the GPU kernel
+                yield (
+                    '{"name": "%s", '
+                    '"ph": "s", '
+                    '"ts": %s, '
+                    '"tid": %s, '
+                    '"pid": "CPU functions", '
+                    '"id": %s, '
+                    '"cat": "cpu_to_musa", '
+                    '"args": {}}' % (trace_name, start, thread, next_id)
+                )
+                next_id += 1
+
+    def export_chrome_trace(self, path):
+        """Exports the list as a Chrome tracing tools file, as EventList.export_chrome_trace"""
+        events = self._chrome_trace_events()
+        with open(path, "w", encoding="UTF-8") as f:
+            f.write("[")
+            separator = ""
+            while True:
+                chunk = list(itertools.islice(events, _CHROME_TRACE_CHUNK))
+                if not chunk:
+                    break
+                f.write(separator)
+                f.write(", ".join(chunk))
+                separator = ", "
+            f.write("]")
+
+    def supported_export_stacks_metrics(self):
+        return ["self_cpu_time_total", "self_musa_time_total"]
+
+    def export_stacks(self, path: str, metric: str):
+        """Exports stacks, as EventList.export_stacks"""
+        if metric not in self.supported_export_stacks_metrics():
+            raise ValueError(
+                "metric should be one of: "
+                + str(self.supported_export_stacks_metrics())
+            )
+        values = self._metrics()[metric].astype(np.int64)
+        stack_ids = self.columns["stack"]
+        non_empty = np.array([bool(s) for s in self._stacks.values], dtype=bool)
+        rows = np.nonzero(non_empty[stack_ids] & (values > 0))[0]
+        translate_table = str.maketrans(" ;\t\n", "____")
+        folded: Dict[int, str] = {}
+        with open(path, "w", encoding="UTF-8") as f:
+            for stack_id, value in zip(stack_ids[rows].tolist(), values[rows].tolist()):
+                stack_str = folded.get(stack_id)
+                if stack_str is None:
+                    stack_str = folded[stack_id] = ";".join(
+                        entry.translate(translate_table)
+                        for entry in reversed(self._stacks.values[stack_id])
+                    )
+                f.write(f"{stack_str} {value}\n")
+
+    def _fill_average(self, avg: FunctionEventAvg, index: int):
+        """Sets the fields FunctionEventAvg.add takes from the event at index"""
+        evt = self[index]
+        avg.key = evt.key
+        avg.node_id = evt.node_id
+        avg.is_async = evt.is_async
+        avg.is_remote = evt.is_remote
+        avg.cpu_parent = evt.cpu_parent
+        avg.cpu_children = evt.cpu_children
+        avg.input_shapes = evt.input_shapes
+        avg.stack = evt.stack
+        avg.scope = evt.scope
+        avg.device_type = evt.device_type
+        avg.is_legacy = evt.is_legacy
+
+    def key_averages(self, group_by_input_shapes=False, group_by_stack_n=0):
+        """Averages all function events over their keys, as EventList.key_averages.
+
+        Returns:
+            An EventList containing FunctionEventAvg objects.
+        """
+        assert self._tree_built
+        c = self.columns
+        avg_list = EventList(
+            use_musa=self._use_musa,
+            profile_memory=self._profile_memory,
+            with_flops=self._with_flops,
+        )
+        if len(self) == 0:
+            return avg_list
+        keys = [c["name"], c["node_id"], c["device_type"], c["is_legacy"]]
+        if group_by_input_shapes:
+            keys.append(c["input_shapes"])
+        if group_by_stack_n > 0:
+            prefixes = _Interner()
+            prefix_ids = np.array(
+                [
+                    prefixes.add(tuple((stack or ())[:group_by_stack_n]))
+                    for stack in self._stacks.values
+                ],
+                dtype=np.int64,
+            )
+            keys.append(prefix_ids[c["stack"]])
+        _, first, groups = np.unique(
+            np.stack(keys, axis=1).astype(np.int64),
+            axis=0,
+            return_index=True,
+            return_inverse=True,
+        )
+        # number groups in the order of their first events
+        rank = np.argsort(first, kind="stable")
+        renumber = np.empty_like(rank)
+        renumber[rank] = np.arange(len(rank))
+        groups = renumber[groups.reshape(-1)]
+        first = first[rank]
+
+        metrics = self._metrics()
+        sums = {
+            name: _group_sum(metrics[name], groups, len(first)) for name in _METRICS
+        }
+        counts = np.bincount(groups, minlength=len(first))
+        for group, index in enumerate(first.tolist()):
+            avg = FunctionEventAvg()
+            self._fill_average(avg, index)
+            for name in _METRICS:
+                setattr(avg, name, _to_python(sums[name][group]))
+            avg.count = int(counts[group])
+            avg.stack = avg.stack[:group_by_stack_n]
+            if not group_by_input_shapes:
+                avg.input_shapes = ""
+            avg_list.append(avg)
+        return avg_list
+
+    def total_average(self):
+        """Averages all events, as EventList.total_average.
+
+        Returns:
+            A FunctionEventAvg object.
+        """
+        total_stat = FunctionEventAvg()
+        if len(self) > 0:
+            # EventList.total_average ends with the fields of the last event
+            self._fill_average(total_stat, len(self) - 1)
+            metrics = self._metrics()
+            for name in _METRICS:
+                setattr(total_stat, name, _to_python(metrics[name].sum()))
+            total_stat.count = len(self)
+        total_stat.key = "Total"
+        return total_stat
@@ -0,0 +1,507 @@
+"""Running per-op statistics over many profiler cycles.
+
+`RunningKeyAverages` folds the events of every profiler cycle into per-key totals,
+as `key_averages()` computes them for one cycle, plus a quantile sketch of the
+latency of single calls, so that op-level statistics over a whole training run are
+kept in constant memory instead of keeping all traces. Aggregates are saved as JSON
+and merge by addition, so aggregates of different ranks or runs combine exactly.
+"""
+
+# pylint: disable=protected-access
+
+import json
+import math
+import os
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence
+
+try:
+    import numpy as np
+except ModuleNotFoundError:
+    np = None  # pylint: disable=invalid-name
+from torch.autograd import DeviceType
+
+from .profiler_columnar import ColumnarEventList
+from .profiler_util import _format_time, EventList, FunctionEventAvg
+
+__all__ = ["QuantileSketch", "RunningKeyAverages"]
+
+_FORMAT_VERSION = 1
+
+# fields of FunctionEventAvg which are summed over cycles
+_SUM_FIELDS = (
+    "count",
+    "cpu_time_total",
+    "musa_time_total",
+    "self_cpu_time_total",
+    "self_musa_time_total",
+    "cpu_memory_usage",
+    "musa_memory_usage",
+    "self_cpu_memory_usage",
+    "self_musa_memory_usage",
+    "flops",
+)
+
+# fields of FunctionEventAvg taken from the first average of a key
+_KEY_FIELDS = ("node_id", "is_async", "is_remote", "scope", "is_legacy")
+
+# latency of single calls kept in sketches
+_SKETCH_METRICS = ("cpu_time", "musa_time")
+
+
+class QuantileSketch:
+    """Mergeable quantile sketch of non-negative values (DDSketch).
+
+    Positive values are counted in logarithmic bins, so that any quantile is
+    estimated within `relative_accuracy` of the exact value, whatever the range of
+    the values. Merging two sketches sums their bins, which gives the same sketch
+    as adding all values to one. When there are more than `max_bins` bins, the
+    lowest ones are collapsed, which only affects the accuracy of low quantiles.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, max_bins: int = 2048):
+        if np is None:
+            raise ModuleNotFoundError("QuantileSketch requires numpy")
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be in (0, 1)")
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, values, weights=None):
+        """Adds a value or an array of values, each one counted weights times"""
+        values = np.asarray(values, dtype=np.float64).reshape(-1)
+        if len(values) == 0:
+            return
+        weights = (
+            np.ones(len(values), dtype=np.int64)
+            if weights is None
+            else np.broadcast_to(np.asarray(weights, dtype=np.int64), values.shape)
+        )
+        if (values < 0).any():
+            raise ValueError("QuantileSketch only accepts non-negative values")
+        positive = values > 0
+        self.zero_count += int(weights[~positive].sum())
+        if positive.any():
+            indices = np.ceil(np.log(values[positive]) / self._log_gamma).astype(
+                np.int64
+            )
+            unique, inverse = np.unique(indices, return_inverse=True)
+            counts = np.bincount(inverse.reshape(-1), weights=weights[positive])
+            counts = np.rint(counts).astype(np.int64)
+            for index, count in zip(unique.tolist(), counts.tolist()):
+                self.bins[index] = self.bins.get(index, 0) + count
+            self._collapse()
+        self.count += int(weights.sum())
+        self.sum += float(np.dot(values, weights))
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+    def _collapse(self):
+        if len(self.bins) <= self.max_bins:
+            return
+        indices = sorted(self.bins)
+        num_collapsed = len(indices) - self.max_bins + 1
+        collapsed = sum(self.bins.pop(i) for i in indices[: num_collapsed - 1])
+        self.bins[indices[num_collapsed - 1]] += collapsed
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        """Adds the values of other, which must have the same accuracy"""
+        if not math.isclose(self.gamma, other.gamma):
+            raise ValueError(
+                "Cannot merge sketches of relative accuracy "
+                f"{self.relative_accuracy} and {other.relative_accuracy}"
+            )
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        self._collapse()
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def quantile(self, prob: float) -> Optional[float]:
+        """Returns the estimated prob-quantile, None if no value was added"""
+        if not 0 <= prob <= 1:
+            raise ValueError("prob must be in [0, 1]")
+        if self.count == 0:
+            return None
+        rank = prob * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+        cumulative = self.zero_count
+        for index in sorted(self.bins):
+            cumulative += self.bins[index]
+            if cumulative > rank:
+                value = 2 * self.gamma**index / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    @property
+    def mean(self) -> Optional[float]:
+        return None if self.count == 0 else self.sum / self.count
+
+    def to_dict(self) -> Dict:
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "max_bins": self.max_bins,
+            "zero_count": self.zero_count,
+            "count": self.count,
+            "sum": self.sum,
+            "min": None if self.count == 0 else self.min,
+            "max": None if self.count == 0 else self.max,
+            "bins": sorted(self.bins.items()),
+        }
+
+    @classmethod
+    def from_dict(cls, state: Dict) -> "QuantileSketch":
+        """Creates a sketch from the result of `to_dict`"""
+        sketch = cls(state["relative_accuracy"], state["max_bins"])
+        sketch.bins = {int(index): int(count) for index, count in state["bins"]}
+        sketch.zero_count = state["zero_count"]
+        sketch.count = state["count"]
+        sketch.sum = state["sum"]
+        if sketch.count > 0:
+            sketch.min = state["min"]
+            sketch.max = state["max"]
+        return sketch
+
+
+def _parse_device_type(name: str) -> DeviceType:
+    return getattr(DeviceType, name.split(".")[-1])
+
+
+class RunningKeyAverages:
+    """Accumulates per-key statistics of profiled events over profiler cycles.
+
+    For every event key (the event name), the sums of `FunctionEventAvg`, i.e. the
+    call count, total and self times and memory usages, are accumulated, together
+    with `QuantileSketch`es of the CPU and MUSA time of single calls. The aggregate
+    only grows with the number of distinct keys, not with the number of cycles.
+
+    An instance can be passed as `on_trace_ready` of `torch.profiler.profile`, also
+    with `async_trace_ready=True`, to fold in the events of every cycle::
+
+        running = RunningKeyAverages()
+        with torch.profiler.profile(schedule=..., on_trace_ready=running) as prof:
+            ...
+        print(running.table(sort_by="cpu_time_total"))
+        running.save(f"ops_rank{rank}.json")
+
+    and the files of all ranks merge into one aggregate::
+
+        total = RunningKeyAverages()
+        for path in paths:
+            total.merge(RunningKeyAverages.load(path))
+
+    Args:
+        relative_accuracy (float): relative accuracy of the quantile sketches.
+        max_bins (int): maximum number of bins of each quantile sketch.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, max_bins: int = 2048):
+        if np is None:
+            raise ModuleNotFoundError("RunningKeyAverages requires numpy")
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.num_cycles = 0
+        self._averages: Dict[str, FunctionEventAvg] = {}
+        self._sketches: Dict[str, Dict[str, QuantileSketch]] = {}
+        # cycles may be folded in by the thread running async trace handlers
+        self._lock = threading.Lock()
+
+    def __call__(self, prof):
+        """Trace handler folding in the events of the cycle prof just finished"""
+        self.update(prof.events())
+
+    def __len__(self):
+        return len(self._averages)
+
+    def __contains__(self, key):
+        return key in self._averages
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            return list(self._averages)
+
+    def _new_sketch(self) -> QuantileSketch:
+        return QuantileSketch(self.relative_accuracy, self.max_bins)
+
+    def _average(self, key: str, **fields) -> FunctionEventAvg:
+        avg = self._averages.get(key)
+        if avg is None:
+            # only the sums are kept, no reference to the events of a cycle
+            avg = self._averages[key] = FunctionEventAvg()
+            avg.key = key
+            avg.input_shapes = ""
+            avg.stack = []
+            for name, value in fields.items():
+                setattr(avg, name, value)
+            self._sketches[key] = {name: self._new_sketch() for name in _SKETCH_METRICS}
+        return avg
+
+    def _add_average(self, other: FunctionEventAvg):
+        avg = self._average(
+            other.key,
+            **{name: getattr(other, name) for name in _KEY_FIELDS},
+            device_type=other.device_type,
+        )
+        for name in _SUM_FIELDS:
+            setattr(avg, name, getattr(avg, name) + (getattr(other, name) or 0))
+
+    def update(self, events: Sequence):
+        """Folds in one profiler cycle.
+
+        Args:
+            events: an `EventList` or `ColumnarEventList` of the events of the cycle,
+                or the `key_averages()` of the cycle. Averages carry no latency of
+                single calls, so the mean latency of each average is added to the
+                sketches as many times as its count instead.
+        """
+        if len(events) > 0 and isinstance(events[0], FunctionEventAvg):
+            averages = events
+            latencies = self._average_latencies(events)
+        else:
+            averages = events.key_averages()
+            if isinstance(events, ColumnarEventList):
+                latencies = self._columnar_latencies(events)
+            else:
+                latencies = self._event_latencies(events)
+        with self._lock:
+            for avg in averages:
+                self._add_average(avg)
+            for (key, name), (values, weights) in latencies.items():
+                self._sketches[key][name].add(values, weights)
+            self.num_cycles += 1
+
+    @staticmethod
+    def _average_latencies(averages: Iterable[FunctionEventAvg]):
+        latencies = {}
+        for avg in averages:
+            if avg.count == 0:
+                continue
+            if avg.device_type == DeviceType.CPU:
+                latencies[avg.key, "cpu_time"] = (avg.cpu_time, avg.count)
+            if avg.musa_time_total > 0:
+                latencies[avg.key, "musa_time"] = (avg.musa_time, avg.count)
+        return latencies
+
+    @staticmethod
+    def _event_latencies(events: EventList):
+        values = defaultdict(list)
+        for evt in events:
+            if evt.device_type == DeviceType.CPU:
+                values[evt.key, "cpu_time"].append(evt.cpu_time_total)
+            musa_time = evt.musa_time_total
+            if musa_time > 0:
+                values[evt.key, "musa_time"].append(musa_time)
+        return {key: (times, None) for key, times in values.items()}
+
+    @staticmethod
+    def _columnar_latencies(events: ColumnarEventList):
+        latencies = {}
+        metrics = events._metrics()
+        names = events.columns["name"]
+        selections = {
+            "cpu_time": events._is_cpu(),
+            "musa_time": metrics["musa_time_total"] > 0,
+        }
+        for metric, selected in selections.items():
+            indices = np.flatnonzero(selected)
+            if len(indices) == 0:
+                continue
+            # group the selected events by name
+            indices = indices[np.argsort(names[indices], kind="stable")]
+            sorted_names = names[indices]
+            starts = np.flatnonzero(np.diff(sorted_names, prepend=-1))
+            values = metrics[metric + "_total"][indices]
+            for name_id, times in zip(
+                sorted_names[starts].tolist(), np.split(values, starts[1:])
+            ):
+                latencies[events._names.values[name_id], metric] = (times, None)
+        return latencies
+
+    def merge(self, other: "RunningKeyAverages") -> "RunningKeyAverages":
+        """Adds the statistics of other, e.g. the ones of another rank"""
+        if other is self:
+            raise ValueError("Cannot merge RunningKeyAverages with itself")
+        with other._lock:
+            averages = list(other._averages.values())
+            sketches = {
+                key: {
+                    name: QuantileSketch.from_dict(s.to_dict()) for name, s in d.items()
+                }
+                for key, d in other._sketches.items()
+            }
+            num_cycles = other.num_cycles
+        with self._lock:
+            for avg in averages:
+                self._add_average(avg)
+                for name, sketch in sketches[avg.key].items():
+                    self._sketches[avg.key][name].merge(sketch)
+            self.num_cycles += num_cycles
+        return self
+
+    def reset(self):
+        with self._lock:
+            self.num_cycles = 0
+            self._averages.clear()
+            self._sketches.clear()
+
+    def quantile(
+        self, key: str, prob: float, metric: str = "cpu_time"
+    ) -> Optional[float]:
+        """Returns the estimated prob-quantile of the time of single calls of key, in us.
+
+        Args:
+            key: key of the events, i.e. their name.
+            prob (float): quantile to estimate, in [0, 1].
+            metric (str): "cpu_time" or "musa_time".
+        """
+        if metric not in _SKETCH_METRICS:
+            raise ValueError(f"metric must be one of {_SKETCH_METRICS}, got {metric}")
+        with self._lock:
+            if key not in self._sketches:
+                raise KeyError(key)
+            return self._sketches[key][metric].quantile(prob)
+
+    def key_averages(self) -> EventList:
+        """Returns the accumulated sums as an EventList of FunctionEventAvg objects,
+        which prints with `table()` like the `key_averages()` of one cycle"""
+        with self._lock:
+            averages = []
+            for avg in self._averages.values():
+                copy = FunctionEventAvg()
+                copy.__dict__.update(avg.__dict__)
+                averages.append(copy)
+        has_musa = any(avg.musa_time_total > 0 for avg in averages)
+        has_memory = any(
+            avg.cpu_memory_usage != 0 or avg.musa_memory_usage != 0 for avg in averages
+        )
+        return EventList(
+            averages,
+            use_musa=has_musa,
+            profile_memory=has_memory,
+            with_flops=any(avg.flops for avg in averages),
+        )
+
+    def table(
+        self,
+        sort_by: Optional[str] = "cpu_time_total",
+        row_limit: int = 100,
+        quantiles: Sequence[float] = (0.5, 0.9, 0.99),
+        max_name_column_width: int = 55,
+    ) -> str:
+        """Prints call counts, mean times and latency quantiles of every key.
+
+        Args:
+            sort_by (str, optional): attribute of FunctionEventAvg to sort rows by,
+                in descending order.
+            row_limit (int): maximum number of rows, -1 for all of them.
+            quantiles (sequence of float): quantiles of single call times to print.
+            max_name_column_width (int): names longer than it are truncated.
+        """
+        averages = list(self.key_averages())
+        if sort_by is not None:
+            averages.sort(key=lambda avg: getattr(avg, sort_by), reverse=True)
+        if row_limit >= 0:
+            averages = averages[:row_limit]
+        with self._lock:
+            sketches = {avg.key: self._sketches[avg.key] for avg in averages}
+        name_width = max([len("Name")] + [len(avg.key) for avg in averages])
+        name_width = min(name_width, max_name_column_width)
+        headers = ["Name", "# of Calls"]
+        for label in ("CPU", "MUSA"):
+            headers.append(f"{label} total")
+            headers.append(f"{label} avg")
+            headers += [f"{label} p{prob * 100:g}" for prob in quantiles]
+        widths = [name_width, 12] + [12] * (len(headers) - 2)
+
+        def format_row(cells):
+            return "  ".join(
+                cell.ljust(width) if i == 0 else cell.rjust(width)
+                for i, (cell, width) in enumerate(zip(cells, widths))
+            )
+
+        lines = [format_row(headers), "-" * len(format_row(headers))]
+        for avg in averages:
+            name = avg.key
+            if len(name) > name_width:
+                name = name[: name_width - 3] + "..."
+            cells = [name, str(avg.count)]
+            for metric in _SKETCH_METRICS:
+                sketch = sketches[avg.key][metric]
+                cells.append(_format_time(getattr(avg, metric + "_total")))
+                cells.append(_format_time(getattr(avg, metric)))
+                for prob in quantiles:
+                    value = sketch.quantile(prob)
+                    cells.append("" if value is None else _format_time(value))
+            lines.append(format_row(cells))
+        lines.append(f"Cycles: {self.num_cycles}")
+        return "\n".join(lines)
+
+    def state_dict(self) -> Dict:
+        with self._lock:
+            return {
+                "version": _FORMAT_VERSION,
+                "relative_accuracy": self.relative_accuracy,
+                "max_bins": self.max_bins,
+                "num_cycles": self.num_cycles,
+                "keys": [
+                    {
+                        "key": key,
+                        **{name: getattr(avg, name) for name in _KEY_FIELDS},
+                        "device_type": str(avg.device_type),
+                        **{name: getattr(avg, name) for name in _SUM_FIELDS},
+                        "sketches": {
+                            name: sketch.to_dict()
+                            for name, sketch in self._sketches[key].items()
+                        },
+                    }
+                    for key, avg in self._averages.items()
+                ],
+            }
+
+    @classmethod
+    def from_state_dict(cls, state: Dict) -> "RunningKeyAverages":
+        """Creates running averages from the result of `state_dict`"""
+        if state.get("version") != _FORMAT_VERSION:
+            raise ValueError(
+                f"Unsupported RunningKeyAverages version {state.get('version')}"
+            )
+        running = cls(state["relative_accuracy"], state["max_bins"])
+        running.num_cycles = state["num_cycles"]
+        for entry in state["keys"]:
+            avg = running._average(
+                entry["key"],
+                **{name: entry[name] for name in _KEY_FIELDS},
+                device_type=_parse_device_type(entry["device_type"]),
+            )
+            for name in _SUM_FIELDS:
+                setattr(avg, name, entry[name])
+            for name, sketch in entry["sketches"].items():
+                running._sketches[avg.key][name] = QuantileSketch.from_dict(sketch)
+        return running
+
+    def save(self, path: str):
+        """Saves the aggregate as JSON, replacing path atomically"""
+        state = self.state_dict()
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "RunningKeyAverages":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_state_dict(json.load(f))
@@ -46,25 +46,30 @@ class EventList(list):
         return self.table()
 
     def _remove_dup_nodes(self):
-        while True:
-            to_delete = set()
-            # pylint: disable=C0200
-            for idx in range(len(self)):
-                if (
-                        self[idx].cpu_parent is not None
-                        and self[idx].cpu_parent.name == self[idx].name
-                        and len(self[idx].cpu_parent.cpu_children) == 1
-                ):
-                    self[idx].cpu_parent.cpu_children = self[idx].cpu_children
-                    self[idx].cpu_parent.kernels = self[idx].kernels  # lift kernels up
-                    for child in self[idx].cpu_children:
-                        child.cpu_parent = self[idx].cpu_parent
-                    to_delete.add(idx)
-            if len(to_delete) == 0:
-                break
-            new_evts = [ev for ind, ev in enumerate(self) if ind not in to_delete]
+        """Merges every event which is the only child of a parent of the same name
+        into that parent, which takes over its kernels and children.
+
+        One scan in any order of the list suffices: a merged event hands its children
+        over to a parent of the same name with as many children, so that no event
+        which has been kept could be merged after a later merge.
+        """
+        kept = []
+        for evt in self:
+            parent = evt.cpu_parent
+            if (
+                    parent is not None
+                    and parent.name == evt.name
+                    and len(parent.cpu_children) == 1
+            ):
+                parent.cpu_children = evt.cpu_children
+                parent.kernels = evt.kernels  # lift kernels up
+                for child in evt.cpu_children:
+                    child.cpu_parent = parent
+            else:
+                kept.append(evt)
+        if len(kept) != len(self):
             self.clear()
-            self.extend(new_evts)
+            self.extend(kept)
 
     def _populate_cpu_children(self):
         """Populates child events into each underlying FunctionEvent object.
@@ -704,9 +709,9 @@ MEMORY_EVENT_NAME = "[memory]"
 OUT_OF_MEMORY_EVENT_NAME = "[OutOfMemory]"
 
 
-def _filter_name(name):
-    # ignoring the following utility ops
-    filtered_out_names = [
+# ignoring the following utility ops
+_FILTERED_OUT_NAMES = frozenset(
+    [
         MEMORY_EVENT_NAME,  # used only for the top-level memory events
         OUT_OF_MEMORY_EVENT_NAME,
         "profiler::_record_function_enter",
@@ -716,7 +721,11 @@ def _filter_name(name):
         "aten::output_nr",
         "aten::_version",
     ]
-    return name in filtered_out_names
+)
+
+
+def _filter_name(name):
+    return name in _FILTERED_OUT_NAMES
 
 
 # Demangles and optionally rewrites the provided event name,
@@ -732,6 +741,56 @@ def _rewrite_name(name, with_wildcard=False):
     return name
 
 
+# Properties of a whole event list needed to lay out its table, which lets a
+# columnar event list print only its selected rows
+TableSummary = namedtuple(
+    "TableSummary",
+    [
+        "has_musa_time",
+        "has_musa_mem",
+        "has_input_shapes",
+        "max_name_len",
+        "max_shapes_len",
+        "max_stack_entry_len",  # None if no event has a stack
+        "min_flops",  # None if no event has positive flops
+        "append_node_id",
+        "sum_self_cpu_time_total",
+        "sum_self_musa_time_total",
+    ],
+)
+
+
+def _summarize_events(events):
+    stack_entry_lens = [
+        len(entry) for evt in events if evt.stack is not None for entry in evt.stack
+    ]
+    positive_flops = [evt.flops for evt in events if evt.flops is not None and evt.flops > 0]
+    sum_self_musa_time_total = 0
+    for evt in events:
+        if evt.device_type == DeviceType.CPU:
+            # in legacy profiler, kernel info is stored in cpu events
+            if evt.is_legacy:
+                sum_self_musa_time_total += evt.self_musa_time_total
+        else:
+            # in kineto profiler, there're events with the correct device type (e.g. MUSA)
+            sum_self_musa_time_total += evt.self_musa_time_total
+    return TableSummary(
+        has_musa_time=any(event.self_musa_time_total > 0 for event in events),
+        has_musa_mem=any(event.self_musa_memory_usage > 0 for event in events),
+        has_input_shapes=any(
+            (event.input_shapes is not None and len(event.input_shapes) > 0)
+            for event in events
+        ),
+        max_name_len=max(len(evt.key) for evt in events),
+        max_shapes_len=max(len(str(evt.input_shapes)) for evt in events),
+        max_stack_entry_len=max(stack_entry_lens) if stack_entry_lens else None,
+        min_flops=min(positive_flops) if positive_flops else None,
+        append_node_id=any(evt.node_id != -1 for evt in events),
+        sum_self_cpu_time_total=sum(event.self_cpu_time_total for event in events),
+        sum_self_musa_time_total=sum_self_musa_time_total,
+    )
+
+
 def _build_table(
         events,
         sort_by=None,
@@ -743,17 +802,21 @@ def _build_table(
         with_flops=False,
         profile_memory=False,
         top_level_events_only=False,
+        summary=None,
 ):
-    """Prints a summary of events (which can be a list of FunctionEvent or FunctionEventAvg)."""
+    """Prints a summary of events (which can be a list of FunctionEvent or FunctionEventAvg).
+
+    If summary is given, it describes the whole event list, of which events are the rows
+    to print in order.
+    """
     if len(events) == 0:
         return ""
 
-    has_musa_time = any(event.self_musa_time_total > 0 for event in events)
-    has_musa_mem = any(event.self_musa_memory_usage > 0 for event in events)
-    has_input_shapes = any(
-            (event.input_shapes is not None and len(event.input_shapes) > 0)
-            for event in events
-    )
+    if summary is None:
+        summary = _summarize_events(events)
+    has_musa_time = summary.has_musa_time
+    has_musa_mem = summary.has_musa_mem
+    has_input_shapes = summary.has_input_shapes
 
     if sort_by is not None:
         events = EventList(
@@ -763,11 +826,11 @@ def _build_table(
             with_flops=with_flops,
         )
 
-    name_column_width = max(len(evt.key) for evt in events) + 4
+    name_column_width = summary.max_name_len + 4
     if max_name_column_width is not None:
         name_column_width = min(name_column_width, max_name_column_width)
 
-    shapes_column_width = max(len(str(evt.input_shapes)) for evt in events) + 4
+    shapes_column_width = summary.max_shapes_len + 4
     if max_shapes_column_width is not None:
         shapes_column_width = min(shapes_column_width, max_shapes_column_width)
 
@@ -775,15 +838,9 @@ def _build_table(
     flops_column_width = default_column_width
 
     src_column_width = None
-    stacks = []
-    for evt in events:
-        if evt.stack is not None and len(evt.stack) > 0:
-            stacks.append(evt.stack)
-    has_stack = len(stacks) > 0
+    has_stack = summary.max_stack_entry_len is not None
     if has_stack:
-        src_column_width = (
-                max(max(len(entry) for entry in stack) for stack in stacks) + 4
-        )
+        src_column_width = summary.max_stack_entry_len + 4
         if max_src_column_width is not None:
             src_column_width = min(src_column_width, max_src_column_width)
 
@@ -820,7 +877,7 @@ def _build_table(
             )
     headers.append("# of Calls")
     # Only append Node ID if any event has a valid (>= 0) Node ID
-    append_node_id = any(evt.node_id != -1 for evt in events)
+    append_node_id = summary.append_node_id
     if append_node_id:
         headers.append("Node ID")
 
@@ -867,12 +924,8 @@ def _build_table(
     flops_scale = None
     if with_flops:
         # Auto-scaling of flops header
-        raw_flops = []
-        for evt in events:
-            if evt.flops > 0:
-                raw_flops.append(evt.flops)
-        if len(raw_flops) != 0:
-            (flops_scale, flops_header) = auto_scale_flops(min(raw_flops))
+        if summary.min_flops is not None:
+            (flops_scale, flops_header) = auto_scale_flops(summary.min_flops)
             headers.append("Total {}".format(flops_header))
             add_column(flops_column_width)
         else:
@@ -890,16 +943,8 @@ def _build_table(
         result.append(s)
         result.append("\n")  # Yes, newline after the end as well
 
-    sum_self_cpu_time_total = sum(event.self_cpu_time_total for event in events)
-    sum_self_musa_time_total = 0
-    for evt in events:
-        if evt.device_type == DeviceType.CPU:
-            # in legacy profiler, kernel info is stored in cpu events
-            if evt.is_legacy:
-                sum_self_musa_time_total += evt.self_musa_time_total
-        else:
-            # in kineto profiler, there're events with the correct device type (e.g. MUSA)
-            sum_self_musa_time_total += evt.self_musa_time_total
+    sum_self_cpu_time_total = summary.sum_self_cpu_time_total
+    sum_self_musa_time_total = summary.sum_self_musa_time_total
 
     # Actual printing
     if header is not None:
@@ -12,7 +12,11 @@ import os
 
 from torch._C._autograd import DeviceType, kineto_available
 from torch._C._profiler import _ExperimentalConfig, ProfilerActivity, RecordScope
-from torch.autograd.profiler import record_function, KinetoStepTracker
+from torch.autograd.profiler import (
+    KinetoStepTracker,
+    record_function,
+    RunningKeyAverages,
+)
 from torch.optim.optimizer import register_optimizer_step_post_hook
 
 from .profiler import (
@@ -24,6 +28,7 @@ from .profiler import (
     supported_activities,
     tensorboard_trace_handler,
 )
+from ._step_timer import StepTimer
 
 __all__ = [
     "profile",
@@ -36,6 +41,8 @@ __all__ = [
     "DeviceType",
     "record_function",
     "ExecutionGraphObserver",
+    "RunningKeyAverages",
+    "StepTimer",
 ]
 
 
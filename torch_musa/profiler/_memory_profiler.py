@@ -33,6 +33,11 @@ from torch._C._profiler import (
 from torch._utils import _element_size
 from torch.profiler import _utils
 
+try:
+    import numpy as np
+except ModuleNotFoundError:
+    np = None
+
 TensorAndID = Tuple["TensorKey", int]
 
 log = logging.getLogger(__name__)
@@ -406,6 +411,25 @@ class DataFlowNode:
         self._graph = graph
         self._edges: Dict[TensorKey, DataFlowEdge] = self._determine_edges()
 
+        # Edges are fixed from here on, and the views of them are read many times
+        # while categorizing Tensors, so they are computed once.
+        self._inputs = {
+            # MyPy can't see through `is_allocation` to know that
+            # `v.input_version` is not None.
+            k: (bool(v.mutated), cast(int, v.input_version))
+            for k, v in self._edges.items()
+            if not v.is_allocation
+        }
+        self._outputs = {
+            k: 0 if v.input_version is None else v.input_version + 1
+            for k, v in self._edges.items()
+            if (v.is_allocation and not v.is_deletion) or v.mutated
+        }
+        self._intermediates = tuple(
+            k for k, v in self._edges.items() if v.is_allocation and v.is_deletion
+        )
+        self._is_backward = RecordScope.BACKWARD_FUNCTION in get_scopes(event)
+
         for key, edge in self._edges.items():
             if edge.mutated and not edge.is_allocation:
                 self._graph.bump(key)
@@ -467,45 +491,106 @@ class DataFlowNode:
 
     @property
     def inputs(self) -> Dict[TensorKey, Tuple[bool, int]]:
-        return {
-            # MyPy can't see through `is_allocation` to know that
-            # `v.input_version` is not None.
-            k: (bool(v.mutated), cast(int, v.input_version))
-            for k, v in self._edges.items()
-            if not v.is_allocation
-        }
+        return self._inputs
 
     @property
     def outputs(self) -> Dict[TensorKey, int]:
-        return {
-            k: 0 if v.input_version is None else v.input_version + 1
-            for k, v in self._edges.items()
-            if (v.is_allocation and not v.is_deletion) or v.mutated
-        }
+        return self._outputs
 
     @property
     def intermediates(self) -> Tuple[TensorKey, ...]:
-        return tuple(
-            k for k, v in self._edges.items() if v.is_allocation and v.is_deletion
-        )
+        return self._intermediates
+
+    @property
+    def is_backward(self) -> bool:
+        """Whether the node runs within a backward function"""
+        return self._is_backward
 
     @property
     def start_time(self) -> int:
         return self._event.start_time_ns
 
 
+@dataclasses.dataclass
+class DataFlowEdgeArrays:
+    """Edges of the data flow graph in node and edge order, one array per field."""
+
+    node: "np.ndarray"  # index of the flow node
+    key: "np.ndarray"  # integer id of the TensorKey
+    input_version: "np.ndarray"  # -1 for allocations
+    mutated: "np.ndarray"
+    deleted: "np.ndarray"
+    start_time_ns: "np.ndarray"  # of the flow nodes, by node index
+
+    @property
+    def is_allocation(self) -> "np.ndarray":
+        return self.input_version < 0
+
+
 class DataFlowGraph:
     def __init__(self, op_tree: OpTree) -> None:
         self._op_tree = op_tree
         self._leaf_events = self._extract_leaf_events(op_tree)
         self._active_version: Dict[TensorKey, Optional[int]] = {}
-        self._flow_nodes = [DataFlowNode(e, self) for e in self.leaf_events]
-        self._flow_nodes.sort(key=lambda x: x.start_time)
+        self._flow_nodes = tuple(
+            sorted(
+                (DataFlowNode(e, self) for e in self.leaf_events),
+                key=lambda x: x.start_time,
+            )
+        )
         self.validate()
 
+        self._key_ids: Dict[TensorKey, int] = {}
+        self._keys: List[TensorKey] = []
+        self._edge_arrays: Optional[DataFlowEdgeArrays] = None
+
     @property
     def flow_nodes(self) -> Tuple[DataFlowNode, ...]:
-        return tuple(self._flow_nodes)
+        return self._flow_nodes
+
+    @property
+    def keys(self) -> List[TensorKey]:
+        """TensorKeys by their integer ids, see `key_id`"""
+        return self._keys
+
+    def key_id(self, key: TensorKey) -> int:
+        """Returns the dense integer id of key, assigning the next one to new keys"""
+        key_id = self._key_ids.get(key)
+        if key_id is None:
+            key_id = self._key_ids[key] = len(self._keys)
+            self._keys.append(key)
+        return key_id
+
+    @property
+    def edge_arrays(self) -> "DataFlowEdgeArrays":
+        """The edges of all flow nodes, keyed by integer TensorKey ids"""
+        if self._edge_arrays is None:
+            columns: Dict[str, List[int]] = {
+                name: [] for name in ("node", "key", "input_version")
+            }
+            mutated: List[bool] = []
+            deleted: List[bool] = []
+            for index, node in enumerate(self._flow_nodes):
+                for key, edge in node._edges.items():
+                    columns["node"].append(index)
+                    columns["key"].append(self.key_id(key))
+                    columns["input_version"].append(
+                        -1 if edge.input_version is None else edge.input_version
+                    )
+                    mutated.append(bool(edge.mutated))
+                    deleted.append(edge.is_deletion)
+            self._edge_arrays = DataFlowEdgeArrays(
+                **{
+                    name: np.array(values, dtype=np.int64)
+                    for name, values in columns.items()
+                },
+                mutated=np.array(mutated, dtype=bool),
+                deleted=np.array(deleted, dtype=bool),
+                start_time_ns=np.array(
+                    [node.start_time for node in self._flow_nodes], dtype=np.int64
+                ),
+            )
+        return self._edge_arrays
 
     def validate(self):
         # Check that each (Tensor, version) pair has a unique creation node
@@ -641,12 +726,78 @@ class CategoryDict:
         )
 
 
+@dataclasses.dataclass
+class MemoryTimelineArrays:
+    """`MemoryProfile.timeline` as arrays, sorted by time."""
+
+    times: "np.ndarray"  # ns since the first event, -1 for preexisting Tensors
+    actions: "np.ndarray"  # values of Action
+    keys: "np.ndarray"  # integer ids of TensorKeys, see DataFlowGraph.keys
+    versions: "np.ndarray"
+    sizes: "np.ndarray"  # bytes
+
+
+@dataclasses.dataclass
+class MemoryCurves:
+    """Memory in use by category over time.
+
+    `sizes[i, j]` is the number of bytes of `categories[j]` in use after all events
+    at `times[i]`, the first category, None, being Tensors of unknown category.
+    """
+
+    times: "np.ndarray"
+    categories: Tuple[Optional[Category], ...]
+    sizes: "np.ndarray"
+
+    @property
+    def category_names(self) -> List[str]:
+        return [
+            "UNKNOWN" if category is None else category.name
+            for category in self.categories
+        ]
+
+    @property
+    def total(self) -> "np.ndarray":
+        return self.sizes.sum(axis=1)
+
+    def peak(self) -> Dict[str, int]:
+        """Returns the peak usage of every category and of the total, in bytes"""
+        peaks = {
+            name: int(self.sizes[:, i].max(initial=0))
+            for i, name in enumerate(self.category_names)
+        }
+        peaks["TOTAL"] = int(self.total.max(initial=0))
+        return peaks
+
+    def save(self, path: str) -> None:
+        """Saves the curves as .npz, or as .parquet, which requires pyarrow"""
+        columns = {"time_ns": self.times}
+        columns.update(
+            (name, self.sizes[:, i]) for i, name in enumerate(self.category_names)
+        )
+        if path.endswith(".parquet"):
+            try:
+                import pyarrow  # pylint: disable=import-outside-toplevel
+                import pyarrow.parquet  # pylint: disable=import-outside-toplevel
+            except ImportError as exception:
+                raise RuntimeError(
+                    "Saving memory curves as parquet requires pyarrow"
+                ) from exception
+            pyarrow.parquet.write_table(pyarrow.table(columns), path)
+        else:
+            np.savez_compressed(path, **columns)
+
+
 class MemoryProfile:
     def __init__(self, result: _ProfilerResult) -> None:
+        if np is None:
+            raise ModuleNotFoundError("MemoryProfile requires numpy")
         self._op_tree = OpTree(result)
         self._data_flow_graph = DataFlowGraph(self._op_tree)
         self._size_map = SizeMap(self._op_tree)
         self._categories = CategoryDict()
+        self._depends_on_gradient: Optional[Set[int]] = None
+        self._timeline_arrays: Optional[MemoryTimelineArrays] = None
 
         self._set_gradients_and_temporaries()
         self._set_parameters_using_python_tracer()
@@ -658,47 +809,182 @@ class MemoryProfile:
 
     @property
     def timeline(self) -> Tuple[Tuple[int, Action, TensorAndID, int], ...]:
-        t0 = min(event.start_time_ns for event in self._op_tree.dfs())
-        allocation_times: Dict[Tuple[TensorKey, bool], int] = {}
-        for event in self._op_tree.dfs():
+        arrays = self.timeline_arrays
+        keys = self._data_flow_graph.keys
+        actions = {action.value: action for action in Action}
+        return tuple(
+            (time, actions[action], (keys[key], version), size)
+            for time, action, key, version, size in zip(
+                arrays.times.tolist(),
+                arrays.actions.tolist(),
+                arrays.keys.tolist(),
+                arrays.versions.tolist(),
+                arrays.sizes.tolist(),
+            )
+        )
+
+    @property
+    def timeline_arrays(self) -> "MemoryTimelineArrays":
+        """The timeline as arrays, with Tensors given by the integer ids of
+        `DataFlowGraph.keys` and actions by their values"""
+        if self._timeline_arrays is None:
+            self._timeline_arrays = self._build_timeline_arrays()
+        return self._timeline_arrays
+
+    def _build_timeline_arrays(self) -> "MemoryTimelineArrays":
+        graph = self._data_flow_graph
+        edges = graph.edge_arrays
+        sorted_nodes = self._op_tree.sorted_nodes
+        t0 = sorted_nodes[0].start_time_ns if sorted_nodes else 0
+
+        allocation_times: Dict[Tuple[int, bool], int] = {}
+        for event in sorted_nodes:
             if event.typed[0] == _EventType.Allocation:
                 alloc_fields = event.typed[1]
                 key = TensorKey.from_allocation(alloc_fields)
                 if key is not None:
                     is_allocation = alloc_fields.alloc_size > 0
-                    allocation_times[(key, is_allocation)] = event.start_time_ns - t0
+                    allocation_times[(graph.key_id(key), is_allocation)] = (
+                        event.start_time_ns - t0
+                    )
 
-        snapshot = self._category_snapshot()
-        last_version = dict(sorted(snapshot.keys()))
+        snapshot = [
+            (graph.key_id(key), version) for key, version in self._category_snapshot()
+        ]
+        preexisting = [
+            key_id
+            for key_id, version in snapshot
+            if version == 0 and (key_id, True) not in allocation_times
+        ]
+        last_version = np.zeros(len(graph.keys), dtype=np.int64)
+        for key_id, version in snapshot:
+            last_version[key_id] = max(last_version[key_id], version)
+
+        def times_of(key_ids: "np.ndarray", is_allocation: bool) -> "np.ndarray":
+            return np.array(
+                [allocation_times[(k, is_allocation)] for k in key_ids.tolist()],
+                dtype=np.int64,
+            )
 
-        events: List[Tuple[int, Action, TensorAndID]] = [
-            (-1, Action.PREEXISTING, (key, version))
-            for key, version in snapshot.keys()
-            if (key, True) not in allocation_times and version == 0
+        # every edge yields a creation or a version increment, then a destruction
+        edge_order = np.arange(len(edges.key), dtype=np.int64)
+        created = edges.is_allocation
+        incremented = ~created & edges.mutated
+        destroyed = edges.deleted
+        parts = [
+            (
+                np.full(len(preexisting), -1, dtype=np.int64),
+                Action.PREEXISTING,
+                np.array(preexisting, dtype=np.int64),
+                np.zeros(len(preexisting), dtype=np.int64),
+                np.arange(-len(preexisting), 0, dtype=np.int64),
+            ),
+            (
+                times_of(edges.key[created], True),
+                Action.CREATE,
+                edges.key[created],
+                np.zeros(int(created.sum()), dtype=np.int64),
+                2 * edge_order[created],
+            ),
+            (
+                edges.start_time_ns[edges.node[incremented]] - t0,
+                Action.INCREMENT_VERSION,
+                edges.key[incremented],
+                edges.input_version[incremented],
+                2 * edge_order[incremented],
+            ),
+            (
+                times_of(edges.key[destroyed], False),
+                Action.DESTROY,
+                edges.key[destroyed],
+                last_version[edges.key[destroyed]],
+                2 * edge_order[destroyed] + 1,
+            ),
         ]
+        times = np.concatenate([part[0] for part in parts])
+        actions = np.concatenate(
+            [np.full(len(part[2]), part[1].value, dtype=np.int64) for part in parts]
+        )
+        keys = np.concatenate([part[2] for part in parts])
+        versions = np.concatenate([part[3] for part in parts])
+        emit_order = np.concatenate([part[4] for part in parts])
+
+        # sort by time and action, keeping the order events are emitted in otherwise
+        order = np.lexsort((emit_order, actions, times))
+        keys = keys[order]
+        sizes = np.zeros(len(graph.keys), dtype=np.int64)
+        for key_id in np.unique(keys).tolist():
+            sizes[key_id] = self._size_map[graph.keys[key_id]]
+        return MemoryTimelineArrays(
+            times=times[order],
+            actions=actions[order],
+            keys=keys,
+            versions=versions[order],
+            sizes=sizes[keys],
+        )
 
-        for node in self._data_flow_graph.flow_nodes:
-            for key, edge in node._edges.items():
-                if edge.is_allocation:
-                    t = allocation_times[(key, True)]
-                    events.append((t, Action.CREATE, (key, 0)))
-
-                elif edge.mutated:
-                    t = node._event.start_time_ns - t0
-                    version = edge.input_version
-                    assert version is not None
-                    events.append((t, Action.INCREMENT_VERSION, (key, version)))
-
-                if edge.is_deletion:
-                    t = allocation_times[(key, False)]
-                    events.append((t, Action.DESTROY, (key, last_version[key])))
-
-        events.sort(key=lambda x: (x[0], x[1].value))
-        return tuple(
-            (time, action, (key, version), self._size_map[key])
-            for time, action, (key, version) in events
+    def memory_curves(
+        self, device: Union[None, str, torch.device] = None
+    ) -> "MemoryCurves":
+        """Returns the memory in use by each category after every point in time.
+
+        Args:
+            device: only count Tensors on this device, e.g. "musa:0" or "cpu".
+        """
+        arrays = self.timeline_arrays
+        keys = self._data_flow_graph.keys
+        selected = np.ones(len(arrays.keys), dtype=bool)
+        if device is not None:
+            device = torch.device(device)
+            on_device = np.array([key.device == device for key in keys], dtype=bool)
+            selected = on_device[arrays.keys] if keys else selected
+        times = arrays.times[selected]
+        actions = arrays.actions[selected]
+        key_ids = arrays.keys[selected]
+        versions = arrays.versions[selected]
+        sizes = arrays.sizes[selected]
+
+        # column 0 counts Tensors of unknown category
+        columns = self._category_columns(key_ids, versions)
+        increments = actions == Action.INCREMENT_VERSION.value
+        new_columns = self._category_columns(
+            key_ids[increments], versions[increments] + 1
+        )
+        signs = np.where(actions == Action.DESTROY.value, -1, 1)
+        signs[increments] = -1
+        rows = np.arange(len(times))
+        deltas = np.zeros((len(times), len(Category) + 1), dtype=np.int64)
+        np.add.at(deltas, (rows, columns), signs * sizes)
+        np.add.at(deltas, (rows[increments], new_columns), sizes[increments])
+        totals = np.cumsum(deltas, axis=0)
+
+        # keep the state after the last event of each point in time
+        last = np.flatnonzero(np.diff(times, append=np.iinfo(np.int64).max) != 0)
+        return MemoryCurves(
+            times=times[last],
+            categories=(None,) + tuple(Category),
+            sizes=totals[last],
         )
 
+    def _category_columns(
+        self, key_ids: "np.ndarray", versions: "np.ndarray"
+    ) -> "np.ndarray":
+        if len(key_ids) == 0:
+            return np.zeros(0, dtype=np.int64)
+        keys = self._data_flow_graph.keys
+        columns = {category: i + 1 for i, category in enumerate(Category)}
+        pairs, inverse = np.unique(
+            np.stack([key_ids, versions], axis=1), axis=0, return_inverse=True
+        )
+        pair_columns = np.array(
+            [
+                columns.get(self._categories.get(keys[key], version), 0)
+                for key, version in pairs.tolist()
+            ],
+            dtype=np.int64,
+        )
+        return pair_columns[inverse.reshape(-1)]
+
     def _is_gradient(self, *args, **kwargs) -> bool:
         return self._categories.get(*args, **kwargs) == Category.GRADIENT
 
@@ -728,7 +1014,13 @@ class MemoryProfile:
         topological order exists.) Put another way, we have converted an
         acyclic data flow graph into a cyclic graph and we are attempting to
         partition cycles involving a gradient from the rest of the graph.
+
+        The result only depends on which Tensors are gradients or parameters,
+        which `_set_inputs` does not change, so it is computed once for both
+        `_set_inputs` and `_set_parameters_using_data_flow`.
         """
+        if self._depends_on_gradient is not None:
+            return self._depends_on_gradient
         depends_on_gradient: Set[int] = set()
         while True:
             start_size = len(depends_on_gradient)
@@ -751,6 +1043,7 @@ class MemoryProfile:
             # once to fold the first step into that loop, and a third time
             # where no new elements are added.
             if len(depends_on_gradient) == start_size:
+                self._depends_on_gradient = depends_on_gradient
                 return depends_on_gradient
 
     def _set_gradients_and_temporaries(self) -> None:
@@ -820,7 +1113,7 @@ class MemoryProfile:
         # generally Autograd implementation details rather than proper inputs.
         input_candidates = produces_gradient.copy()
         for node in self._data_flow_graph.flow_nodes:
-            if RecordScope.BACKWARD_FUNCTION in get_scopes(node._event):
+            if node.is_backward:
                 input_candidates -= set(node.outputs.items())
 
         for key, version in input_candidates:
@@ -871,7 +1164,7 @@ class MemoryProfile:
             inputs = {(key, value) for key, (_, value) in node.inputs.items()}
             if (
                 # Don't check nodes in the backward pass.
-                RecordScope.BACKWARD_FUNCTION not in get_scopes(node._event)
+                not node.is_backward
                 and not any(self._is_gradient(*i) for i in inputs)
                 and not any(self._is_gradient(*i) for i in node.outputs.items())
                 #
@@ -914,7 +1207,7 @@ class MemoryProfile:
                 and not (input_categories - (required | also_allowed))
                 #
                 # Stop filling when we reach the backward pass.
-                and RecordScope.BACKWARD_FUNCTION not in get_scopes(node._event)
+                and not node.is_backward
             ):
                 for i in node.outputs.items():
                     self._categories.setdefault_by_version(*i, Category.ACTIVATION)
@@ -931,7 +1224,7 @@ class MemoryProfile:
     def _set_autograd_detail(self):
         prior = {None, Category.AUTOGRAD_DETAIL}
         for node in self._data_flow_graph.flow_nodes:
-            if RecordScope.BACKWARD_FUNCTION in get_scopes(node._event):
+            if node.is_backward:
                 for key, version in node.outputs.items():
                     if version == 0 or self._categories.get(key, version - 1) in prior:
                         self._categories.setdefault_by_version(
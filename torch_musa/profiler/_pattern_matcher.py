@@ -3,7 +3,7 @@ import json
 import math
 import os
 import re
-from typing import Dict, List, Optional, Set
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
 
 import torch
 from torch.utils import benchmark
@@ -18,6 +18,62 @@ from torch.profiler import profile
 from torch.profiler._utils import index_of_first_match, traverse_bfs, traverse_dfs
 
 
+class EventTreeIndex:
+    """
+    Event tree of a profile with precomputed lookups shared by all patterns.
+
+    `events` holds the tree in the order of traverse_dfs(), and every event id
+    maps to the list of its siblings and its position in that list, so that
+    Pattern.siblings_of(), next_of() and prev_of() take constant time.
+    """
+
+    def __init__(self, event_tree: List[_ProfilerEvent]):
+        self.event_tree = event_tree
+        self.tid_root: Dict[int, List[_ProfilerEvent]] = {}
+        for event in self.event_tree:
+            self.tid_root.setdefault(event.start_tid, []).append(event)
+        self._positions: Dict[int, Tuple[List[_ProfilerEvent], int]] = {}
+        for roots in self.tid_root.values():
+            self._add_siblings(roots)
+        self.events = list(traverse_dfs(self.event_tree, children_fn=self._children))
+
+    def _add_siblings(self, siblings: List[_ProfilerEvent]):
+        for index, event in enumerate(siblings):
+            self._positions[event.id] = (siblings, index)
+
+    def _children(self, event: _ProfilerEvent):
+        children = event.children
+        self._add_siblings(children)
+        return children
+
+    def position_of(self, event: _ProfilerEvent):
+        """Return the sibling list of the event and its index in that list"""
+        position = self._positions.get(event.id)
+        if position is not None:
+            return position
+        if event.parent:
+            children = event.parent.children
+        else:
+            children = self.tid_root[event.start_tid]
+        return children, children.index(event)
+
+
+def event_tree_index(prof: profile) -> EventTreeIndex:
+    """
+    Return the EventTreeIndex of the profile, building it once per Kineto result
+    so that all patterns of a report share the same event tree.
+    """
+    profiler = prof.profiler
+    cached = getattr(profiler, "_event_tree_index", None)
+    if cached is None or cached[0] is not profiler.kineto_results:
+        cached = (
+            profiler.kineto_results,
+            EventTreeIndex(profiler.kineto_results.experimental_event_tree()),
+        )
+        profiler._event_tree_index = cached
+    return cached[1]
+
+
 class Pattern:
     """
     Base class for all patterns, subclass this class and implement match()
@@ -26,6 +82,10 @@ class Pattern:
     In subclass, define description and skip property.
     """
 
+    # Names of the events match() can accept, used by match_patterns() to only
+    # call match() on those events. None means any event may match.
+    match_names: Optional[FrozenSet[str]] = None
+
     def __init__(self, prof: profile, should_benchmark: bool = False):
         self.prof = prof
         self.should_benchmark = should_benchmark
@@ -33,10 +93,9 @@ class Pattern:
         self.description = "Please specify a description for pattern"
         self.url = ""
         assert prof.profiler is not None and prof.profiler.kineto_results is not None
-        self.event_tree = prof.profiler.kineto_results.experimental_event_tree()
-        self.tid_root: Dict[int, List[_ProfilerEvent]] = {}
-        for event in self.event_tree:
-            self.tid_root.setdefault(event.start_tid, []).append(event)
+        self.event_tree_index = event_tree_index(prof)
+        self.event_tree = self.event_tree_index.event_tree
+        self.tid_root = self.event_tree_index.tid_root
 
     @property
     def skip(self):
@@ -53,7 +112,7 @@ class Pattern:
         Traverse the event tree and yield all events.
         Override this method in subclass to customize the traversal.
         """
-        yield from traverse_dfs(self.event_tree)
+        yield from self.event_tree_index.events
 
     def summary(self, events: List[_ProfilerEvent]):
         default_summary = f"{self.name}: {len(events)} events matched."
@@ -110,20 +169,16 @@ class Pattern:
         return event
 
     def siblings_of(self, event: _ProfilerEvent):
-        if event.parent:
-            children = event.parent.children
-        else:
-            children = self.tid_root[event.start_tid]
-        index = children.index(event)
+        children, index = self.event_tree_index.position_of(event)
         return children[:index], children[index + 1:]
 
     def next_of(self, event: _ProfilerEvent):
-        _, next_events = self.siblings_of(event)
-        return next_events[0] if next_events else None
+        children, index = self.event_tree_index.position_of(event)
+        return children[index + 1] if index + 1 < len(children) else None
 
     def prev_of(self, event: _ProfilerEvent):
-        prev_events, _ = self.siblings_of(event)
-        return prev_events[-1] if prev_events else None
+        children, index = self.event_tree_index.position_of(event)
+        return children[index - 1] if index > 0 else None
 
     def go_up_until(self, event: _ProfilerEvent, predicate):
         if not event:
@@ -164,6 +219,8 @@ class ExtraMUSACopyPattern(Pattern):
     If at any step we failed, it is not a match.
     """
 
+    match_names = frozenset({"aten::to"})
+
     def __init__(self, prof: profile, should_benchmark: bool = False):
         super().__init__(prof, should_benchmark)
         self.name = "Extra MUSA Copy Pattern"
@@ -302,6 +359,8 @@ class ForLoopIndexingPattern(Pattern):
 class FP32MatMulPattern(Pattern):
     """FP32 MatMul Pattern."""
 
+    match_names = frozenset({"aten::mm"})
+
     def __init__(self, prof: profile, should_benchmark: bool = False):
         super().__init__(prof, should_benchmark)
         self.name = "FP32 MatMul Pattern"
@@ -507,6 +566,8 @@ class Conv2dBiasFollowedByBatchNorm2dPattern(Pattern):
     String match
     """
 
+    match_names = frozenset({"aten::conv2d"})
+
     def __init__(self, prof: profile, should_benchmark: bool = False):
         super().__init__(prof, should_benchmark)
         self.name = "Enabling Bias in Conv2d Followed By BatchNorm Pattern"
@@ -541,6 +602,8 @@ class Conv2dBiasFollowedByBatchNorm2dPattern(Pattern):
 class MatMulDimInFP16Pattern(Pattern):
     """Matrix Multiplication Dimension Not Aligned Pattern."""
 
+    match_names = frozenset({"aten::mm", "aten::bmm", "aten::addmm"})
+
     def __init__(self, prof: profile, should_benchmark: bool = False):
         super().__init__(prof, should_benchmark)
         self.name = "Matrix Multiplication Dimension Not Aligned Pattern"
@@ -619,6 +682,50 @@ def input_dtypes(event: _ProfilerEvent):
     return tuple(getattr(i, "dtype", None) for i in event.extra_fields.inputs)
 
 
+def match_patterns(patterns: List[Pattern]) -> List[List[_ProfilerEvent]]:
+    """
+    Return the matched events of each pattern, like calling matched_events() on
+    each of them, but walking the shared event tree once and feeding every event
+    only to the patterns whose match_names accept its name.
+    """
+    matched: List[List[_ProfilerEvent]] = [[] for _ in patterns]
+    walks: Dict[int, Tuple[EventTreeIndex, List[int]]] = {}
+    for i, pattern in enumerate(patterns):
+        if pattern.skip:
+            continue
+        if (
+            type(pattern).matched_events is not Pattern.matched_events
+            or type(pattern).eventTreeTraversal is not Pattern.eventTreeTraversal
+        ):
+            matched[i] = pattern.matched_events()
+            continue
+        index = pattern.event_tree_index
+        walks.setdefault(id(index), (index, []))[1].append(i)
+
+    for index, indices in walks.values():
+        any_name = []
+        by_name: Dict[str, List] = {}
+        for i in indices:
+            target = (matched[i], patterns[i].match)
+            if patterns[i].match_names is None:
+                any_name.append(target)
+                continue
+            for name in patterns[i].match_names:
+                by_name.setdefault(name, []).append(target)
+        for event in index.events:
+            try:
+                named = by_name.get(event.name, ())
+            except UnicodeDecodeError:
+                named = ()
+            for events, match in any_name:
+                if match(event):
+                    events.append(event)
+            for events, match in named:
+                if match(event):
+                    events.append(event)
+    return matched
+
+
 def report_all_anti_patterns(
     prof,
     should_benchmark: bool = False,
@@ -640,8 +747,8 @@ def report_all_anti_patterns(
     summaries = []
     message_list = [f"{'-' * 40}TorchTidy Report{'-' * 40}", "Matched Events:"]
 
-    for anti_pattern in anti_patterns:
-        matched_events = anti_pattern.matched_events()
+    all_matched_events = match_patterns(anti_patterns)
+    for anti_pattern, matched_events in zip(anti_patterns, all_matched_events):
         if not matched_events:
             continue
         summaries.append(anti_pattern.summary(matched_events))
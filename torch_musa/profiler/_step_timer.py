@@ -0,0 +1,209 @@
+"""Always-on, low-overhead step telemetry.
+
+`StepTimer` records the wall time of every step, the time spent in a selected set of
+`record_function` ranges and a few counters of the caching allocator into a
+fixed-size ring buffer, which is dumped as JSON or CSV on demand or on a signal.
+Nothing is collected by Kineto, so the timer can run through a whole job between
+deep profiling windows.
+"""
+
+import csv
+import json
+import os
+import signal
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+import torch
+from torch.autograd import profiler as autograd_profiler
+
+try:
+    import numpy as np
+except ModuleNotFoundError:
+    np = None  # pylint: disable=invalid-name
+
+__all__ = ["StepTimer"]
+
+DEFAULT_MEMORY_KEYS = (
+    "allocated_bytes.all.current",
+    "allocated_bytes.all.peak",
+    "reserved_bytes.all.current",
+    "num_alloc_retries",
+    "num_ooms",
+)
+
+
+class StepTimer:
+    """Records per-step telemetry into a ring buffer of the last ``capacity`` steps.
+
+    Every call to :meth:`step` closes the current step and stores one record with
+    the step number, its start as unix time and its wall time, the total time and
+    number of calls of each range in ``ranges`` within the step, and the values of
+    ``memory_keys`` read from ``memory_stats`` at the end of the step. Times are in
+    nanoseconds.
+
+    Args:
+        ranges (iterable of str): names of ``record_function`` ranges to time.
+        capacity (int): number of most recent steps kept.
+        memory_keys (iterable of str): keys of ``torch.musa.memory_stats`` recorded.
+        memory_stats (callable, optional): returns the allocator statistics, by
+            default ``torch.musa.memory_stats`` if a MUSA device is available. No
+            counters are recorded if it is None and no device is available.
+
+    Example::
+
+        timer = torch_musa.profiler.StepTimer(ranges=["forward", "backward"])
+        timer.dump_on_signal("/tmp/steps.{pid}.json")
+        with timer:
+            for batch in loader:
+                train_step(batch)
+                timer.step()
+        timer.dump("/tmp/steps.csv")
+    """
+
+    def __init__(
+        self,
+        ranges: Iterable[str] = (),
+        capacity: int = 1024,
+        memory_keys: Iterable[str] = DEFAULT_MEMORY_KEYS,
+        memory_stats: Optional[Callable[[], Dict[str, int]]] = None,
+    ):
+        if np is None:
+            raise ModuleNotFoundError("StepTimer requires numpy")
+        if capacity <= 0:
+            raise ValueError(f"capacity must be positive, got {capacity}")
+        self.ranges = list(dict.fromkeys(ranges))
+        self.capacity = capacity
+        if memory_stats is None and torch.musa.is_available():
+            memory_stats = torch.musa.memory_stats
+        self.memory_stats = memory_stats
+        self.memory_keys = list(memory_keys) if memory_stats is not None else []
+        self.columns = (
+            ["step", "start_time_ns", "wall_time_ns"]
+            + [f"{name}.time_ns" for name in self.ranges]
+            + [f"{name}.count" for name in self.ranges]
+            + self.memory_keys
+        )
+        self._buffer = np.zeros((capacity, len(self.columns)), dtype=np.int64)
+        # time and number of calls of each range in the current step
+        self._range_index = {name: i for i, name in enumerate(self.ranges)}
+        self._range_time = [0] * len(self.ranges)
+        self._range_count = [0] * len(self.ranges)
+        self._num_steps = 0
+        self._step_start_ns = 0
+        self._step_start_unix_ns = 0
+        # reentrant, since a signal handler may dump while the main thread records
+        self._lock = threading.RLock()
+        self._signal_handlers: Dict[int, object] = {}
+        self.running = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        """Starts the first step and timing of the selected ranges"""
+        if self.running:
+            return
+        self.running = True
+        if self.ranges:
+            autograd_profiler._record_function_observers.append(self._observe_range)
+        self._start_step()
+
+    def stop(self):
+        """Stops timing and restores signal handlers, the unfinished step is dropped"""
+        self.running = False
+        if self._observe_range in autograd_profiler._record_function_observers:
+            autograd_profiler._record_function_observers.remove(self._observe_range)
+        for signum in list(self._signal_handlers):
+            signal.signal(signum, self._signal_handlers.pop(signum))
+
+    def _start_step(self):
+        self._range_time = [0] * len(self.ranges)
+        self._range_count = [0] * len(self.ranges)
+        self._step_start_unix_ns = time.time_ns()
+        self._step_start_ns = time.perf_counter_ns()
+
+    def _observe_range(self, name: str, duration_ns: int):
+        index = self._range_index.get(name)
+        if index is not None:
+            self._range_time[index] += duration_ns
+            self._range_count[index] += 1
+
+    def step(self):
+        """Records the current step and starts the next one"""
+        if not self.running:
+            return
+        end_ns = time.perf_counter_ns()
+        row = [
+            self._num_steps,
+            self._step_start_unix_ns,
+            end_ns - self._step_start_ns,
+        ]
+        row += self._range_time
+        row += self._range_count
+        if self.memory_keys:
+            stats = self.memory_stats()
+            row += [stats.get(key, 0) for key in self.memory_keys]
+        with self._lock:
+            self._buffer[self._num_steps % self.capacity] = row
+            self._num_steps += 1
+        self._start_step()
+
+    @property
+    def num_steps(self) -> int:
+        """Number of steps recorded, including those overwritten in the buffer"""
+        return self._num_steps
+
+    def records(self) -> "np.ndarray":
+        """Returns the buffered steps, oldest first, one row per step"""
+        with self._lock:
+            if self._num_steps <= self.capacity:
+                return self._buffer[: self._num_steps].copy()
+            head = self._num_steps % self.capacity
+            return np.concatenate((self._buffer[head:], self._buffer[:head]))
+
+    def to_dicts(self) -> List[Dict[str, int]]:
+        return [dict(zip(self.columns, row)) for row in self.records().tolist()]
+
+    def dump(self, path: str):
+        """Writes the buffered steps to path as CSV if it ends with .csv, else JSON.
+
+        ``{pid}`` in path is replaced by the process id. The file is replaced
+        atomically, so that a reader never sees a partial dump.
+        """
+        path = path.format(pid=os.getpid())
+        records = self.records()
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+            if path.endswith(".csv"):
+                writer = csv.writer(f)
+                writer.writerow(self.columns)
+                writer.writerows(records.tolist())
+            else:
+                json.dump(
+                    {
+                        "columns": self.columns,
+                        "num_steps": self._num_steps,
+                        "records": records.tolist(),
+                    },
+                    f,
+                )
+        os.replace(tmp_path, path)
+
+    def dump_on_signal(self, path: str, signum: int = signal.SIGUSR1):
+        """Dumps the buffered steps to path whenever the process receives signum.
+
+        The handler is installed until :meth:`stop`, it must be called from the main
+        thread.
+        """
+
+        def handler(_signum, _frame):
+            self.dump(path)
+
+        previous = signal.signal(signum, handler)
+        self._signal_handlers.setdefault(signum, previous)
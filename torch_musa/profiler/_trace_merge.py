@@ -0,0 +1,539 @@
+"""Merging of per-rank chrome traces and straggler analysis of distributed runs.
+
+Every rank of a distributed job writes its own trace, e.g. with
+`tensorboard_trace_handler`. The traces are streamed one at a time and reduced to
+per-step statistics: the host time of every `ProfilerStep#N`, the busy time of
+compute and collective kernels and their overlap, and the order of collectives.
+Clocks of the ranks are aligned on the ends of matching collectives, which finish
+together on all ranks, or on the starts of the steps if there are no collectives.
+The rank reaching the collectives of a step last is reported as its straggler.
+
+This file only depends on the standard library, so that traces can be analyzed on
+hosts without torch or a device by running it as a script:
+
+    python torch_musa/profiler/_trace_merge.py ./log --output merged.json.gz
+"""
+
+# pylint: disable=missing-function-docstring
+
+import argparse
+import bisect
+import concurrent.futures
+import dataclasses
+import json
+import os
+import re
+import statistics
+import sys
+from typing import Any, Dict, Iterable, List, Optional, Pattern, Tuple
+
+if __package__:
+    from ._trace_reader import DEVICE_CATEGORIES, iter_trace_events, read_trace_metadata
+    from ._trace_writer import get_codec
+else:
+    # run as a script, which must not import torch_musa
+    from _trace_reader import (  # type: ignore[no-redef]
+        DEVICE_CATEGORIES,
+        iter_trace_events,
+        read_trace_metadata,
+    )
+    from _trace_writer import get_codec  # type: ignore[no-redef]
+
+__all__ = [
+    "StepStats",
+    "RankTrace",
+    "StepReport",
+    "MergeReport",
+    "find_traces",
+    "load_rank_trace",
+    "align_ranks",
+    "analyze_traces",
+    "write_merged_trace",
+]
+
+STEP_PATTERN = re.compile(r"ProfilerStep#(\d+)")
+# kernels of collective communication libraries
+COLLECTIVE_KERNEL_PATTERN = re.compile(r"[nmr]ccl", re.IGNORECASE)
+# host collectives, used when a trace has no kernels at all, e.g. with gloo
+COLLECTIVE_HOST_PATTERN = re.compile(r"c10d::|gloo:")
+
+_TRACE_SUFFIX = re.compile(r"\.pt\.trace\.json(\.gz)?$")
+# metadata replaced by the names of the process and threads of each rank
+_RANK_METADATA = frozenset(
+    ("process_name", "process_labels", "process_sort_index", "thread_name")
+)
+
+Interval = Tuple[int, int]
+
+
+@dataclasses.dataclass
+class StepStats:
+    """Statistics of one profiler step of one rank, times are in ns.
+
+    `start_ns` and `collectives` are in the clock of the rank, add the offset of
+    the rank to compare them across ranks.
+    """
+
+    step: int
+    start_ns: int
+    duration_ns: int
+    compute_ns: int = 0
+    comm_ns: int = 0
+    overlap_ns: int = 0
+    collectives: List[Interval] = dataclasses.field(default_factory=list)
+
+    @property
+    def exposed_comm_ns(self) -> int:
+        return self.comm_ns - self.overlap_ns
+
+    @property
+    def overlap_ratio(self) -> float:
+        return self.overlap_ns / self.comm_ns if self.comm_ns else 0.0
+
+
+@dataclasses.dataclass
+class RankTrace:
+    """Step statistics of the traces of one rank"""
+
+    rank: int
+    paths: List[str]
+    steps: Dict[int, StepStats]
+    offset_ns: int = 0
+
+
+@dataclasses.dataclass
+class StepReport:
+    """Comparison of one step across ranks, times are in ns"""
+
+    step: int
+    durations: Dict[int, int]
+    slowest_rank: int
+    # rank the others waited for at collectives, the slowest rank without them
+    straggler_rank: int
+    # largest spread of arrival times at a collective of the step
+    max_skew_ns: int
+    # time each rank waited for the last rank at the collectives of the step
+    wait_ns: Dict[int, int]
+
+    @property
+    def median_duration_ns(self) -> float:
+        return statistics.median(self.durations.values())
+
+
+@dataclasses.dataclass
+class MergeReport:
+    """Ranks with their aligned clock offsets and the per step comparisons"""
+
+    ranks: List[RankTrace]
+    steps: List[StepReport]
+
+    def rank_summary(self) -> List[Dict[str, Any]]:
+        """Per rank averages over the steps, and how often the rank straggled"""
+        straggles: Dict[int, int] = {}
+        waits: Dict[int, int] = {}
+        for step in self.steps:
+            straggles[step.straggler_rank] = straggles.get(step.straggler_rank, 0) + 1
+            for rank, wait_ns in step.wait_ns.items():
+                waits[rank] = waits.get(rank, 0) + wait_ns
+        summary = []
+        for rank in self.ranks:
+            steps = list(rank.steps.values())
+            num_steps = max(len(steps), 1)
+            comm_ns = sum(s.comm_ns for s in steps)
+            overlap_ns = sum(s.overlap_ns for s in steps)
+            summary.append(
+                {
+                    "rank": rank.rank,
+                    "steps": len(steps),
+                    "offset_ns": rank.offset_ns,
+                    "step_time_ns": sum(s.duration_ns for s in steps) / num_steps,
+                    "compute_ns": sum(s.compute_ns for s in steps) / num_steps,
+                    "comm_ns": comm_ns / num_steps,
+                    "exposed_comm_ns": (comm_ns - overlap_ns) / num_steps,
+                    "overlap_ratio": overlap_ns / comm_ns if comm_ns else 0.0,
+                    "wait_ns": waits.get(rank.rank, 0) / num_steps,
+                    "straggler_steps": straggles.get(rank.rank, 0),
+                }
+            )
+        return summary
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "ranks": self.rank_summary(),
+            "steps": [
+                {
+                    "step": step.step,
+                    "durations_ns": {str(r): d for r, d in step.durations.items()},
+                    "median_duration_ns": step.median_duration_ns,
+                    "slowest_rank": step.slowest_rank,
+                    "straggler_rank": step.straggler_rank,
+                    "max_skew_ns": step.max_skew_ns,
+                    "wait_ns": {str(r): w for r, w in step.wait_ns.items()},
+                }
+                for step in self.steps
+            ],
+        }
+
+    def table(self) -> str:
+        lines = [
+            f"{'rank':>6} {'steps':>6} {'step(ms)':>10} {'compute(ms)':>12} "
+            f"{'comm(ms)':>10} {'exposed(ms)':>12} {'overlap':>8} {'wait(ms)':>10} "
+            f"{'straggler':>10}"
+        ]
+        for row in self.rank_summary():
+            lines.append(
+                f"{row['rank']:>6} {row['steps']:>6} "
+                f"{row['step_time_ns'] / 1e6:>10.3f} {row['compute_ns'] / 1e6:>12.3f} "
+                f"{row['comm_ns'] / 1e6:>10.3f} "
+                f"{row['exposed_comm_ns'] / 1e6:>12.3f} {row['overlap_ratio']:>8.1%} "
+                f"{row['wait_ns'] / 1e6:>10.3f} {row['straggler_steps']:>10}"
+            )
+        lines.append("")
+        lines.append(
+            f"{'step':>6} {'median(ms)':>11} {'max(ms)':>10} {'slowest':>8} "
+            f"{'straggler':>10} {'skew(ms)':>10}"
+        )
+        for step in self.steps:
+            lines.append(
+                f"{step.step:>6} {step.median_duration_ns / 1e6:>11.3f} "
+                f"{step.durations[step.slowest_rank] / 1e6:>10.3f} "
+                f"{step.slowest_rank:>8} {step.straggler_rank:>10} "
+                f"{step.max_skew_ns / 1e6:>10.3f}"
+            )
+        return "\n".join(lines)
+
+
+def find_traces(paths: Iterable[str]) -> List[str]:
+    """Expands directories into the traces written by `tensorboard_trace_handler`"""
+    traces = []
+    for path in paths:
+        if os.path.isdir(path):
+            traces += sorted(
+                os.path.join(path, name)
+                for name in os.listdir(path)
+                if _TRACE_SUFFIX.search(name)
+            )
+        else:
+            traces.append(path)
+    return traces
+
+
+def _worker_name(path: str) -> str:
+    """`{worker_name}.{ts}.pt.trace.json` -> worker_name"""
+    name = os.path.basename(path)
+    if _TRACE_SUFFIX.search(name):
+        return _TRACE_SUFFIX.sub("", name).rsplit(".", 1)[0]
+    return name
+
+
+def _union_ns(intervals: List[Interval]) -> int:
+    """Length of the union of intervals sorted by start"""
+    total = 0
+    cur_start, cur_end = None, None
+    for start, end in intervals:
+        if cur_end is None or start > cur_end:
+            if cur_end is not None:
+                total += cur_end - cur_start
+            cur_start, cur_end = start, end
+        elif end > cur_end:
+            cur_end = end
+    if cur_end is not None:
+        total += cur_end - cur_start
+    return total
+
+
+def _bucket(
+    windows: Dict[int, Interval], intervals: List[Tuple[int, int, bool]]
+) -> Dict[int, List[Tuple[int, int, bool]]]:
+    """Groups intervals by the step whose window contains their start"""
+    order = sorted(windows, key=lambda step: windows[step][0])
+    starts = [windows[step][0] for step in order]
+    buckets: Dict[int, List[Tuple[int, int, bool]]] = {step: [] for step in order}
+    for interval in sorted(intervals):
+        i = bisect.bisect_right(starts, interval[0]) - 1
+        if i >= 0 and interval[0] < windows[order[i]][1]:
+            buckets[order[i]].append(interval)
+    return buckets
+
+
+def load_rank_trace(
+    path: str,
+    rank: Optional[int] = None,
+    collective_pattern: Pattern = COLLECTIVE_KERNEL_PATTERN,
+) -> RankTrace:
+    """Streams a trace once and reduces it to the statistics of its steps.
+
+    The rank is read from the `distributedInfo` metadata of the trace if not given,
+    and is -1 if the trace has none.
+    """
+    if rank is None:
+        rank = read_trace_metadata(path).get("distributedInfo", {}).get("rank", -1)
+    host_windows: Dict[int, Interval] = {}
+    device_windows: Dict[int, Interval] = {}
+    kernels: List[Tuple[int, int, bool]] = []
+    host_collectives: List[Tuple[int, int, bool]] = []
+    for raw in iter_trace_events(path):
+        if raw.get("ph") != "X":
+            continue
+        name = raw.get("name", "")
+        cat = raw.get("cat", "")
+        start = int(round(float(raw.get("ts", 0)) * 1000))
+        end = start + int(round(float(raw.get("dur", 0)) * 1000))
+        match = STEP_PATTERN.fullmatch(name)
+        if match:
+            windows = device_windows if cat == "gpu_user_annotation" else host_windows
+            windows[int(match.group(1))] = (start, end)
+        elif cat == "kernel":
+            kernels.append((start, end, collective_pattern.search(name) is not None))
+        elif cat not in DEVICE_CATEGORIES and COLLECTIVE_HOST_PATTERN.match(name):
+            host_collectives.append((start, end, True))
+
+    steps = {
+        step: StepStats(step, start, end - start)
+        for step, (start, end) in host_windows.items()
+    }
+    if kernels:
+        # kernels run behind the host, use the device ranges of steps if recorded
+        windows = {**host_windows, **device_windows}
+        buckets = _bucket(windows, kernels)
+    else:
+        buckets = _bucket(host_windows, host_collectives)
+    for step, intervals in buckets.items():
+        if step not in steps:
+            continue
+        stats = steps[step]
+        compute = [(s, e) for s, e, is_comm in intervals if not is_comm]
+        stats.collectives = [(s, e) for s, e, is_comm in intervals if is_comm]
+        stats.compute_ns = _union_ns(compute)
+        stats.comm_ns = _union_ns(stats.collectives)
+        busy_ns = _union_ns([(s, e) for s, e, _ in intervals])
+        stats.overlap_ns = stats.compute_ns + stats.comm_ns - busy_ns
+    return RankTrace(rank, [path], steps)
+
+
+def _merge_rank_traces(traces: List[RankTrace]) -> List[RankTrace]:
+    """Combines traces of the same rank, e.g. of several profiling cycles"""
+    ranks: Dict[int, RankTrace] = {}
+    for trace in traces:
+        if trace.rank not in ranks:
+            ranks[trace.rank] = RankTrace(trace.rank, [], {})
+        ranks[trace.rank].paths += trace.paths
+        ranks[trace.rank].steps.update(trace.steps)
+    return [ranks[rank] for rank in sorted(ranks)]
+
+
+def align_ranks(ranks: List[RankTrace]):
+    """Sets the clock offset of every rank relative to the first one.
+
+    The offset is the median difference of the ends of the collectives matched by
+    step and position in the step, or of the starts of the steps without them.
+    """
+    if not ranks:
+        return
+    reference = ranks[0]
+    reference.offset_ns = 0
+    for rank in ranks[1:]:
+        collective_diffs = []
+        step_diffs = []
+        for step, stats in rank.steps.items():
+            ref_stats = reference.steps.get(step)
+            if ref_stats is None:
+                continue
+            step_diffs.append(ref_stats.start_ns - stats.start_ns)
+            collective_diffs += [
+                ref[1] - own[1]
+                for ref, own in zip(ref_stats.collectives, stats.collectives)
+            ]
+        diffs = collective_diffs or step_diffs
+        rank.offset_ns = int(statistics.median(diffs)) if diffs else 0
+
+
+def _report_step(step: int, ranks: List[RankTrace]) -> StepReport:
+    stats = {r.rank: r.steps[step] for r in ranks if step in r.steps}
+    durations = {rank: s.duration_ns for rank, s in stats.items()}
+    slowest_rank = max(durations, key=lambda rank: (durations[rank], -rank))
+    offsets = {r.rank: r.offset_ns for r in ranks}
+    wait_ns = dict.fromkeys(stats, 0)
+    blame: Dict[int, int] = {}
+    max_skew_ns = 0
+    num_collectives = max(len(s.collectives) for s in stats.values())
+    for i in range(num_collectives):
+        arrivals = {
+            rank: s.collectives[i][0] + offsets[rank]
+            for rank, s in stats.items()
+            if i < len(s.collectives)
+        }
+        if len(arrivals) < 2:
+            continue
+        last_rank = max(
+            arrivals, key=lambda rank, arrivals=arrivals: (arrivals[rank], -rank)
+        )
+        last = arrivals[last_rank]
+        skew = last - min(arrivals.values())
+        max_skew_ns = max(max_skew_ns, skew)
+        if skew > 0:
+            blame[last_rank] = blame.get(last_rank, 0) + skew
+        for rank, arrival in arrivals.items():
+            wait_ns[rank] += last - arrival
+    if blame:
+        straggler_rank = max(blame, key=lambda rank: (blame[rank], -rank))
+    else:
+        straggler_rank = slowest_rank
+    return StepReport(
+        step, durations, slowest_rank, straggler_rank, max_skew_ns, wait_ns
+    )
+
+
+def analyze_traces(
+    paths: Iterable[str],
+    jobs: int = 1,
+    collective_pattern: Pattern = COLLECTIVE_KERNEL_PATTERN,
+) -> MergeReport:
+    """Loads the traces of all ranks, aligns their clocks and compares their steps.
+
+    Traces without `distributedInfo` are numbered by their worker names, after the
+    ranks found in the metadata of the other traces.
+    """
+    paths = find_traces(paths)
+    if jobs > 1:
+        with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+            futures = [
+                executor.submit(load_rank_trace, path, None, collective_pattern)
+                for path in paths
+            ]
+            traces = [future.result() for future in futures]
+    else:
+        traces = [load_rank_trace(path, None, collective_pattern) for path in paths]
+
+    known = [t.rank for t in traces if t.rank >= 0]
+    next_rank = max(known) + 1 if known else 0
+    workers = sorted({_worker_name(t.paths[0]) for t in traces if t.rank < 0})
+    for trace in traces:
+        if trace.rank < 0:
+            trace.rank = next_rank + workers.index(_worker_name(trace.paths[0]))
+
+    ranks = _merge_rank_traces(traces)
+    align_ranks(ranks)
+    all_steps = sorted({step for rank in ranks for step in rank.steps})
+    return MergeReport(ranks, [_report_step(step, ranks) for step in all_steps])
+
+
+def _rebase_event(
+    raw: Dict[str, Any],
+    rank: int,
+    offset_us: float,
+    threads: Dict[Tuple[Any, Any], int],
+) -> Dict[str, Any]:
+    """Moves an event to the process of its rank and to the aligned clock"""
+    thread = (raw.get("pid", 0), raw.get("tid", 0))
+    if thread not in threads:
+        threads[thread] = len(threads)
+    raw["pid"] = rank
+    raw["tid"] = threads[thread]
+    if "ts" in raw:
+        raw["ts"] = float(raw["ts"]) + offset_us
+    if "id" in raw:
+        # flows and async events are matched by id, which is only unique per rank
+        raw["id"] = f"{rank}:{raw['id']}"
+    return raw
+
+
+def write_merged_trace(ranks: List[RankTrace], path: str, codec=None):
+    """Writes the events of all ranks into one trace, with a process per rank.
+
+    Traces are streamed again, so that memory does not grow with their size. The
+    threads of all processes of a rank, including device streams, become threads
+    of the process of the rank, named after their original process and thread.
+    """
+    codec = get_codec(codec, path)
+    with codec.open(path) if codec else open(path, "wb") as f:
+        first = True
+
+        def write(event: Dict[str, Any]):
+            nonlocal first
+            f.write(b"" if first else b",\n")
+            f.write(json.dumps(event).encode("utf-8"))
+            first = False
+
+        f.write(b'{"traceEvents": [\n')
+        for rank in ranks:
+            write(
+                {
+                    "ph": "M",
+                    "name": "process_name",
+                    "pid": rank.rank,
+                    "args": {"name": f"rank {rank.rank}"},
+                }
+            )
+            write(
+                {
+                    "ph": "M",
+                    "name": "process_sort_index",
+                    "pid": rank.rank,
+                    "args": {"sort_index": rank.rank},
+                }
+            )
+            threads: Dict[Tuple[Any, Any], int] = {}
+            process_names: Dict[Any, str] = {}
+            thread_names: Dict[Tuple[Any, Any], str] = {}
+            offset_us = rank.offset_ns / 1000
+            for trace_path in rank.paths:
+                for raw in iter_trace_events(trace_path):
+                    if raw.get("ph") == "M":
+                        name = (raw.get("args") or {}).get("name")
+                        if raw.get("name") == "process_name":
+                            process_names[raw.get("pid", 0)] = name
+                        elif raw.get("name") == "thread_name":
+                            thread_names[(raw.get("pid", 0), raw.get("tid", 0))] = name
+                        if raw.get("name") in _RANK_METADATA:
+                            continue
+                    write(_rebase_event(raw, rank.rank, offset_us, threads))
+            for (pid, tid), new_tid in threads.items():
+                process_name = process_names.get(pid, pid)
+                thread_name = thread_names.get((pid, tid), tid)
+                write(
+                    {
+                        "ph": "M",
+                        "name": "thread_name",
+                        "pid": rank.rank,
+                        "tid": new_tid,
+                        "args": {"name": f"{process_name} / {thread_name}"},
+                    }
+                )
+        f.write(b'\n],\n"displayTimeUnit": "ms"}\n')
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Align per-rank profiler traces and find straggling ranks"
+    )
+    parser.add_argument("traces", nargs="+", help="trace files or directories")
+    parser.add_argument("--output", help="path of the merged trace, .gz to compress")
+    parser.add_argument("--report", help="path of the report in json")
+    parser.add_argument("--jobs", type=int, default=1, help="traces loaded in parallel")
+    parser.add_argument(
+        "--collective-pattern",
+        default=COLLECTIVE_KERNEL_PATTERN.pattern,
+        help="regex matching names of collective kernels",
+    )
+    args = parser.parse_args(argv)
+
+    report = analyze_traces(
+        args.traces,
+        jobs=args.jobs,
+        collective_pattern=re.compile(args.collective_pattern, re.IGNORECASE),
+    )
+    if not report.ranks:
+        print("No traces found", file=sys.stderr)
+        return 1
+    print(report.table())
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report.to_dict(), f, indent=2)
+    if args.output:
+        write_merged_trace(report.ranks, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
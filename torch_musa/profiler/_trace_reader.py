@@ -0,0 +1,197 @@
+"""Streaming reader of chrome traces exported by the profiler."""
+
+# pylint: disable=missing-function-docstring
+
+import gzip
+import io
+import json
+import re
+from typing import Any, Dict, Iterator, List, Optional
+
+__all__ = [
+    "open_trace",
+    "iter_trace_events",
+    "read_trace_metadata",
+    "TraceEvent",
+    "load_trace_events",
+]
+
+# categories of events executed on device
+DEVICE_CATEGORIES = frozenset(("kernel", "gpu_memcpy", "gpu_memset"))
+
+_SKIP = re.compile(r"[\s,]*")
+_CHUNK_SIZE = 1 << 22
+
+
+def open_trace(path: str):
+    """Opens a chrome trace as text, which may be gzipped whatever its suffix is"""
+    with open(path, "rb") as f:
+        magic = f.read(2)
+    if magic == b"\x1f\x8b":
+        return io.TextIOWrapper(gzip.open(path, "rb"), encoding="utf-8")
+    return open(path, "r", encoding="utf-8")  # pylint: disable=consider-using-with
+
+
+def iter_trace_events(
+    path: str, chunk_size: int = _CHUNK_SIZE
+) -> Iterator[Dict[str, Any]]:
+    """Yields elements of `traceEvents` of a chrome trace one at a time.
+
+    The file is read in chunks and every event is decoded on its own, so that memory
+    usage does not depend on the size of the trace. Both the object format, i.e.
+    {"traceEvents": [...], ...}, and the bare array format are supported.
+    """
+    decoder = json.JSONDecoder()
+    with open_trace(path) as f:
+        buf = f.read(chunk_size)
+        # locate the opening bracket of the events array
+        while True:
+            stripped = buf.lstrip()
+            if stripped.startswith("["):
+                pos = len(buf) - len(stripped) + 1
+                break
+            key = buf.find('"traceEvents"')
+            bracket = buf.find("[", key) if key >= 0 else -1
+            if bracket >= 0:
+                pos = bracket + 1
+                break
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            buf += chunk
+
+        while True:
+            pos = _SKIP.match(buf, pos).end()
+            if pos == len(buf):
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                buf, pos = chunk, 0
+                continue
+            if buf[pos] == "]":
+                return
+            try:
+                event, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                # the event is split across chunks
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    raise
+                buf, pos = buf[pos:] + chunk, 0
+                continue
+            yield event
+            pos = end
+            if pos >= chunk_size:
+                buf, pos = buf[pos:], 0
+
+
+def read_trace_metadata(path: str, chunk_size: int = _CHUNK_SIZE) -> Dict[str, Any]:
+    """Returns the top level entries of a chrome trace written before `traceEvents`.
+
+    The profiler writes its metadata, e.g. `distributedInfo`, ahead of the events, so
+    only the head of the trace is read. Returns an empty dict for the array format.
+    """
+    with open_trace(path) as f:
+        buf = ""
+        while True:
+            key = buf.find('"traceEvents"')
+            if key >= 0:
+                break
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return {}
+            buf += chunk
+    head = buf[:key].rstrip().rstrip(",")
+    if not head.lstrip().startswith("{"):
+        return {}
+    try:
+        return json.loads(head + "}")
+    except json.JSONDecodeError:
+        return {}
+
+
+class TraceEvent:
+    """A complete ("X") event of a chrome trace.
+
+    It provides the attributes of profiler events used by `_utils`, i.e. `id`, `name`,
+    `start_time_ns`, `end_time_ns`, `duration_time_ns`, `parent` and `children`.
+    """
+
+    __slots__ = (
+        "id",
+        "name",
+        "cat",
+        "pid",
+        "tid",
+        "start_time_ns",
+        "duration_time_ns",
+        "correlation",
+        "external_id",
+        "args",
+        "parent",
+        "children",
+    )
+
+    def __init__(self, event_id: int, raw: Dict[str, Any], keep_args: bool = False):
+        args = raw.get("args") or {}
+        self.id = event_id  # pylint: disable=invalid-name
+        self.name = raw.get("name", "")
+        self.cat = raw.get("cat", "")
+        self.pid = raw.get("pid", 0)
+        self.tid = raw.get("tid", 0)
+        self.start_time_ns = int(round(float(raw.get("ts", 0)) * 1000))
+        self.duration_time_ns = int(round(float(raw.get("dur", 0)) * 1000))
+        self.correlation = args.get("correlation")
+        self.external_id = args.get("External id")
+        self.args = args if keep_args else None
+        self.parent: Optional["TraceEvent"] = None
+        self.children: List["TraceEvent"] = []
+
+    @property
+    def end_time_ns(self) -> int:
+        return self.start_time_ns + self.duration_time_ns
+
+    @property
+    def is_device(self) -> bool:
+        return self.cat in DEVICE_CATEGORIES
+
+    def __repr__(self):
+        return (
+            f"TraceEvent({self.name}, {self.cat}, "
+            f"{self.start_time_ns}, {self.duration_time_ns})"
+        )
+
+
+def build_event_tree(events: List[TraceEvent]) -> List[TraceEvent]:
+    """Links host events of each (pid, tid) by interval nesting, returns the roots"""
+    roots = []
+    stack: List[TraceEvent] = []
+    events = sorted(
+        events,
+        key=lambda e: (str(e.pid), str(e.tid), e.start_time_ns, -e.duration_time_ns),
+    )
+    thread = None
+    for event in events:
+        if (event.pid, event.tid) != thread:
+            thread = (event.pid, event.tid)
+            stack.clear()
+        while stack and stack[-1].end_time_ns <= event.start_time_ns:
+            stack.pop()
+        if stack:
+            event.parent = stack[-1]
+            stack[-1].children.append(event)
+        else:
+            roots.append(event)
+        stack.append(event)
+    return roots
+
+
+def load_trace_events(path: str, keep_args: bool = False) -> List[TraceEvent]:
+    """Loads complete events of a chrome trace, and links host events into trees"""
+    events = [
+        TraceEvent(i, raw, keep_args)
+        for i, raw in enumerate(iter_trace_events(path))
+        if raw.get("ph") == "X"
+    ]
+    build_event_tree([e for e in events if not e.is_device])
+    return events
@@ -0,0 +1,255 @@
+"""Compressed and background export of chrome traces.
+
+Kineto writes a trace to a path by itself, so instead of letting it write an
+uncompressed temp file and compressing that file afterwards, the trace is written
+into a FIFO, which a helper process drains into the compressed destination while
+the trace is being written. The helper is this very file run as a script, so it
+only depends on the standard library (and `zstandard` for zstd).
+"""
+
+# pylint: disable=missing-function-docstring, consider-using-with
+
+import argparse
+import concurrent.futures
+import errno
+import gzip
+import os
+import shutil
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
+from typing import Callable, Optional, Union
+from warnings import warn
+
+__all__ = [
+    "TraceCodec",
+    "GzipCodec",
+    "ZstdCodec",
+    "get_codec",
+    "zstd_available",
+    "write_compressed",
+    "BackgroundTraceWriter",
+]
+
+_COPY_CHUNK = 1 << 20
+
+
+def zstd_available() -> bool:
+    try:
+        import zstandard  # pylint: disable=import-outside-toplevel,unused-import
+    except ImportError:
+        return False
+    return True
+
+
+class TraceCodec:
+    """Compression format of exported traces"""
+
+    name = "none"
+    suffix = ""
+
+    def __init__(self, level: Optional[int] = None):
+        self.level = level
+
+    def open(self, path: str):
+        """Opens path as a binary file, whose written content is compressed"""
+        return open(path, "wb")
+
+    def __repr__(self):
+        return f"{type(self).__name__}(level={self.level})"
+
+
+class GzipCodec(TraceCodec):
+    """Gzip compression, the level ranges from 0 to 9"""
+
+    name = "gzip"
+    suffix = ".gz"
+
+    def __init__(self, level: Optional[int] = 6):
+        super().__init__(level)
+
+    def open(self, path: str):
+        return gzip.open(path, "wb", compresslevel=self.level)
+
+
+class ZstdCodec(TraceCodec):
+    """Zstandard compression, which requires the zstandard package"""
+
+    name = "zstd"
+    suffix = ".zst"
+
+    def __init__(self, level: Optional[int] = 3):
+        if not zstd_available():
+            raise RuntimeError("zstd codec requires the zstandard package")
+        super().__init__(level)
+
+    def open(self, path: str):
+        import zstandard  # pylint: disable=import-outside-toplevel
+
+        compressor = zstandard.ZstdCompressor(level=self.level)
+        return compressor.stream_writer(open(path, "wb"), closefd=True)
+
+
+_CODECS = {codec.name: codec for codec in (TraceCodec, GzipCodec, ZstdCodec)}
+
+
+def get_codec(
+    codec: Union[None, str, TraceCodec] = None, path: Optional[str] = None
+) -> Optional[TraceCodec]:
+    """Returns the codec given by name or instance, or inferred from the suffix of path.
+
+    Returns None if the trace is not compressed.
+    """
+    if isinstance(codec, TraceCodec):
+        return None if codec.name == "none" else codec
+    if codec is None:
+        if path is None:
+            return None
+        for codec_cls in (GzipCodec, ZstdCodec):
+            if path.endswith(codec_cls.suffix):
+                return codec_cls()
+        return None
+    if codec not in _CODECS:
+        raise ValueError(
+            f"Unknown trace codec {codec}, expected one of {list(_CODECS)}"
+        )
+    return get_codec(_CODECS[codec]())
+
+
+def _compress_file(src: str, dst: str, codec: TraceCodec):
+    with open(src, "rb") as fin, codec.open(dst) as fout:
+        shutil.copyfileobj(fin, fout, _COPY_CHUNK)
+
+
+def _release_reader(fifo: str):
+    """Opens and closes the write end of fifo, so that a reader still waiting for
+    a writer sees EOF instead of blocking forever"""
+    try:
+        write_fd = os.open(fifo, os.O_WRONLY | os.O_NONBLOCK)
+    except OSError as exception:
+        if exception.errno not in (errno.ENXIO, errno.ENOENT):
+            raise
+        return
+    os.close(write_fd)
+
+
+def _wait_pump(pump: subprocess.Popen, fifo: str) -> int:
+    """Waits for the reader process, releasing it until it exits, since it may not
+    have opened the FIFO yet when save_fn returns"""
+    while True:
+        _release_reader(fifo)
+        try:
+            return pump.wait(timeout=0.05)
+        except subprocess.TimeoutExpired:
+            continue
+
+
+def write_compressed(save_fn: Callable[[str], object], path: str, codec: TraceCodec):
+    """Calls save_fn with a path to write a trace to, and stores it compressed to path.
+
+    On platforms supporting FIFOs, the uncompressed trace never reaches the disk.
+    Returns what save_fn returns.
+    """
+    tmp_dir = tempfile.mkdtemp(prefix="musa_trace_")
+    tmp_path = os.path.join(tmp_dir, "trace.json")
+    # second name of the FIFO, which still refers to it if tmp_path gets replaced
+    fifo = os.path.join(tmp_dir, "pipe")
+    try:
+        try:
+            os.mkfifo(fifo)
+            os.link(fifo, tmp_path)
+        except (AttributeError, OSError):
+            # no FIFO, fall back to an uncompressed temp file
+            if os.path.exists(fifo):
+                os.remove(fifo)
+            result = save_fn(tmp_path)
+            _compress_file(tmp_path, path, codec)
+            return result
+
+        # the reader is a separate process, since save_fn may hold the GIL
+        pump = subprocess.Popen(
+            [
+                sys.executable,
+                os.path.abspath(__file__),
+                fifo,
+                path,
+                "--codec",
+                codec.name,
+                "--level",
+                str(codec.level),
+            ]
+        )
+        try:
+            result = save_fn(tmp_path)
+        finally:
+            return_code = _wait_pump(pump, fifo)
+        if not stat.S_ISFIFO(os.lstat(tmp_path).st_mode):
+            # the writer replaced the FIFO by a regular file, e.g. written by rename
+            _compress_file(tmp_path, path, codec)
+        elif return_code != 0:
+            raise RuntimeError(f"Failed to compress trace to {path}")
+        return result
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _report_failure(future: concurrent.futures.Future):
+    exception = future.exception()
+    if exception is not None:
+        warn(f"Failed to export trace in background: {exception}")
+
+
+class BackgroundTraceWriter:
+    """Runs trace exports one after another on a background thread"""
+
+    def __init__(self):
+        self.executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self.futures = []
+        # exports may be submitted from a thread running async trace handlers
+        self.lock = threading.Lock()
+
+    def submit(self, func: Callable, *args, **kwargs) -> concurrent.futures.Future:
+        with self.lock:
+            if self.executor is None:
+                self.executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="musa_trace_writer"
+                )
+            pending = []
+            for f in self.futures:
+                if f.done():
+                    _report_failure(f)
+                else:
+                    pending.append(f)
+            future = self.executor.submit(func, *args, **kwargs)
+            pending.append(future)
+            self.futures = pending
+        return future
+
+    def wait(self):
+        """Waits for all submitted exports, failures are reported as warnings"""
+        with self.lock:
+            futures, self.futures = self.futures, []
+        for future in futures:
+            _report_failure(future)
+
+
+def _main():
+    parser = argparse.ArgumentParser(description="Compress a trace read from a FIFO")
+    parser.add_argument("src")
+    parser.add_argument("dst")
+    parser.add_argument("--codec", default="gzip")
+    parser.add_argument("--level", default="None")
+    args = parser.parse_args()
+    level = None if args.level == "None" else int(args.level)
+    codec = _CODECS[args.codec](level)
+    _compress_file(args.src, args.dst, codec)
+
+
+if __name__ == "__main__":
+    _main()
@@ -1,8 +1,10 @@
 """Some common utils function definitions."""
 # pylint: disable=invalid-name, missing-class-docstring, missing-function-docstring,
 
+import bisect
 import functools
 import re
+import statistics
 from collections import deque
 from dataclasses import dataclass
 from typing import Dict, List
@@ -12,6 +14,8 @@ from torch.autograd import _KinetoEvent
 from torch.autograd.profiler import profile
 from torch.profiler import DeviceType
 
+from ._trace_reader import load_trace_events, TraceEvent
+
 
 def _traverse(tree, next_fn, children_fn=lambda x: x.children, reverse: bool = False):
     order = reversed if reverse else lambda x: x
@@ -340,6 +344,229 @@ Percentage idle time: {self.metrics[event].fraction_idle_time * 100:.2f}%
         return event_list
 
 
+class TraceEvaluation(BasicEvaluation):
+    """
+    Offline counterpart of BasicEvaluation, which works on a chrome trace exported by
+    `export_chrome_trace` (optionally gzipped) instead of a live profile, so that traces
+    of production jobs can be analyzed on any box.
+
+    The trace is read by streaming, launches are joined to kernels through a hash map of
+    correlation ids, and every metric is computed in O(N log N).
+    """
+
+    # pylint: disable=super-init-not-called
+    def __init__(self, trace_path: str, launch_names=("musaLaunchKernel",)):
+        self.profile = None
+        self.trace_path = trace_path
+        self.launch_names = frozenset(launch_names)
+        self.trace_events: List[TraceEvent] = load_trace_events(trace_path)
+        self.metrics: Dict[EventKey, EventMetrics] = {}
+        self.compute_self_time()
+        self.event_keys = sorted(self.metrics, key=lambda x: x.event.start_time_ns)
+        self.events = [e.event for e in self.event_keys]
+        self.musa_events: List[TraceEvent] = []
+        self.queue_depth_list = self.compute_queue_depth()
+        self.compute_idle_time()
+
+    def compute_self_time(self):
+        """
+        Computes event's self time(total time - time in child ops) of host events.
+        """
+        for event in self.trace_events:
+            if event.is_device:
+                continue
+            self_time = event.duration_time_ns - sum(
+                child.duration_time_ns for child in event.children
+            )
+            self.metrics[EventKey(event)] = EventMetrics(
+                duration_time_ns=event.duration_time_ns, self_time_ns=self_time
+            )
+
+    def compute_queue_depth(self):
+        """
+        Computes queue_depth at each event, see BasicEvaluation.compute_queue_depth.
+        """
+        launch_events = sorted(
+            (e for e in self.trace_events if e.name in self.launch_names),
+            key=lambda x: x.start_time_ns,
+        )
+        kernel_events = sorted(
+            (
+                e
+                for e in self.trace_events
+                if e.is_device and "mem" not in e.name.lower()
+            ),
+            key=lambda x: x.start_time_ns,
+        )
+        self.musa_events = sorted(
+            launch_events + kernel_events, key=lambda x: x.start_time_ns
+        )
+
+        kernel_index: Dict[int, int] = {}
+        for i, kernel in enumerate(kernel_events):
+            kernel_index.setdefault(kernel.correlation, i)
+        kernel_starts = [e.start_time_ns for e in kernel_events]
+        launch_ids = {id(e) for e in launch_events}
+        device_ids = launch_ids | {id(e) for e in kernel_events}
+
+        spawned_kernel_index = -1
+        queue_depth_list: List[Interval] = []
+        # launches are host events as well, which must be counted once
+        host_events = [e for e in self.events if id(e) not in launch_ids]
+        all_events = sorted(
+            launch_events + kernel_events + host_events, key=lambda x: x.start_time_ns
+        )
+        for event in all_events:
+            if id(event) in launch_ids:
+                index = kernel_index.get(event.correlation)
+                if index is not None:
+                    spawned_kernel_index = index
+            # kernels which have started, i.e. left the queue
+            current_kernel_index = bisect.bisect_right(
+                kernel_starts, event.start_time_ns
+            )
+            current_queue_depth = spawned_kernel_index - current_kernel_index + 1
+            current_queue_depth = max(current_queue_depth, 0)
+            if id(event) in device_ids:
+                queue_depth_list.append(
+                    Interval(
+                        event.start_time_ns, event.end_time_ns, current_queue_depth
+                    )
+                )
+            if not event.is_device:
+                self.metrics[EventKey(event)].queue_depth = current_queue_depth
+        return queue_depth_list
+
+    def compute_idle_time(self):
+        """
+        Computes idle time of the profile, each event looks up its overlap with the
+        merged idle intervals by bisection.
+        """
+        idle = False
+        idle_start = 0
+        idle_intervals: List[Interval] = []
+        if self.queue_depth_list and self.events:
+            idle_intervals += [
+                Interval(self.events[0].start_time_ns, self.queue_depth_list[0].start),
+                Interval(self.queue_depth_list[-1].end, self.events[-1].end_time_ns),
+            ]
+        for data_point in self.queue_depth_list:
+            if data_point.queue_depth == 0 and not idle:
+                idle_start = data_point.end
+                idle = True
+            if data_point.queue_depth > 0 and idle:
+                idle_intervals.append(Interval(idle_start, data_point.start))
+                idle = False
+
+        merged = MergedIntervals(idle_intervals)
+        for event_key, metrics in self.metrics.items():
+            metrics.idle_time_ns = merged.overlap(
+                event_key.event.start_time_ns, event_key.event.end_time_ns
+            )
+
+    def falling_intervals(self, bottom_threshold=0, top_threshold=4):
+        """
+        Finds intervals in which the queue depth falls from a peak of at least
+        top_threshold to bottom_threshold, in linear time.
+        """
+        queue_depth_list = list(reversed(self.queue_depth_list))
+        qd_values = [e.queue_depth for e in queue_depth_list]
+        # runs of positive queue depth, as (first index, end index or None, peak index)
+        runs = []
+        i = 0
+        while i < len(qd_values):
+            if qd_values[i] <= bottom_threshold:
+                i += 1
+                continue
+            start, peak = i, i
+            while i < len(qd_values) and qd_values[i] > bottom_threshold:
+                if qd_values[i] > qd_values[peak]:
+                    peak = i
+                i += 1
+            runs.append((start, i if i < len(qd_values) else None, peak))
+        runs = [run for run in runs if qd_values[run[2]] >= top_threshold]
+
+        decrease_interval = []
+        run_index = 0
+        i = 0
+        while i < len(qd_values):
+            if qd_values[i] > bottom_threshold:
+                i += 1
+                continue
+            while run_index < len(runs) and runs[run_index][0] <= i:
+                run_index += 1
+            if run_index < len(runs):
+                _, end, peak = runs[run_index]
+                decrease_interval.append(
+                    Interval(queue_depth_list[peak].start, queue_depth_list[i].start)
+                )
+                i = end if end is not None else i
+            i += 1
+        return decrease_interval
+
+    def rank_events(self, length):
+        """
+        Filter and Rank the events, see BasicEvaluation.rank_events.
+
+        Parameters:
+            length(int): The number of events to return.
+        """
+        merged = MergedIntervals(self.falling_intervals())
+        event_list = [
+            event
+            for event in self.metrics
+            if merged.overlap(event.event.start_time_ns, event.event.end_time_ns)
+        ]
+        if len(event_list) < 2:
+            return event_list[:length]
+        self_time = [float(self.metrics[event].self_time_ns) for event in event_list]
+        idle_time = [self.metrics[event].fraction_idle_time for event in event_list]
+
+        def normalize(values):
+            std = statistics.stdev(values)
+            mean = statistics.fmean(values)
+            return [(v - mean) / std if std else float("nan") for v in values]
+
+        scores = [
+            gain + 0.6 * self_
+            for gain, self_ in zip(normalize(idle_time), normalize(self_time))
+        ]
+        order = sorted(range(len(event_list)), key=lambda i: scores[i], reverse=True)
+        return [event_list[i] for i in order[:length]]
+
+
+class MergedIntervals:
+    """
+    Union of intervals, supporting overlap queries in O(log N).
+    """
+
+    def __init__(self, intervals: List[Interval]):
+        self.starts: List[int] = []
+        self.ends: List[int] = []
+        for interval in sorted(intervals, key=lambda x: x.start):
+            if interval.end <= interval.start:
+                continue
+            if self.ends and interval.start <= self.ends[-1]:
+                self.ends[-1] = max(self.ends[-1], interval.end)
+            else:
+                self.starts.append(interval.start)
+                self.ends.append(interval.end)
+        self.prefix = [0]
+        for start, end in zip(self.starts, self.ends):
+            self.prefix.append(self.prefix[-1] + end - start)
+
+    def overlap(self, start: int, end: int) -> int:
+        """Length of the overlap of [start, end) with the union"""
+        lo = bisect.bisect_right(self.ends, start)
+        hi = bisect.bisect_left(self.starts, end)
+        if lo >= hi:
+            return 0
+        total = self.prefix[hi] - self.prefix[lo]
+        total -= max(0, start - self.starts[lo])
+        total -= max(0, self.ends[hi - 1] - end)
+        return total
+
+
 def index_of_first_match(seq, predicate, start=0, end=None):
     if end is None or end >= len(seq):
         end = len(seq)
@@ -1,14 +1,25 @@
 """Torch musa profiler definition."""
 
-import gzip
+import concurrent.futures
+import copy
 import json
 import os
 import socket
-import tempfile
 import time
+from collections import deque
 from enum import Enum
 from functools import partial
-from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 from warnings import warn
 
 import torch
@@ -22,6 +33,12 @@ from torch._C._profiler import (
 )
 from torch.autograd import kineto_available, ProfilerActivity
 from . import _memory_profiler
+from ._trace_writer import (
+    BackgroundTraceWriter,
+    get_codec,
+    TraceCodec,
+    write_compressed,
+)
 
 from ..autograd import profiler as prof
 
@@ -87,6 +104,7 @@ class _KinetoProfile:
         with_flops: bool = False,
         with_modules: bool = False,
         experimental_config: Optional[_ExperimentalConfig] = None,
+        columnar_events: bool = False,
     ):
         self.activities = set(activities) if activities else supported_activities()
         self.record_shapes = record_shapes
@@ -95,7 +113,9 @@ class _KinetoProfile:
         self.with_stack = with_stack
         self.with_modules = with_modules
         self.experimental_config = experimental_config
+        self.columnar_events = columnar_events
         self.profiler: Optional[prof.profile] = None
+        self._trace_writer: Optional[BackgroundTraceWriter] = None
 
     def start(self):
         self.prepare_trace()
@@ -116,6 +136,7 @@ class _KinetoProfile:
             with_modules=self.with_modules,
             use_kineto=True,
             experimental_config=self.experimental_config,
+            columnar_events=self.columnar_events,
         )
         self.profiler._prepare_trace()
 
@@ -144,24 +165,42 @@ class _KinetoProfile:
         assert self.profiler is not None
         self.profiler.__exit__(None, None, None)
 
-    def export_chrome_trace(self, path: str):
+    def export_chrome_trace(
+        self,
+        path: str,
+        codec: Union[None, str, TraceCodec] = None,
+        background: bool = False,
+    ):
         """
         Exports the collected trace in Chrome JSON format.
+
+        Args:
+            path (str): destination of the trace.
+            codec (str or TraceCodec, optional): compression of the trace, "gzip" or
+                "zstd", inferred from the suffix of ``path`` if not given. The trace is
+                compressed while being written, without an uncompressed temp file.
+            background (bool): export on a background thread and return a
+                ``concurrent.futures.Future`` at once, see ``wait_for_exports``.
         """
         assert self.profiler
-        if path.endswith(".gz"):
-            # pylint: disable=R1732
-            file_handle = tempfile.NamedTemporaryFile(
-                "w+t", suffix=".json", delete=False
+        profiler = self.profiler
+        codec = get_codec(codec, path)
+        if codec is None:
+            export_fn = partial(profiler.export_chrome_trace, path)
+        else:
+            export_fn = partial(
+                write_compressed, profiler.export_chrome_trace, path, codec
             )
-            file_handle.close()
-            retvalue = self.profiler.export_chrome_trace(file_handle.name)
-            with open(file_handle.name, encoding="UTF-8") as fin:
-                with gzip.open(path, "wt") as fout:
-                    fout.writelines(fin)
-            os.remove(file_handle.name)
-            return retvalue
-        return self.profiler.export_chrome_trace(path)
+        if not background:
+            return export_fn()
+        if self._trace_writer is None:
+            self._trace_writer = BackgroundTraceWriter()
+        return self._trace_writer.submit(export_fn)
+
+    def wait_for_exports(self):
+        """Waits for traces exported in background to be written"""
+        if self._trace_writer is not None:
+            self._trace_writer.wait()
 
     def export_stacks(self, path: str, metric: str = "self_cpu_time_total"):
         """Save stack traces in a file in a format suitable for visualization.
@@ -235,6 +274,24 @@ class _KinetoProfile:
         assert self.profiler is not None and self.profiler.kineto_results is not None
         return _memory_profiler.MemoryProfile(self.profiler.kineto_results)
 
+    def export_memory_curves(self, path: str, device: Optional[str] = None):
+        """Saves the memory in use by each category of Tensors over time.
+
+        The file has a `time_ns` column and one column of bytes in use per category,
+        saved as NumPy arrays (.npz) or, if path ends with ".parquet", as a Parquet
+        table, which requires pyarrow.
+
+        Args:
+            path (str): file to save the curves to.
+            device (str, optional): only count Tensors on this device, e.g. "musa:0".
+
+        Returns:
+            The peak bytes in use of each category and in total.
+        """
+        curves = self._memory_profile().memory_curves(device)
+        curves.save(path)
+        return curves.peak()
+
 
 class ProfilerAction(Enum):
     """
@@ -296,14 +353,24 @@ def _default_schedule_fn(_: int) -> ProfilerAction:
 
 
 def tensorboard_trace_handler(
-    dir_name: str, worker_name: Optional[str] = None, use_gzip: bool = False
+    dir_name: str,
+    worker_name: Optional[str] = None,
+    use_gzip: bool = False,
+    codec: Union[None, str, TraceCodec] = None,
+    background: bool = False,
 ):
     """
     Outputs tracing files to directory of ``dir_name``, then that directory can be
     directly delivered to tensorboard as logdir.
     ``worker_name`` should be unique for each worker in distributed scenario,
     it will be set to '[hostname]_[pid]' by default.
+    ``codec`` selects the compression of traces ("gzip" or "zstd"), ``use_gzip`` is
+    the same as ``codec="gzip"``. With ``background`` set, traces are exported on a
+    background thread, so that ``profile.step()`` does not wait for compression.
     """
+    if codec is None and use_gzip:
+        codec = "gzip"
+    trace_codec = get_codec(codec)
 
     def handler_fn(prof_tool) -> None:
         nonlocal worker_name
@@ -317,13 +384,77 @@ def tensorboard_trace_handler(
         if not worker_name:
             worker_name = f"{socket.gethostname()}_{str(os.getpid())}"
         file_name = f"{worker_name}.{int(time.time() * 1000)}.pt.trace.json"
-        if use_gzip:
-            file_name = file_name + ".gz"
-        prof_tool.export_chrome_trace(os.path.join(dir_name, file_name))
+        if trace_codec is not None:
+            file_name = file_name + trace_codec.suffix
+        prof_tool.export_chrome_trace(
+            os.path.join(dir_name, file_name),
+            codec=trace_codec or "none",
+            background=background,
+        )
 
     return handler_fn
 
 
+class _TraceReadyWorker:
+    """Processes finished traces and calls the trace handler on a background thread,
+    holding at most max_pending traces"""
+
+    def __init__(
+        self,
+        handler: Optional[Callable[..., Any]],
+        max_pending: int = 1,
+        backpressure: str = "drop",
+    ):
+        if backpressure not in ("drop", "wait"):
+            raise ValueError(
+                f"backpressure must be 'drop' or 'wait', got {backpressure}"
+            )
+        self.handler = handler
+        self.max_pending = max(1, max_pending)
+        self.backpressure = backpressure
+        self.executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self.futures: Deque[concurrent.futures.Future] = deque()
+        self.num_dropped = 0
+
+    def _run(self, snapshot: "profile"):
+        snapshot.profiler._process_results()
+        if self.handler:
+            self.handler(snapshot)
+
+    @staticmethod
+    def _report(future: concurrent.futures.Future):
+        exception = future.exception()
+        if exception is not None:
+            warn(f"Trace handler failed in background: {exception}")
+
+    def submit(self, snapshot: "profile") -> bool:
+        """Queues a finished trace, returns False if it is dropped"""
+        # traces are processed in order, so the done ones are at the front
+        while self.futures and self.futures[0].done():
+            self._report(self.futures.popleft())
+        if len(self.futures) >= self.max_pending:
+            if self.backpressure == "drop":
+                self.num_dropped += 1
+                warn(
+                    "Trace handler is busy, dropped the trace of step "
+                    f"{snapshot.step_num}"
+                )
+                return False
+            while len(self.futures) >= self.max_pending:
+                self._report(self.futures.popleft())
+        if self.executor is None:
+            self.executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="musa_trace_ready"
+            )
+        self.futures.append(self.executor.submit(self._run, snapshot))
+        return True
+
+    def wait(self):
+        """Waits for all queued traces"""
+        while self.futures:
+            self._report(self.futures.popleft())
+
+
 # pylint: disable=C0103
 class profile(_KinetoProfile):
     """Profiler context manager.
@@ -346,6 +477,19 @@ class profile(_KinetoProfile):
     _ExperimentalConfig) : A set of experimental options used for Kineto library features. Note,
     backward compatibility is not guaranteed.
 
+        async_trace_ready (bool): process finished traces (parse results and call
+            ``on_trace_ready``) on a background thread, so that ``step()`` does not wait
+            for them. The handler then gets a copy of the profiler bound to its trace.
+        max_pending_traces (int): number of finished traces the background thread may
+            hold, including the one being processed.
+        backpressure (str): what to do with a finished trace when ``max_pending_traces``
+            are pending, "drop" discards it (counted by ``num_dropped_traces``), "wait"
+            blocks ``step()`` until one is done.
+        columnar_events (bool): keep events in a ``ColumnarEventList``, which is
+            filled directly from the profiler results, whose summaries run on arrays
+            and which creates ``FunctionEvent`` objects only for the events that are
+            indexed. Suited to long captures, whose peak memory it lowers.
+
         use_musa (bool):
             .. deprecated:: 1.8.1
                 use ``activities`` instead.
@@ -443,6 +587,10 @@ class profile(_KinetoProfile):
         with_flops: bool = False,
         with_modules: bool = False,
         experimental_config: Optional[_ExperimentalConfig] = None,
+        async_trace_ready: bool = False,
+        max_pending_traces: int = 1,
+        backpressure: str = "drop",
+        columnar_events: bool = False,
         # deprecated:
         use_musa: Optional[bool] = None,
     ):
@@ -464,6 +612,7 @@ class profile(_KinetoProfile):
             with_flops=with_flops,
             with_modules=with_modules,
             experimental_config=experimental_config,
+            columnar_events=columnar_events,
         )
 
         if schedule:
@@ -474,6 +623,11 @@ class profile(_KinetoProfile):
             self.schedule = _default_schedule_fn
             self.record_steps = False
         self.on_trace_ready = on_trace_ready
+        self._trace_worker: Optional[_TraceReadyWorker] = None
+        if async_trace_ready:
+            self._trace_worker = _TraceReadyWorker(
+                on_trace_ready, max_pending_traces, backpressure
+            )
         self.step_num = 0
         self.current_action = self.schedule(self.step_num)
         self.step_rec_fn: Optional[prof.record_function] = None
@@ -565,6 +719,12 @@ class profile(_KinetoProfile):
         if self.record_steps and self.step_rec_fn:
             self.step_rec_fn.__exit__(None, None, None)
         self._transit_action(self.current_action, None)
+        if self._trace_worker is not None:
+            self._trace_worker.wait()
+            if self.profiler is not None:
+                # results of a dropped trace are still available to the caller
+                self.profiler._process_results()
+        self.wait_for_exports()
 
     def step(self):
         """
@@ -585,8 +745,28 @@ class profile(_KinetoProfile):
             # pylint: disable=C2801
             self.step_rec_fn.__enter__()
 
+    @property
+    def num_dropped_traces(self) -> int:
+        """Number of finished traces discarded since the background thread was busy"""
+        return 0 if self._trace_worker is None else self._trace_worker.num_dropped
+
+    def stop_trace(self):
+        if self._trace_worker is None:
+            super().stop_trace()
+            return
+        # results are processed by the background thread, or on demand in stop()
+        assert self.profiler is not None
+        self.profiler._stop_trace()
+
     def _trace_ready(self):
-        if self.on_trace_ready:
+        if self._trace_worker is not None:
+            if self._trace_writer is None:
+                # shared with snapshots, so that stop() waits for their exports too
+                self._trace_writer = BackgroundTraceWriter()
+            snapshot = copy.copy(self)
+            snapshot._trace_worker = None
+            self._trace_worker.submit(snapshot)
+        elif self.on_trace_ready:
             self.on_trace_ready(self)
 
     def _transit_action(self, prev_action, current_action):
@@ -2,10 +2,17 @@
 # pylint: disable=broad-exception-caught,broad-exception-raised,redefined-builtin,unused-argument
 import os
 import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import pickle
 import torch
 from torch.utils._python_dispatch import TorchDispatchMode
+from .op_fingerprint import FingerprintRecorder, OpSampler
+from .op_record_store import OpRecordStore
+
+DUMP_FORMATS = ("pickle", "store")
 
 
 class ModuleInfo(object):
@@ -13,27 +20,38 @@ class ModuleInfo(object):
     A class to store information about a module in a neural network, including its name,
     relationship to other modules (parent and children), and whether the module is a leaf
     or is being executed in a forward or backward pass.
+
+    Nodes are recycled: a module called again under the same parent and in the same pass
+    maps to the existing node, so the tree stays bounded by the model structure across
+    steps. Each node also aggregates op count, mismatches and time of ops run inside it.
     """
 
     def __init__(self, name, father, is_leaf=False, is_forward=True) -> None:
-        self.name = name  # Name of the module
+        self.name = sys.intern(name)  # Name of the module
         self.father = father  # Parent module in the hierarchy
         self.children = []  # List of child modules
+        self.children_index = {}  # (name, is_forward) -> child, to recycle child nodes
         self.is_leaf = is_leaf  # Flag indicating if the module is a leaf module
-        self.is_forward = is_forward  # Flag indicating if the module is in the forward pass
+        # Flag indicating if the module is in the forward pass
+        self.is_forward = is_forward
+        # The hierarchical name never changes, so it is computed once at creation
+        if father is None or father.prefixed_name == "":
+            self.prefixed_name = self.name
+        else:
+            self.prefixed_name = sys.intern(f"{father.prefixed_name}/{self.name}")
+        self.op_full_names = {}  # op name -> full name of the op run inside this module
+        self.op_count = 0
+        self.mismatch_count = 0
+        self.elapsed = 0.0
 
     def name_with_prefix(self):
         """
-        Constructs the module's full name with hierarchical prefix based on parent names.
+        Returns the module's full name with hierarchical prefix based on parent names.
 
         Returns:
         str: The full hierarchical name of the module.
         """
-        if self.father is None or self.father.name_with_prefix() == "":
-            prefix = ""
-        else:
-            prefix = self.father.name_with_prefix() + "/"
-        return prefix + self.name
+        return self.prefixed_name
 
     def full_name(self):
         """
@@ -45,7 +63,39 @@ class ModuleInfo(object):
         """
         is_forward = self.is_forward if not self.is_leaf else self.father.is_forward
         suffix = "(forward)" if is_forward else "(backward)"
-        return self.name_with_prefix() + suffix
+        return self.prefixed_name + suffix
+
+    def get_child(self, name, is_forward):
+        """
+        Returns the child module named `name` of the given pass, creating it on first use.
+        """
+        key = (name, is_forward)
+        child = self.children_index.get(key)
+        if child is None:
+            child = ModuleInfo(name, father=self, is_forward=is_forward)
+            self.children_index[key] = child
+            self.children.append(child)
+        return child
+
+    def op_full_name(self, op_name):
+        """
+        Returns the full name of an op run inside this module, which is cached and interned.
+        """
+        full_name = self.op_full_names.get(op_name)
+        if full_name is None:
+            full_name = sys.intern(
+                ModuleInfo(op_name, father=self, is_leaf=True).full_name()
+            )
+            self.op_full_names[op_name] = full_name
+        return full_name
+
+    def record_op(self, mismatch=False, elapsed=0.0):
+        """
+        Accumulates an op run inside this module into its summary.
+        """
+        self.op_count += 1
+        self.mismatch_count += int(mismatch)
+        self.elapsed += elapsed
 
 
 # Initialize root module info as the base of the module hierarchy
@@ -53,6 +103,76 @@ root_module_info = ModuleInfo(name="", father=None)
 current_module_info = root_module_info
 
 
+def reset_module_tracker(clear=False):
+    """
+    Moves the current module back to the root, e.g. if an exception left hooks unbalanced.
+
+    Parameters:
+    - clear (bool): If True, drops the whole module tree and its summary as well.
+    """
+    global root_module_info, current_module_info
+    if clear:
+        root_module_info = ModuleInfo(name="", father=None)
+    current_module_info = root_module_info
+
+
+def module_summary(root=None):
+    """
+    Aggregates op count, mismatches and time of every module, including ops run inside
+    its descendants.
+
+    Parameters:
+    - root (ModuleInfo): The module to start from, the root of the tracked tree by default.
+
+    Returns:
+    - list[tuple]: (full name, op count, mismatch count, elapsed seconds) per module in
+    depth-first order, modules without any op are skipped.
+    """
+    root = root_module_info if root is None else root
+    order, stack = [], [root]
+    while stack:
+        module_info = stack.pop()
+        order.append(module_info)
+        stack.extend(reversed(module_info.children))
+    totals = {}
+    for module_info in reversed(order):  # children are aggregated before their parent
+        op_count, mismatch_count, elapsed = (
+            module_info.op_count,
+            module_info.mismatch_count,
+            module_info.elapsed,
+        )
+        for child in module_info.children:
+            child_total = totals[id(child)]
+            op_count += child_total[0]
+            mismatch_count += child_total[1]
+            elapsed += child_total[2]
+        totals[id(module_info)] = (op_count, mismatch_count, elapsed)
+    summary = []
+    for module_info in order:
+        op_count, mismatch_count, elapsed = totals[id(module_info)]
+        if op_count > 0:
+            name = (
+                module_info.full_name() if module_info.father is not None else "<root>"
+            )
+            summary.append((name, op_count, mismatch_count, elapsed))
+    return summary
+
+
+def print_module_summary(root=None):
+    """
+    Prints the result of `module_summary` as a table.
+    """
+    summary = module_summary(root)
+    if not summary:
+        return
+    name_width = max(len(name) for name, *_ in summary)
+    print(f"{'module':<{name_width}}  {'ops':>8}  {'mismatches':>10}  {'time(s)':>10}")
+    for name, op_count, mismatch_count, elapsed in summary:
+        print(
+            f"{name:<{name_width}}  {op_count:>8}  {mismatch_count:>10}  {elapsed:>10.4f}"
+        )
+
+
 def pre_forward_hook(module, input):
     """
     Hook to be executed before a module's forward pass. It updates the module hierarchy
@@ -63,9 +183,7 @@ def pre_forward_hook(module, input):
     - input: The input to the forward method of the module.
     """
     global current_module_info
-    module_info = ModuleInfo(module.__class__.__name__, father=current_module_info, is_forward=True)
-    current_module_info.children.append(module_info)
-    current_module_info = module_info
+    current_module_info = current_module_info.get_child(module.__class__.__name__, True)
 
 
 def post_forward_hook(module, input, output):
@@ -92,9 +210,9 @@ def pre_backward_hook(module, grad_output):
     - grad_output: The gradients at the output of the module.
     """
     global current_module_info
-    module_info = ModuleInfo(module.__class__.__name__, current_module_info, is_forward=False)
-    current_module_info.children.append(module_info)
-    current_module_info = module_info
+    current_module_info = current_module_info.get_child(
+        module.__class__.__name__, False
+    )
 
 
 def post_backward_hook(module, grad_input, grad_output):
@@ -135,13 +253,15 @@ def open_module_tracker(module):
     module.apply(register_hooks)
 
 
-def recursive_apply(func):
+def recursive_apply(func, clone=True):
     """
     Applies a function recursively to all tensors in a nested structure of
     tensors, lists, tuples, and dictionaries.
 
     Parameters:
     - func (function): A function to apply to every tensor found in the input structure.
+    - clone (bool): Whether to pass a detached clone of each tensor to 'func',
+        otherwise the detached tensor itself is passed.
 
     Returns:
     - A function that takes an input structure and applies 'func'
@@ -160,7 +280,7 @@ def recursive_apply(func):
             return {k: recursive_apply_fn(v) for k, v in inputs.items()}
         if isinstance(inputs, torch.Tensor):
             # Apply the function to tensors
-            return func(inputs.detach().clone())
+            return func(inputs.detach().clone() if clone else inputs.detach())
         # Return non-tensor objects unchanged
         return inputs
 
@@ -208,6 +328,208 @@ def convert_to_musa(inputs):
     return recursive_apply(lambda x: x.to("musa"))(inputs)
 
 
+def copy_to_host_async(inputs):
+    """
+    Copies all tensors in a nested structure to CPU memory without blocking the host.
+    Device tensors are copied into pinned memory with non_blocking copies, which are
+    ordered on the current stream, so the copies are only valid after an event
+    recorded afterwards completes.
+
+    Parameters:
+    - inputs: The input structure containing tensors.
+
+    Returns:
+    - The input structure with all tensors replaced by their host copies.
+    """
+
+    def copy_fn(tensor):
+        if tensor.device.type == "cpu":
+            return tensor.clone()
+        try:
+            host = torch.empty_like(tensor, device="cpu", pin_memory=True)
+        except RuntimeError:
+            # fall back to pageable memory, the copy is then synchronous
+            host = torch.empty_like(tensor, device="cpu")
+        return host.copy_(tensor, non_blocking=True)
+
+    return recursive_apply(copy_fn, clone=False)(inputs)
+
+
+def find_device(inputs):
+    """
+    Finds the device of the first non-CPU tensor in a nested structure.
+
+    Parameters:
+    - inputs: The input structure containing tensors.
+
+    Returns:
+    - torch.device or None if all tensors are on CPU.
+    """
+    if isinstance(inputs, (list, tuple)):
+        for x in inputs:
+            device = find_device(x)
+            if device is not None:
+                return device
+    elif isinstance(inputs, dict):
+        return find_device(list(inputs.values()))
+    elif isinstance(inputs, torch.Tensor) and inputs.device.type != "cpu":
+        return inputs.device
+    return None
+
+
+def record_event(device):
+    """
+    Records an event on the current stream of the device, None for CPU.
+    """
+    if device is None:
+        return None
+    event = getattr(torch, device.type).Event()
+    event.record()
+    return event
+
+
+def summarize_tensors(actual, expected, atol, rtol):
+    """
+    Compares two CPU tensors with a few fused reductions instead of
+    an element-wise report.
+
+    Parameters:
+    - actual, expected: The tensors to compare.
+    - atol (float): Absolute tolerance.
+    - rtol (float): Relative tolerance.
+
+    Returns:
+    - (int, float, float): The number of mismatched elements, max absolute error
+    and max relative error among finite errors.
+    """
+    if actual.shape != expected.shape:
+        return max(actual.numel(), expected.numel()), float("inf"), float("inf")
+    if expected.numel() == 0:
+        return 0, 0.0, 0.0
+    if expected.dtype in (torch.float16, torch.bfloat16):
+        expected = expected.float()
+    actual = actual.to(expected.dtype)
+    if expected.is_floating_point() or expected.is_complex():
+        close = torch.isclose(actual, expected, rtol=rtol, atol=atol, equal_nan=True)
+        abs_err = (actual - expected).abs().double()
+        ref = expected.abs().double()
+    else:
+        close = actual.eq(expected)
+        abs_err = (actual.double() - expected.double()).abs()
+        ref = expected.double().abs()
+    abs_err.nan_to_num_(nan=0.0, posinf=0.0, neginf=0.0)
+    rel_err = abs_err / ref.clamp_min(torch.finfo(torch.float64).tiny)
+    rel_err.nan_to_num_(nan=0.0, posinf=0.0, neginf=0.0)
+    mismatch = close.numel() - int(close.sum().item())
+    return mismatch, abs_err.max().item(), rel_err.max().item()
+
+
+def recursive_summarize(out1, out2, atol, rtol, prefix="output"):
+    """
+    Recursively summarizes the comparison of two outputs with `summarize_tensors`.
+
+    Parameters:
+    - out1, out2: The outputs to compare, both on CPU.
+    - atol (float): Absolute tolerance.
+    - rtol (float): Relative tolerance.
+    - prefix (str): Name of the output, used internally for nested outputs.
+
+    Returns:
+    - (bool, list[str]): Whether the outputs are close, and one summary line per tensor.
+    """
+    if isinstance(out1, torch.Tensor) and isinstance(out2, torch.Tensor):
+        mismatch, max_abs, max_rel = summarize_tensors(out1, out2, atol, rtol)
+        summary = (
+            f"{prefix}: mismatch={mismatch}/{out2.numel()}, "
+            f"max_abs_err={max_abs:.6g}, max_rel_err={max_rel:.6g}"
+        )
+        return mismatch == 0, [summary]
+    if isinstance(out1, (list, tuple)) and isinstance(out2, (list, tuple)):
+        correct, summaries = True, []
+        for i, (value1, value2) in enumerate(zip(out1, out2)):
+            result, child_summaries = recursive_summarize(
+                value1, value2, atol, rtol, f"{prefix}[{i}]"
+            )
+            correct = correct and result
+            summaries += child_summaries
+        return correct, summaries
+    correct, diff_str = recursive_compare(out1, out2, atol, rtol)
+    return correct, [] if correct else [f"{prefix}: {diff_str.strip()}"]
+
+
+def compare_on_host(
+    func,
+    args_host,
+    kwargs_host,
+    out_host,
+    event,
+    atol,
+    rtol,
+    func_name,
+    verbose,
+    keep_inputs,
+):
+    """
+    Runs the CPU reference of an op on host snapshots and compares it with the snapshot
+    of device outputs. It is executed on worker threads of the batched CompareWithCPU,
+    where no dispatch mode is active, and prints nothing by itself.
+
+    Parameters:
+    func (function): The function to test.
+    args_host (tuple), kwargs_host (dict): Host snapshots of the arguments taken before
+        the function ran on device.
+    out_host: Host snapshot of the device outputs.
+    event: Event recorded after the snapshots were issued, None if no device is involved.
+    atol (float), rtol (float): Tolerances.
+    func_name (str): The name of the function for logging.
+    verbose (bool): Enables logging of inputs and outputs on failure.
+    keep_inputs (bool): Keeps a copy of arguments for dumping error data.
+
+    Returns:
+    tuple: (correct, log text, (args, kwargs) kept for dumping or None)
+    """
+    if event is not None:
+        event.synchronize()
+    kept_inputs = None
+    if keep_inputs:
+        # the reference op may modify its arguments in-place
+        clone_fn = recursive_apply(lambda x: x)
+        kept_inputs = (clone_fn(args_host), clone_fn(kwargs_host))
+    log = ""
+    try:
+        try:
+            out_cpu = func(*args_host, **kwargs_host)
+        except RuntimeError as excp:
+            log += f"{excp}\nConvert to float32 ...\n"
+            args_host = convert_to_dtype(args_host, torch.float32)
+            kwargs_host = convert_to_dtype(kwargs_host, torch.float32)
+            out_cpu = func(*args_host, **kwargs_host)
+
+        correct, summaries = recursive_summarize(out_host, out_cpu, atol, rtol)
+        if correct:
+            log += f"{func_name} succeeds to pass CompareWithCPU test\n"
+            return True, log, None
+
+        # The full diff is only materialized for failed ops
+        log += "\n============================\n"
+        log += f"[ERROR] {func_name} fails to pass CompareWithCPU test\n"
+        log += "\n".join(summaries) + "\n"
+        if verbose and kept_inputs is not None:
+            log += "....... input .........\n"
+            log += recursive_print(kept_inputs[0], top_level=False) + "\n"
+            log += recursive_print(kept_inputs[1], top_level=False) + "\n"
+        if verbose:
+            log += "...... output ........\n"
+            log += recursive_print(out_host, top_level=False) + "\n"
+        log += "\n...... compare with cpu .......\n"
+        log += recursive_compare(out_host, out_cpu, atol, rtol)[1]
+        log += "\n============================\n"
+        return False, log, kept_inputs
+    except Exception as excp:
+        log += f"{excp}\n[WARNING] {func_name} has not been tested!\n"
+        return False, log, None
+
+
 def compare_tensors(tensor1, tensor2, atol, rtol):
     """
     Compares two tensors element-wise to check if they are approximately
@@ -331,10 +653,7 @@ def get_full_op_name(op_name):
     - The full name of the operation, considering its module hierarchy
     and operation type (forward or backward).
     """
-    module_info = ModuleInfo(name=op_name, father=current_module_info, is_leaf=True)
-    full_op_name = module_info.full_name()
-    current_module_info.children.append(module_info)
-    return full_op_name
+    return current_module_info.op_full_name(op_name)
 
 
 def recursive_compare(out1, out2, atol, rtol, depth=0):
@@ -479,6 +798,63 @@ def compare_for_single_op(inputs_data_save_path, op_func, atol, rtol):
     return correct, args_musa, kwargs_musa, out
 
 
+def resolve_op(op_name):
+    """
+    Resolves an operation name returned by `get_op_name`, e.g. 'torch.ops.aten.add.Tensor',
+    to the operation function.
+    """
+    op_func = torch.ops
+    for attr in op_name[len("torch.ops.") :].split("."):
+        op_func = getattr(op_func, attr)
+    if isinstance(op_func, torch._ops.OpOverloadPacket):
+        op_func = op_func.default
+    return op_func
+
+
+def replay_op_records(
+    store_path,
+    atol,
+    rtol,
+    op_name=None,
+    step=None,
+    seq=None,
+    op_func=None,
+    verbose=True,
+):
+    """
+    Replays records of an OpRecordStore dumped by CompareWithCPU or NanInfTracker, comparing
+    them with CPU one at a time. Only the records being replayed are loaded from the store.
+
+    Parameters:
+    store_path (str): Path of the store, e.g. 'path_to_save/op_records_rank0.bin'.
+    atol (float): Absolute tolerance for comparison.
+    rtol (float): Relative tolerance for comparison.
+    op_name (str, optional): Only replays records of this operation.
+    step (int, optional): Only replays records of this step.
+    seq (int, optional): Only replays records of this op sequence number within a step.
+    op_func (function, optional): The operation function to replay, resolved from the
+        recorded operation name by default.
+    verbose (bool, optional): Enables detailed logging. Defaults to True.
+
+    Yields:
+    tuple: The record, a boolean indicating if it passes the comparison, and the output.
+    """
+    with OpRecordStore(store_path) as store:
+        for entry in store.find(op_name, step, seq):
+            record = store.load(entry)
+            func = op_func if op_func is not None else resolve_op(record.op_name)
+            out, correct = compare_for_single_func(
+                func,
+                convert_to_musa(record.args),
+                convert_to_musa(record.kwargs),
+                atol,
+                rtol,
+                func_name=f"{record.op_name}(step {record.step}, op {record.seq})",
+                verbose=verbose,
+            )
+            yield record, correct, out
+
+
 def compare_for_single_func(func, args, kwargs, atol, rtol, func_name=None, verbose=False):
     """
     Compares the output of a function against expected results with given tolerances.
@@ -702,6 +1078,66 @@ class LogToFile:
             self.file.close()
 
 
+def dump_error_op(mode, out, args, kwargs, op_name, seq):
+    """
+    Dumps data of a failing op of CompareWithCPU or NanInfTracker according to its
+    dump_format.
+
+    Returns:
+    bool: Whether the mode should stop, which is the case of pickle dumps only.
+    """
+    if mode.dump_format == "pickle":
+        save_data_for_op(out, args, kwargs, mode.output_dir, op_name, mode.file_suffix)
+        return True
+    if mode.record_store is None:
+        path = os.path.join(mode.output_dir, f"op_records{mode.file_suffix}.bin")
+        mode.record_store = OpRecordStore(path, mode="a")
+    mode.record_store.append(mode.step_cnt, seq, op_name, args, kwargs, out)
+    print(f"Data of {op_name} is appended to {mode.record_store.path}")
+    return False
+
+
+def report_fingerprints(fingerprints):
+    """
+    Prints fingerprints containing NaN or Inf values.
+    """
+    for fingerprint in fingerprints:
+        print(
+            f"[WARNING] {fingerprint.op_name} output {fingerprint.index} has "
+            f"{fingerprint.nan} nan and {fingerprint.inf} inf "
+            f"(step {fingerprint.step}, op {fingerprint.seq})"
+        )
+
+
+def create_fingerprint_recorder(mode, prefix, sample_mode, flush_interval):
+    """
+    Creates the FingerprintRecorder of CompareWithCPU or NanInfTracker, whose log is
+    saved to the output directory of the mode.
+    """
+    path = os.path.join(mode.output_dir, f"{prefix}{mode.file_suffix}.fp")
+    return FingerprintRecorder(
+        path, OpSampler(mode.sample_rate, sample_mode), flush_interval
+    )
+
+
+def flush_fingerprint_recorder(mode, new_step=True):
+    """
+    Flushes fingerprints of CompareWithCPU or NanInfTracker and reports NaN/Inf ones.
+    The log stays open, as the mode may be entered again.
+    The mode is disabled meanwhile, since it is still pushed when called from step().
+    """
+    if mode.recorder is None:
+        return
+    enabled, mode.enabled = mode.enabled, False
+    try:
+        with LogToFile(mode.log_file_path if mode.should_log_to_file else None):
+            report_fingerprints(
+                mode.recorder.step() if new_step else mode.recorder.flush()
+            )
+    finally:
+        mode.enabled = enabled
+
+
 class CompareWithCPU(TorchDispatchMode):
     """
     A class for comparing the outputs of tensor operations against 
@@ -725,6 +1161,23 @@ class CompareWithCPU(TorchDispatchMode):
         output_dir (str): Directory to save logs and error data.
         start_step (int): Step number to start comparisons.
         end_step (int): Step number to end comparisons.
+        batched (bool): If True, device results are copied to pinned host memory without
+            synchronizing, and CPU references run on a thread pool. Only summary statistics
+            are computed for each op, the full diff is printed for failed ops only. Results
+            are reported in op order, at latest when `step()` is called or the mode exits.
+        num_workers (int): Number of threads running CPU references in batched mode.
+        max_pending (int): Maximum number of ops in flight in batched mode, dispatching
+            blocks on the oldest one when it is reached.
+        fingerprint (bool): If True, ops are not compared with CPU. Instead each output of
+            sampled ops is reduced on device to a fingerprint (sum, abs-max, nan and inf
+            counts), which are appended to a binary log in output_dir, see op_fingerprint.
+        sample_rate (float): Fraction of ops to compare or fingerprint.
+        sample_mode (str): "hash" samples by hash of the op name, "random" samples each
+            op call independently.
+        flush_interval (int): Number of fingerprints kept on device before flushed.
+        dump_format (str): "pickle" saves error data of the first failing op to pickle files
+            and exits. "store" appends error data of every failing op to a record store in
+            output_dir and continues, see `replay_op_records`.
     """
 
     def __init__(
@@ -741,6 +1194,14 @@ class CompareWithCPU(TorchDispatchMode):
         output_dir="",
         start_step=None,
         end_step=None,
+        batched=False,
+        num_workers=4,
+        max_pending=64,
+        fingerprint=False,
+        sample_rate=1.0,
+        sample_mode="hash",
+        flush_interval=1024,
+        dump_format="pickle",
     ) -> None:
         super().__init__()
         self.enabled = enabled
@@ -783,7 +1244,14 @@ class CompareWithCPU(TorchDispatchMode):
         self.enable_ranks = enable_ranks
         self.should_log_to_file = should_log_to_file
         self.output_dir = output_dir
+        if dump_format not in DUMP_FORMATS:
+            raise ValueError(
+                f"dump_format must be one of {DUMP_FORMATS}, got {dump_format}"
+            )
+        self.dump_format = dump_format
+        self.record_store = None
         self.step_cnt = 0
+        self.op_seq = 0  # sequence number of ops within a step
         self.start_step = start_step
         self.end_step = end_step
         self.is_active = True  # Initially active, can be toggled based on step counts
@@ -791,6 +1259,18 @@ class CompareWithCPU(TorchDispatchMode):
         self.global_rank = int(os.environ.get("RANK", "-1"))  # Fetch MPI rank if available
         self.file_suffix = f"_rank{self.global_rank}" if self.global_rank >= 0 else ""
         self.log_file_path = os.path.join(self.output_dir, f"compare_result{self.file_suffix}.txt")
+        self.batched = batched
+        self.num_workers = num_workers
+        self.max_pending = max(1, max_pending)
+        self.executor = None
+        self.pending = deque()
+        self.sample_rate = sample_rate
+        self.sampler = OpSampler(sample_rate, sample_mode)
+        self.recorder = None
+        if fingerprint and enabled:
+            self.recorder = create_fingerprint_recorder(
+                self, "compare_fingerprints", sample_mode, flush_interval
+            )
 
     def update_active_state(self):
         """
@@ -800,6 +1280,92 @@ class CompareWithCPU(TorchDispatchMode):
         is_before_end = self.end_step is None or self.end_step > self.step_cnt
         self.is_active = is_after_start and is_before_end
 
+    def submit(self, func, args, kwargs, op_name, full_op_name, op_seq):
+        """
+        Runs the function on device and queues its comparison with the CPU reference,
+        without waiting for the device.
+        """
+        print(f"{full_op_name} starts to run ...")
+        start = time.perf_counter()
+        # Inputs are snapshotted before running, as the op may modify them in-place
+        args_host = copy_to_host_async(args)
+        kwargs_host = copy_to_host_async(kwargs)
+        out = func(*args, **kwargs)
+        out_host = copy_to_host_async(out)
+        event = record_event(find_device([args, kwargs, out]))
+
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.num_workers, thread_name_prefix="CompareWithCPU"
+            )
+        future = self.executor.submit(
+            compare_on_host,
+            func,
+            args_host,
+            kwargs_host,
+            out_host,
+            event,
+            self.atol,
+            self.rtol,
+            full_op_name,
+            self.verbose,
+            self.dump_error_data,
+        )
+        elapsed = time.perf_counter() - start
+        self.pending.append(
+            (future, op_name, op_seq, out_host, current_module_info, elapsed)
+        )
+        self.drain(max(0, len(self.pending) - self.max_pending))
+        return out
+
+    def drain(self, count=None):
+        """
+        Reports results of pending comparisons in op order. All finished ones at the head
+        of the queue are reported, and at least `count` of them are waited for.
+        None waits for all of them.
+        """
+        while self.pending:
+            future, op_name, op_seq, out_host, module_info, elapsed = self.pending[0]
+            if count is not None and count <= 0 and not future.done():
+                break
+            self.pending.popleft()
+            if count is not None:
+                count -= 1
+            correct, log, kept_inputs = future.result()
+            module_info.record_op(not correct, elapsed)
+            print(log, end="")
+            if self.dump_error_data and not correct and kept_inputs is not None:
+                if dump_error_op(self, out_host, *kept_inputs, op_name, op_seq):
+                    self.pending.clear()
+                    raise Exception("CompareWithCPU Failed!")
+
+    def flush(self):
+        """
+        Waits for all pending comparisons of batched mode and reports them.
+        """
+        if not self.pending:
+            return
+        # Tensor ops of dumping must not be intercepted while the mode is still pushed
+        enabled, self.enabled = self.enabled, False
+        try:
+            with LogToFile(self.log_file_path if self.should_log_to_file else None):
+                self.drain()
+        finally:
+            self.enabled = enabled
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            if exc_type is None:
+                self.flush()
+            else:
+                self.pending.clear()
+            flush_fingerprint_recorder(self, new_step=False)
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown(wait=True)
+                self.executor = None
+            super().__exit__(exc_type, exc_val, exc_tb)
+
     def __torch_dispatch__(self, func, types, args=(), kwargs=None):
         """
         The core method that intercepts tensor operations. It compares the output of each operation
@@ -811,6 +1377,8 @@ class CompareWithCPU(TorchDispatchMode):
             if not self.enabled or not self.is_active:
                 return func(*args, **kwargs)
 
+            op_seq = self.op_seq
+            self.op_seq += 1
             op_name = get_op_name(func)  # Utility function to extract operation name
             full_op_name = get_full_op_name(op_name)  # May include namespace
 
@@ -826,7 +1394,24 @@ class CompareWithCPU(TorchDispatchMode):
                     print(f"{full_op_name} is in white_list, pass")
                     return func(*args, **kwargs)
 
+                if self.recorder is not None:
+                    start = time.perf_counter()
+                    out = func(*args, **kwargs)
+                    report_fingerprints(
+                        self.recorder.record(op_name, full_op_name, out)
+                    )
+                    current_module_info.record_op(False, time.perf_counter() - start)
+                    return out
+                if not self.sampler(op_name):
+                    return func(*args, **kwargs)
+
+                if self.batched:
+                    return self.submit(
+                        func, args, kwargs, op_name, full_op_name, op_seq
+                    )
+
                 # Perform the actual comparison
+                start = time.perf_counter()
                 out, correct = compare_for_single_func(
                     func,
                     args,
@@ -836,11 +1421,12 @@ class CompareWithCPU(TorchDispatchMode):
                     func_name=full_op_name,
                     verbose=self.verbose,
                 )
+                current_module_info.record_op(not correct, time.perf_counter() - start)
 
                 # Handle comparison failure
                 if self.dump_error_data and not correct:
-                    save_data_for_op(out, args, kwargs, self.output_dir, op_name, self.file_suffix)
-                    raise Exception("CompareWithCPU Failed!")
+                    if dump_error_op(self, out, args, kwargs, op_name, op_seq):
+                        raise Exception("CompareWithCPU Failed!")
 
         return out
 
@@ -851,7 +1437,11 @@ class CompareWithCPU(TorchDispatchMode):
         """
         if not self.enabled:
             return
+        self.flush()
+        flush_fingerprint_recorder(self)
         self.step_cnt += 1
+        self.op_seq = 0
+        reset_module_tracker()
         self.update_active_state()
         # Optional logging for active steps
         if self.is_active:
@@ -886,6 +1476,21 @@ class NanInfTracker(TorchDispatchMode):
             Step number to start tracking.
         end_step (int): 
             Step number to end tracking.
+        fingerprint (bool):
+            If True, tensors are not printed. Instead each output of sampled ops is reduced
+            on device to a fingerprint (sum, abs-max, nan and inf counts), which are appended
+            to a binary log in output_dir. NaN/Inf are reported when fingerprints are flushed,
+            and no data is dumped.
+        sample_rate (float):
+            Fraction of ops to track.
+        sample_mode (str):
+            "hash" samples by hash of the op name, "random" samples each op call independently.
+        flush_interval (int):
+            Number of fingerprints kept on device before flushed.
+        dump_format (str):
+            "pickle" saves error data of the first failing op to pickle files and exits.
+            "store" appends error data of every failing op to a record store in output_dir
+            and continues, see `replay_op_records`.
     """
 
     def __init__(
@@ -899,6 +1504,11 @@ class NanInfTracker(TorchDispatchMode):
         dump_error_data=False,
         start_step=None,
         end_step=None,
+        fingerprint=False,
+        sample_rate=1.0,
+        sample_mode="hash",
+        flush_interval=1024,
+        dump_format="pickle",
     ) -> None:
         super().__init__()
         self.enabled = enabled
@@ -925,7 +1535,14 @@ class NanInfTracker(TorchDispatchMode):
         self.should_log_to_file = should_log_to_file
         self.output_dir = output_dir
         self.dump_error_data = dump_error_data
+        if dump_format not in DUMP_FORMATS:
+            raise ValueError(
+                f"dump_format must be one of {DUMP_FORMATS}, got {dump_format}"
+            )
+        self.dump_format = dump_format
+        self.record_store = None
         self.step_cnt = 0
+        self.op_seq = 0  # sequence number of ops within a step
         self.start_step = start_step
         self.end_step = end_step
         self.is_active = True  # Initially active, can be toggled based on step counts
@@ -933,6 +1550,13 @@ class NanInfTracker(TorchDispatchMode):
         self.global_rank = int(os.environ.get("RANK", "-1"))  # Fetch MPI rank if available
         self.file_suffix = f"_rank{self.global_rank}" if self.global_rank >= 0 else ""
         self.log_file_path = os.path.join(self.output_dir, f"nan_inf_report{self.file_suffix}.txt")
+        self.sample_rate = sample_rate
+        self.sampler = OpSampler(sample_rate, sample_mode)
+        self.recorder = None
+        if fingerprint and enabled:
+            self.recorder = create_fingerprint_recorder(
+                self, "nan_inf_fingerprints", sample_mode, flush_interval
+            )
 
     def update_active_state(self):
         """
@@ -951,6 +1575,8 @@ class NanInfTracker(TorchDispatchMode):
             if not self.enabled or not self.is_active:
                 return func(*args, **kwargs)
 
+            op_seq = self.op_seq
+            self.op_seq += 1
             op_name = get_op_name(func)  # Utility function to extract operation name
             full_op_name = get_full_op_name(op_name)  # May include namespace
 
@@ -964,16 +1590,37 @@ class NanInfTracker(TorchDispatchMode):
                     print(f"{full_op_name} is in white_list, pass")
                     return func(*args, **kwargs)
 
+                if self.recorder is not None:
+                    start = time.perf_counter()
+                    out = func(*args, **kwargs)
+                    report_fingerprints(
+                        self.recorder.record(op_name, full_op_name, out)
+                    )
+                    current_module_info.record_op(False, time.perf_counter() - start)
+                    return out
+                if not self.sampler(op_name):
+                    return func(*args, **kwargs)
+
+                start = time.perf_counter()
                 out, has_nan_or_inf = nan_inf_track_for_single_func(
                     func, args, kwargs, full_op_name
                 )
+                current_module_info.record_op(
+                    has_nan_or_inf, time.perf_counter() - start
+                )
 
                 if self.dump_error_data and has_nan_or_inf:
-                    save_data_for_op(out, args, kwargs, self.output_dir, op_name, self.file_suffix)
-                    raise Exception("Nan or Inf Detected!")
+                    if dump_error_op(self, out, args, kwargs, op_name, op_seq):
+                        raise Exception("Nan or Inf Detected!")
 
                 return out
 
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            flush_fingerprint_recorder(self, new_step=False)
+        finally:
+            super().__exit__(exc_type, exc_val, exc_tb)
+
     def step(self):
         """
         Increments the step count and updates the active state. This method should be called
@@ -981,7 +1628,10 @@ class NanInfTracker(TorchDispatchMode):
         """
         if not self.enabled:
             return
+        flush_fingerprint_recorder(self)
         self.step_cnt += 1
+        self.op_seq = 0
+        reset_module_tracker()
         self.update_active_state()
         if self.is_active:
             with LogToFile(self.log_file_path if self.should_log_to_file else None):
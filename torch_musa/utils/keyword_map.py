@@ -0,0 +1,118 @@
+"""Pure python keyword automaton shared by porting tools"""
+
+from collections import deque
+
+
+def is_overlap(x, y):
+    """Judge if two string overlap"""
+    x_name, x_start = x[0]
+    y_name, y_start = y[0]
+    x_len = len(x_name)
+    y_len = len(y_name)
+    x_end = x_start + x_len
+    y_end = y_start + y_len
+    return x_start < y_end and y_start < x_end
+
+
+def should_replace(old, new):
+    """Judge if string should replace"""
+    o_name, o_start = old[0]
+    n_name, n_start = new[0]
+    if o_start > n_start:
+        return True
+    if o_start < n_start:
+        return False
+
+    o_len = len(o_name)
+    n_len = len(n_name)
+
+    return o_len < n_len
+
+
+def longest_matches(result_gen):
+    """Keep the longest one among overlapped matches"""
+    try:
+        candidate = next(result_gen)
+    except StopIteration:
+        return
+
+    for result in result_gen:
+        if not is_overlap(candidate, result):
+            yield candidate
+            candidate = result
+        elif should_replace(candidate, result):
+            candidate = result
+
+    yield candidate
+
+
+def compile_keywords(pairs):
+    """Compile (key, value) pairs into flat automaton tables.
+
+    Returns a tuple of (transitions, outputs, values), where transitions[state]
+    maps a symbol to next state, outputs[state] holds keywords ending at state
+    from the longest to the shortest and values maps keyword to its value.
+    """
+    transitions = [{}]
+    outputs = [()]
+    values = {}
+    for key, value in pairs:
+        if not key:
+            continue
+        values[key] = value
+        state = 0
+        for symbol in key:
+            next_state = transitions[state].get(symbol)
+            if next_state is None:
+                next_state = len(transitions)
+                transitions[state][symbol] = next_state
+                transitions.append({})
+                outputs.append(())
+            state = next_state
+        outputs[state] = (key,)
+
+    # breadth first, suffixes are always completed before their extensions
+    root = transitions[0]
+    queue = deque((state, 0) for state in root.values())
+    while queue:
+        state, suffix = queue.popleft()
+        own = transitions[state]
+        for symbol, child in list(own.items()):
+            child_suffix = transitions[suffix].get(symbol)
+            if child_suffix is None:
+                child_suffix = root.get(symbol, 0)
+            queue.append((child, child_suffix))
+        # transitions missing from root are resolved at search time
+        if suffix:
+            outputs[state] = outputs[state] + outputs[suffix]
+            for symbol, next_state in transitions[suffix].items():
+                own.setdefault(symbol, next_state)
+    return transitions, outputs, values
+
+
+class CompiledKeywordMap:
+    """
+    Keyword map backed by flat tables from `compile_keywords`, which are plain
+    python containers and therefore cheap to cache and load. Keywords could be
+    either bytes or str, as long as the searched text is of the same type.
+    """
+
+    def __init__(self, tables=None):
+        self.transitions, self.outputs, self.values = tables or ([{}], [()], {})
+
+    def search_all(self, text):
+        """Search all text occurrence, in the same order as musify `KeywordMap`"""
+        transitions = self.transitions
+        outputs = self.outputs
+        values = self.values
+        root_get = transitions[0].get
+        state = 0
+        for idx, symbol in enumerate(text):
+            next_state = transitions[state].get(symbol)
+            state = root_get(symbol, 0) if next_state is None else next_state
+            for keyword in outputs[state]:
+                yield (keyword, idx + 1 - len(keyword)), values[keyword]
+
+    def search_longest(self, text):
+        """Search the longest text occurrence"""
+        return longest_matches(self.search_all(text))
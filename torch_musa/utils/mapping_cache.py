@@ -0,0 +1,87 @@
+"""Persistent cache of compiled mapping rules used by porting tools"""
+
+import hashlib
+import json
+import logging
+import marshal
+import os
+import sys
+import tempfile
+from os.path import join, expanduser
+from typing import Any, Callable, Dict, List
+
+# no relative imports, tools/cuda_porting loads this file before torch_musa is built
+LOGGER = logging.getLogger(__name__)
+
+# bump it whenever the layout of any cached object changes
+CACHE_VERSION = 1
+
+
+def cache_dir(name: str = "mapping") -> str:
+    """Return directory of cache `name`, which locates under `$TORCH_MUSA_CACHE_DIR`
+    if set, otherwise under `$XDG_CACHE_HOME/torch_musa`"""
+    root = os.environ.get("TORCH_MUSA_CACHE_DIR")
+    if not root:
+        xdg_cache = os.environ.get("XDG_CACHE_HOME") or join(expanduser("~"), ".cache")
+        root = join(xdg_cache, "torch_musa")
+    return join(root, name)
+
+
+def mapping_key(kind: str, paths: List[str], extra: Dict[str, Any] = None) -> str:
+    """Hash content of mapping files together with extra options"""
+    # marshal format is only stable within one python version
+    python_version = f"{sys.version_info[0]}.{sys.version_info[1]}"
+    hasher = hashlib.sha256(f"{kind}:{CACHE_VERSION}:{python_version}".encode())
+    for path in paths:
+        with open(path, "rb") as f:
+            hasher.update(hashlib.sha256(f.read()).digest())
+    hasher.update(json.dumps(extra or {}, sort_keys=True).encode())
+    return hasher.hexdigest()
+
+
+def load_or_build(
+    kind: str,
+    paths: List[str],
+    build_fn: Callable[[], Any],
+    extra: Dict[str, Any] = None,
+) -> Any:
+    """Load compiled mapping of `kind` from cache, or build and cache it.
+
+    The cache is written via marshal, which loads plain containers much faster
+    than pickle, hence `build_fn` must return builtin types only.
+
+    Args:
+        kind (str): name of the compiled object, e.g. "musify".
+        paths (list[str]): mapping files which `build_fn` reads.
+        build_fn (callable): builds the object when cache misses.
+        extra (dict): any other json-serializable input of `build_fn`.
+
+    Returns:
+        the object returned by `build_fn`, possibly from a previous run.
+    """
+    key = mapping_key(kind, paths, extra)
+    cache_path = join(cache_dir(), f"{kind}-v{CACHE_VERSION}-{key[:32]}.bin")
+    try:
+        with open(cache_path, "rb") as f:
+            cached_key, obj = marshal.loads(f.read())
+        if cached_key == key:
+            LOGGER.debug("Loaded %s mapping from %s", kind, cache_path)
+            return obj
+    except FileNotFoundError:
+        pass
+    except (OSError, EOFError, ValueError, TypeError) as exception:
+        LOGGER.warning("Ignore broken mapping cache %s: %s", cache_path, exception)
+
+    obj = build_fn()
+    tmp_path = None
+    try:
+        os.makedirs(cache_dir(), exist_ok=True)
+        tmp_fd, tmp_path = tempfile.mkstemp(dir=cache_dir(), suffix=".tmp")
+        with os.fdopen(tmp_fd, "wb") as f:
+            f.write(marshal.dumps((key, obj)))
+        os.replace(tmp_path, cache_path)
+    except (OSError, ValueError) as exception:
+        LOGGER.warning("Failed to write mapping cache %s: %s", cache_path, exception)
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return obj
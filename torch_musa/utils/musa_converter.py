@@ -5,10 +5,17 @@
 import os
 import os.path as osp
 import sys
+import hashlib
+import itertools
+import json
+import re
 from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 from argparse import ArgumentParser
 import logging
-from typing import Dict, List
+from typing import Dict, List, Tuple
+
+from .mapping_cache import cache_dir
 
 try:
     from tqdm import tqdm
@@ -161,6 +168,66 @@ class MUSAReplacementTransformer(cst.CSTTransformer):
         return updated_node
 
 
+# files without any of these tokens could never be modified by the transformer,
+# "cpp_extension" and "musa" come from the `ImportFrom` and `Attribute` rules
+PREFILTER_PATTERN = re.compile(
+    "|".join(
+        list(MAPPING_RULES.NameAndCommentAndSimpleString.keys())
+        + ["cpp_extension", "musa"]
+    )
+)
+
+
+def hash_code(code: str) -> str:
+    return hashlib.sha256(code.encode("utf-8")).hexdigest()
+
+
+def rules_version() -> str:
+    """hash of MAPPING_RULES and PREFILTER_PATTERN, files cached with other rules
+    are converted again"""
+    module = cst.Module(body=[])
+
+    def node_rules(rules):
+        return sorted(
+            (module.code_for_node(k), module.code_for_node(v)) for k, v in rules.items()
+        )
+
+    rules = [
+        sorted(MAPPING_RULES.NameAndCommentAndSimpleString.items()),
+        node_rules(MAPPING_RULES.ImportFrom),
+        node_rules(MAPPING_RULES.Attribute),
+        PREFILTER_PATTERN.pattern,
+    ]
+    return hash_code(json.dumps(rules))
+
+
+CONVERTER_VERSION = rules_version()
+
+
+def convert_code(src_code: str, visitors: List[cst.CSTTransformer]) -> str:
+    """convert source code, skip parsing if it contains nothing to be converted"""
+    if not PREFILTER_PATTERN.search(src_code):
+        return src_code
+    module = cst.parse_module(src_code)
+    for visitor in visitors:
+        module = module.visit(visitor)
+    return module.code
+
+
+def convert_file_worker(
+    file: str, visitors: List[cst.CSTTransformer]
+) -> Tuple[str, str]:
+    """convert file in place, returns the file and hash of its new content"""
+    with open(file, "r+", encoding="utf-8") as f:
+        src_code = f.read()
+        new_code = convert_code(src_code, visitors)
+        if new_code != src_code:
+            f.seek(0)
+            f.write(new_code)
+            f.truncate()
+    return file, hash_code(new_code)
+
+
 LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
 logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
 
@@ -193,6 +260,18 @@ def parse_args() -> ArgumentParser:
         default=[],
         help="path(s) will be excluded during convertion",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of processes converting files in parallel, 0 means all cpu cores",
+    )
+    parser.add_argument(
+        "--no_cache",
+        action="store_true",
+        help="convert all files even if they are unchanged since last conversion",
+    )
 
     args = parser.parse_args()
     return args
@@ -266,21 +345,54 @@ class AdvancedMUSAConverter(BaseMUSAConverter):
         self.visitors = [
             MUSAReplacementTransformer(),
         ]
+        jobs = getattr(args, "jobs", 1)
+        self.jobs = jobs if jobs > 0 else os.cpu_count()
+        self.no_cache = getattr(args, "no_cache", False)
 
     def collect_unsupported_torch_ops(self):
         raise NotImplementedError
 
     def convert_file(self, file: str) -> None:
         """convert file"""
-        with open(file, "r+", encoding="utf-8") as f:
-            src_code = f.read()
-            module = cst.parse_module(src_code)
-            for visitor in self.visitors:
-                module = module.visit(visitor)
-            new_code = module.code
-            f.seek(0)
-            f.write(new_code)
-            f.truncate()
+        convert_file_worker(file, self.visitors)
+
+    def cache_path(self) -> str:
+        """cache of converted files, one per root_path"""
+        root_hash = hashlib.sha256(osp.abspath(self.root_path).encode()).hexdigest()
+        return osp.join(cache_dir("musa_converter"), f"{root_hash[:32]}.json")
+
+    def load_cache(self) -> Dict[str, str]:
+        if self.no_cache:
+            return {}
+        try:
+            with open(self.cache_path(), encoding="utf-8") as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if cache.get("version") != CONVERTER_VERSION:
+            return {}
+        return cache.get("files", {})
+
+    def save_cache(self, files: Dict[str, str]) -> None:
+        try:
+            os.makedirs(osp.dirname(self.cache_path()), exist_ok=True)
+            with open(self.cache_path(), "w", encoding="utf-8") as f:
+                json.dump({"version": CONVERTER_VERSION, "files": files}, f)
+        except OSError as err:
+            logging.warning("failed to save conversion cache: %s", err)
+
+    def filter_unchanged_files(
+        self, file_list: List[str], cache: Dict[str, str]
+    ) -> List[str]:
+        """drop files whose content equals the result of last conversion"""
+        changed_files = []
+        for file in file_list:
+            if file in cache:
+                with open(file, "r", encoding="utf-8") as f:
+                    if hash_code(f.read()) == cache[file]:
+                        continue
+            changed_files.append(file)
+        return changed_files
 
     def add_torch_musa_into_launch_script(self, file: str) -> None:
         # NOTE: sometimes running the script after adding `import torch_musa`
@@ -305,11 +417,32 @@ class AdvancedMUSAConverter(BaseMUSAConverter):
         """run"""
         logging.info("Start to convert the scripts...")
         file_list = self.setup_files()
-        for file in tqdm(file_list):
-            self.convert_file(file)
+        cache = self.load_cache()
+        todo_list = self.filter_unchanged_files(file_list, cache)
+        if len(todo_list) < len(file_list):
+            logging.info(
+                "skip %d files unchanged since last conversion",
+                len(file_list) - len(todo_list),
+            )
+
+        if self.jobs > 1 and len(todo_list) > 1:
+            with ProcessPoolExecutor(max_workers=self.jobs) as executor:
+                results = executor.map(
+                    convert_file_worker,
+                    todo_list,
+                    itertools.repeat(self.visitors),
+                    chunksize=max(1, len(todo_list) // (self.jobs * 4)),
+                )
+                for file, code_hash in tqdm(results, total=len(todo_list)):
+                    cache[file] = code_hash
+        else:
+            for file in tqdm(todo_list):
+                _, cache[file] = convert_file_worker(file, self.visitors)
 
         if self.launch_file_path:
             self.add_torch_musa_into_launch_script(self.launch_file_path)
+            cache.pop(osp.abspath(self.launch_file_path), None)
+        self.save_cache(cache)
         logging.info("Scripts conversion done!!!")
 
 
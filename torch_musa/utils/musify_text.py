@@ -4,36 +4,20 @@ import contextlib
 import itertools
 import json
 import logging
+import mmap
 import os
 import sys
 
 from ahocorapy.keywordtree import KeywordTree
 
-
-def is_overlap(x, y):
-    """Judge if two string overlap"""
-    x_name, x_start = x[0]
-    y_name, y_start = y[0]
-    x_len = len(x_name)
-    y_len = len(y_name)
-    x_end = x_start + x_len
-    y_end = y_start + y_len
-    return x_start < y_end and y_start < x_end
-
-
-def should_replace(old, new):
-    """Judge if string should replace"""
-    o_name, o_start = old[0]
-    n_name, n_start = new[0]
-    if o_start > n_start:
-        return True
-    if o_start < n_start:
-        return False
-
-    o_len = len(o_name)
-    n_len = len(n_name)
-
-    return o_len < n_len
+from .keyword_map import (  # pylint: disable=unused-import
+    CompiledKeywordMap,
+    compile_keywords,
+    is_overlap,
+    longest_matches,
+    should_replace,
+)
+from .mapping_cache import load_or_build
 
 
 class KeywordMap:
@@ -73,27 +57,14 @@ class KeywordMap:
 
     def search_longest(self, text):
         """Search the longest text occurrence"""
-        result_gen = self.search_all(text)
-        try:
-            candidate = next(result_gen)
-        except StopIteration:
-            return
-
-        for result in result_gen:
-            if not is_overlap(candidate, result):
-                yield candidate
-                candidate = result
-            elif should_replace(candidate, result):
-                candidate = result
-
-        yield candidate
+        return longest_matches(self.search_all(text))
 
     def finalize(self):
         """Finalize"""
         self.__inner.finalize()
 
 
-automaton = KeywordMap()
+automaton = CompiledKeywordMap()
 
 EXCL_FLAG = False
 
@@ -143,8 +114,8 @@ excl_pattern.add(b"MUSIFY_EXCL_LINE", exclusion_line)
 excl_pattern.finalize()
 
 
-def init_ac_automaton(args):
-    """Ac automaton initialization function"""
+def build_ac_automaton(mapping, extra_mapping, direction):
+    """Build automaton tables from mapping files and extra mapping"""
 
     def read_mapping(path):
         """Load mapping via json load"""
@@ -153,22 +124,32 @@ def init_ac_automaton(args):
 
     map_iter = map(
         lambda tup: (tup[0].encode(), tup[1].encode()),
-        itertools.chain(*map(lambda p: read_mapping(p).items(), args.mapping)),
+        itertools.chain(*map(lambda p: read_mapping(p).items(), mapping)),
     )
 
     extra_map_iter = []
-    if args.extra_mapping and isinstance(args.extra_mapping, dict):
+    if extra_mapping and isinstance(extra_mapping, dict):
         extra_map_iter = map(
-            lambda tup: (tup[0].encode(), tup[1].encode()), args.extra_mapping.items()
+            lambda tup: (tup[0].encode(), tup[1].encode()), extra_mapping.items()
         )
-    if args.direction == "m2c":
-        for cuda, musa in itertools.chain(map_iter, extra_map_iter):
-            automaton.add(musa, cuda)
-    else:
-        for cuda, musa in itertools.chain(map_iter, extra_map_iter):
-            automaton.add(cuda, musa)
+    pairs = itertools.chain(map_iter, extra_map_iter)
+    if direction == "m2c":
+        pairs = ((musa, cuda) for cuda, musa in pairs)
+    return compile_keywords(pairs)
+
 
-    automaton.finalize()
+def init_ac_automaton(args):
+    """Ac automaton initialization function, the compiled automaton is
+    loaded from mapping cache unless mapping files or options changed"""
+    global automaton
+    extra_mapping = args.extra_mapping if isinstance(args.extra_mapping, dict) else {}
+    tables = load_or_build(
+        "musify",
+        args.mapping,
+        lambda: build_ac_automaton(args.mapping, extra_mapping, args.direction),
+        extra={"extra_mapping": extra_mapping, "direction": args.direction},
+    )
+    automaton = CompiledKeywordMap(tables)
 
 
 def is_word_char(char_str):
@@ -237,3 +218,163 @@ def transform_file(path, args):
     if EXCL_FLAG:
         logging.warning("musify exclusion block not closed when file ends.")
         EXCL_FLAG = False
+
+
+EXCL_MARKER_PREFIX = b"MUSIFY_EXCL_"
+EXCL_MARKERS = {
+    b"START": exclusion_start,
+    b"STOP": exclusion_stop,
+    b"LINE": exclusion_line,
+}
+
+
+def _find_exclusion_markers(data):
+    """Yield (offset, exclusion function) of every MUSIFY_EXCL_* marker in data,
+    using bytes.find rather than scanning the whole buffer with an automaton"""
+    prefix_len = len(EXCL_MARKER_PREFIX)
+    offset = data.find(EXCL_MARKER_PREFIX)
+    while offset >= 0:
+        suffix_from = offset + prefix_len
+        for suffix, excl_fn in EXCL_MARKERS.items():
+            if data[suffix_from : suffix_from + len(suffix)] == suffix:
+                yield offset, excl_fn
+                break
+        offset = data.find(EXCL_MARKER_PREFIX, suffix_from)
+
+
+def excluded_ranges(data):
+    """Collect byte ranges of data left untouched by MUSIFY_EXCL_* markers,
+    following the same rules as `transform_line` applies line by line"""
+    global EXCL_FLAG
+    ranges = []
+    excl_from = 0
+    line_no = 1
+    counted_to = 0
+    line_start = line_end = -1
+    returned = False
+
+    def close_line():
+        if returned or EXCL_FLAG:
+            ranges.append((line_start, line_end))
+
+    for offset, excl_fn in _find_exclusion_markers(data):
+        if offset >= line_end:
+            if line_end >= 0:
+                close_line()
+            line_no += bytes(data[counted_to:offset]).count(b"\n")
+            counted_to = offset
+            line_start = data.rfind(b"\n", 0, offset) + 1
+            line_end = data.find(b"\n", offset)
+            line_end = len(data) if line_end < 0 else line_end + 1
+            if EXCL_FLAG:
+                ranges.append((excl_from, line_start))
+            returned = False
+        if returned:
+            continue
+        returned = excl_fn(line_no)
+        if EXCL_FLAG:
+            excl_from = line_end
+
+    if line_end >= 0:
+        close_line()
+    if EXCL_FLAG:
+        ranges.append((excl_from, len(data)))
+        logging.warning("musify exclusion block not closed when file ends.")
+        EXCL_FLAG = False
+    return ranges
+
+
+WORD_BYTES = frozenset(
+    char for char in range(256) if bytes([char]).isalnum() or char == ord("_")
+)
+
+
+def transform_buffer(data):
+    """Transform the whole buffer in a single automaton pass.
+
+    The automaton walk, the longest match selection of `longest_matches` and
+    the word boundary check of `is_word_boundary` are fused into one loop, which
+    is what makes this faster than transforming line by line.
+
+    Returns the list of output chunks, or None if nothing is replaced.
+    """
+    view = memoryview(data)
+    size = len(view)
+    ranges = iter(excluded_ranges(data))
+    excl = next(ranges, None)
+    chunks = []
+    last_end_idx = 0
+
+    def replace(src_name, begin_idx):
+        nonlocal excl, last_end_idx
+        while excl is not None and excl[1] <= begin_idx:
+            excl = next(ranges, None)
+        if excl is not None and excl[0] <= begin_idx:
+            return
+        end_idx = begin_idx + len(src_name)
+        if begin_idx > 0 and view[begin_idx - 1] in WORD_BYTES:
+            return
+        if end_idx < size and view[end_idx] in WORD_BYTES:
+            return
+        chunks.append(view[last_end_idx:begin_idx])
+        chunks.append(values[src_name])
+        last_end_idx = end_idx
+
+    transitions = automaton.transitions
+    outputs = automaton.outputs
+    values = automaton.values
+    root_get = transitions[0].get
+    state = 0
+    cand_name = None
+    cand_begin = cand_end = 0
+    for idx, symbol in enumerate(view):
+        next_state = transitions[state].get(symbol)
+        state = root_get(symbol, 0) if next_state is None else next_state
+        for src_name in outputs[state]:
+            begin_idx = idx + 1 - len(src_name)
+            if cand_name is not None and begin_idx < cand_end:
+                # overlapped, keep the earlier one or the longer at same start
+                if cand_begin < begin_idx or len(cand_name) >= len(src_name):
+                    continue
+            elif cand_name is not None:
+                replace(cand_name, cand_begin)
+            cand_name = src_name
+            cand_begin = begin_idx
+            cand_end = idx + 1
+    if cand_name is not None:
+        replace(cand_name, cand_begin)
+
+    if not chunks:
+        return None
+    chunks.append(view[last_end_idx:])
+    return chunks
+
+
+def transform_file_whole(path, args):
+    """Transform file via memory-mapping it and scanning it at once,
+    files without any replacement are not rewritten in place"""
+    logging.info("Processing %s", path)
+    write_path = None
+    if args.output_method != "terminal":
+        write_path = path + ".mt"
+    with open(path, "rb") as read_handle:
+        if os.fstat(read_handle.fileno()).st_size == 0:
+            # mmap can't map an empty file, the output is empty as well
+            if args.output_method == "create":
+                with open(write_path, "wb"):
+                    pass
+            return
+        with mmap.mmap(read_handle.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            chunks = transform_buffer(buf)
+            if chunks is None:
+                if args.output_method == "inplace":
+                    return
+                chunks = [buf]
+            with writer(write_path) as write_handle:
+                if write_handle is sys.stdout:
+                    write_handle = sys.stdout.buffer
+                write_handle.writelines(chunks)
+            # drop views into buf before it gets closed
+            del chunks
+    if args.output_method == "inplace":
+        os.replace(write_path, path)
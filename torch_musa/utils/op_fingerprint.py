@@ -0,0 +1,340 @@
+"""Low-overhead op fingerprints for CompareWithCPU and NanInfTracker.
+
+Instead of comparing with CPU or printing every tensor, each sampled op output is
+reduced on device to a fingerprint (sum and abs-max, plus nan and inf counts if
+any of them is not finite). Fingerprints stay on device until flushed in batches,
+and are appended to a compact binary log, so that two runs can be bisected for the
+first divergent op:
+
+    python -m torch_musa.utils.op_fingerprint run_a.fp run_b.fp --rtol 1e-3
+"""
+
+import argparse
+import math
+import random
+import struct
+import sys
+import zlib
+from collections import namedtuple
+
+import torch
+
+FINGERPRINT_MAGIC = b"TMFP"
+FINGERPRINT_VERSION = 2
+SAMPLE_MODES = ("hash", "random")
+
+# tag, name id, name length, followed by utf-8 name
+_NAME_RECORD = struct.Struct("<cIH")
+# tag, step, seq, name id, output index, sum, abs max, nan count, inf count
+_FP_RECORD = struct.Struct("<cIIIHddQQ")
+_HEADER = struct.Struct("<4sH")
+
+Fingerprint = namedtuple(
+    "Fingerprint", ["step", "seq", "op_name", "index", "sum", "abs_max", "nan", "inf"]
+)
+
+
+class OpSampler:
+    """
+    Decides whether an op is fingerprinted.
+
+    Attributes:
+        rate (float): Fraction of ops to sample, 1.0 samples every op.
+        mode (str): "hash" samples by hash of the op name, so the same ops are sampled
+            in every step, rank and run; "random" samples each op call independently.
+        seed (int): Seed of "random" mode.
+    """
+
+    def __init__(self, rate=1.0, mode="hash", seed=0):
+        if mode not in SAMPLE_MODES:
+            raise ValueError(f"sample mode must be one of {SAMPLE_MODES}, got {mode}")
+        self.rate = rate
+        self.mode = mode
+        self.rng = random.Random(seed)
+        self.decisions = {}
+
+    def __call__(self, op_name):
+        if self.rate >= 1.0:
+            return True
+        if self.rate <= 0.0:
+            return False
+        if self.mode == "random":
+            return self.rng.random() < self.rate
+        decision = self.decisions.get(op_name)
+        if decision is None:
+            decision = zlib.crc32(op_name.encode()) / 2**32 < self.rate
+            self.decisions[op_name] = decision
+        return decision
+
+
+def fingerprint_tensor(tensor):
+    """
+    Reduces a tensor to [sum, abs max, nan count, inf count] on its own device. The
+    sum and abs max are computed in fp32, floating point tensors are reduced without
+    being copied to fp32 first, and the result is fp64 to keep the counts exact.
+    Returns None for empty tensors.
+    """
+    if tensor.numel() == 0:
+        return None
+    values = tensor.detach()
+    if values.is_complex():
+        values = torch.view_as_real(values)
+    if not values.is_floating_point():
+        values = values.float()
+    return torch.stack(
+        [
+            values.sum(dtype=torch.float32).double(),
+            values.abs().amax().double(),
+            values.isnan().sum().double(),
+            values.isinf().sum().double(),
+        ]
+    )
+
+
+def flatten_tensors(out):
+    """
+    Returns tensors of a nested structure of tensors, lists, tuples and dicts in order.
+    """
+    if isinstance(out, torch.Tensor):
+        return [out]
+    if isinstance(out, (list, tuple)):
+        return [t for x in out for t in flatten_tensors(x)]
+    if isinstance(out, dict):
+        return flatten_tensors(list(out.values()))
+    return []
+
+
+class FingerprintWriter:
+    """
+    Appends fingerprints to a binary log. Op names are written once and referred by id.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "wb")  # pylint: disable=consider-using-with
+        self.file.write(_HEADER.pack(FINGERPRINT_MAGIC, FINGERPRINT_VERSION))
+        self.name_ids = {}
+
+    def name_id(self, op_name):
+        """Returns id of op_name, writing its definition on first use"""
+        name_id = self.name_ids.get(op_name)
+        if name_id is None:
+            name_id = len(self.name_ids)
+            self.name_ids[op_name] = name_id
+            encoded = op_name.encode()
+            self.file.write(_NAME_RECORD.pack(b"N", name_id, len(encoded)) + encoded)
+        return name_id
+
+    def write(self, fingerprint):
+        """Appends a Fingerprint"""
+        self.file.write(
+            _FP_RECORD.pack(
+                b"F",
+                fingerprint.step,
+                fingerprint.seq,
+                self.name_id(fingerprint.op_name),
+                fingerprint.index,
+                fingerprint.sum,
+                fingerprint.abs_max,
+                fingerprint.nan,
+                fingerprint.inf,
+            )
+        )
+
+    def flush(self):
+        """Flushes written records to the file"""
+        self.file.flush()
+
+    def close(self):
+        """Closes the log"""
+        if not self.file.closed:
+            self.file.close()
+
+
+def read_fingerprints(path):
+    """
+    Yields Fingerprint records of a binary log in written order.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, version = _HEADER.unpack_from(data, 0)
+    if magic != FINGERPRINT_MAGIC or version != FINGERPRINT_VERSION:
+        raise ValueError(
+            f"{path} is not a fingerprint log of version {FINGERPRINT_VERSION}"
+        )
+    names = {}
+    offset = _HEADER.size
+    while offset < len(data):
+        tag = data[offset : offset + 1]
+        if tag == b"N":
+            _, name_id, length = _NAME_RECORD.unpack_from(data, offset)
+            offset += _NAME_RECORD.size
+            names[name_id] = data[offset : offset + length].decode()
+            offset += length
+        elif tag == b"F":
+            if offset + _FP_RECORD.size > len(data):
+                break  # truncated by a killed job
+            _, step, seq, name_id, index, sum_, abs_max, nan, inf = (
+                _FP_RECORD.unpack_from(data, offset)
+            )
+            offset += _FP_RECORD.size
+            yield Fingerprint(step, seq, names[name_id], index, sum_, abs_max, nan, inf)
+        else:
+            raise ValueError(f"Unknown record tag {tag!r} at offset {offset} of {path}")
+
+
+def _values_close(lhs, rhs, atol, rtol):
+    if math.isfinite(lhs) and math.isfinite(rhs):
+        return math.isclose(lhs, rhs, rel_tol=rtol, abs_tol=atol)
+    return lhs == rhs or (math.isnan(lhs) and math.isnan(rhs))
+
+
+def fingerprints_close(lhs, rhs, atol, rtol):
+    """Whether two fingerprints of the same op output agree"""
+    if lhs.nan != rhs.nan or lhs.inf != rhs.inf:
+        return False
+    return _values_close(lhs.sum, rhs.sum, atol, rtol) and _values_close(
+        lhs.abs_max, rhs.abs_max, atol, rtol
+    )
+
+
+def find_first_divergence(lhs_path, rhs_path, atol=1e-5, rtol=1e-3):
+    """
+    Finds the first op output whose fingerprints differ between two logs.
+
+    Records are aligned by (step, seq, output index), so both runs must execute the
+    same sequence of ops, and must be sampled in "hash" mode with the same rate.
+
+    Returns:
+    tuple: (lhs Fingerprint, rhs Fingerprint) of the first divergence, or None if no
+    divergence is found within the common length of both logs.
+    """
+    lhs_iter = read_fingerprints(lhs_path)
+    rhs_iter = read_fingerprints(rhs_path)
+    for lhs in lhs_iter:
+        rhs = next(rhs_iter, None)
+        if rhs is None:
+            break  # rhs is shorter, e.g. killed earlier
+        if (lhs.step, lhs.seq, lhs.index, lhs.op_name) != (
+            rhs.step,
+            rhs.seq,
+            rhs.index,
+            rhs.op_name,
+        ):
+            return lhs, rhs
+        if not fingerprints_close(lhs, rhs, atol, rtol):
+            return lhs, rhs
+    return None
+
+
+class FingerprintRecorder:
+    """
+    Fingerprints outputs of sampled ops, keeps them on device and flushes them to
+    a FingerprintWriter in batches, so that only one host sync is paid per batch.
+    Only the reduced fingerprints are kept, outputs are not referenced after being
+    recorded.
+
+    Attributes:
+        path (str): Path of the binary log.
+        sampler (OpSampler): Decides which ops are fingerprinted.
+        flush_interval (int): Number of pending fingerprints triggering a flush.
+    """
+
+    def __init__(self, path, sampler, flush_interval=1024):
+        self.writer = FingerprintWriter(path)
+        self.sampler = sampler
+        self.flush_interval = flush_interval
+        self.step_cnt = 0
+        self.seq = 0
+        self.pending = []
+
+    def record(self, op_name, full_op_name, out):
+        """
+        Records fingerprints of out under full_op_name if op_name is sampled. Every call
+        advances the op sequence number, so records of sampled ops are aligned across runs.
+
+        Returns:
+        list[Fingerprint]: Fingerprints containing nan or inf if a flush is triggered.
+        """
+        seq = self.seq
+        self.seq += 1
+        if not self.sampler(op_name):
+            return []
+        for index, tensor in enumerate(flatten_tensors(out)):
+            stats = fingerprint_tensor(tensor)
+            if stats is not None:
+                self.pending.append((self.step_cnt, seq, full_op_name, index, stats))
+        if len(self.pending) >= self.flush_interval:
+            return self.flush()
+        return []
+
+    def flush(self):
+        """
+        Copies pending fingerprints to host and writes them.
+
+        Returns:
+        list[Fingerprint]: Flushed fingerprints containing nan or inf.
+        """
+        if not self.pending:
+            return []
+        by_device = {}
+        for i, item in enumerate(self.pending):
+            by_device.setdefault(item[4].device, []).append(i)
+        host_stats = [None] * len(self.pending)
+        for indices in by_device.values():
+            stacked = torch.stack([self.pending[i][4] for i in indices]).cpu().tolist()
+            for i, stats in zip(indices, stacked):
+                host_stats[i] = stats
+        abnormal = []
+        for (step, seq, op_name, index, _), (sum_, abs_max, nan, inf) in zip(
+            self.pending, host_stats
+        ):
+            fingerprint = Fingerprint(
+                step, seq, op_name, index, sum_, abs_max, int(nan), int(inf)
+            )
+            self.writer.write(fingerprint)
+            if fingerprint.nan or fingerprint.inf:
+                abnormal.append(fingerprint)
+        self.pending.clear()
+        self.writer.flush()
+        return abnormal
+
+    def step(self):
+        """Flushes pending fingerprints and starts a new step"""
+        abnormal = self.flush()
+        self.step_cnt += 1
+        self.seq = 0
+        return abnormal
+
+    def close(self):
+        """Flushes pending fingerprints and closes the log"""
+        try:
+            return self.flush()
+        finally:
+            self.writer.close()
+
+
+def main():
+    """Command line entry, exits with 1 if the two logs diverge"""
+    parser = argparse.ArgumentParser(
+        description="Find the first divergent op between two fingerprint logs"
+    )
+    parser.add_argument("lhs", help="fingerprint log of the reference run")
+    parser.add_argument("rhs", help="fingerprint log of the run to check")
+    parser.add_argument("--atol", type=float, default=1e-5)
+    parser.add_argument("--rtol", type=float, default=1e-3)
+    args = parser.parse_args()
+
+    divergence = find_first_divergence(args.lhs, args.rhs, args.atol, args.rtol)
+    if divergence is None:
+        print("No divergence found")
+        sys.exit(0)
+    lhs, rhs = divergence
+    print("First divergence:")
+    print(f"  {args.lhs}: {lhs}")
+    print(f"  {args.rhs}: {rhs}")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
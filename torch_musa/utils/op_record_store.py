@@ -0,0 +1,231 @@
+"""Append-only store of op records dumped by compare_tool.
+
+A store is a pair of files per rank:
+
+- `<path>`: records of (args, kwargs, out). Each record starts with a fixed header and
+  a pickled meta holding the nested structure, in which tensors are replaced by
+  `TensorRef`, followed by every tensor as a raw contiguous buffer aligned to 64 bytes.
+- `<path>.idx`: one json line per record, mapping (step, seq, op_name) to its offset.
+
+Records are loaded from a memory map, tensors are created on top of the mapped pages
+without copying, so replaying one op of a huge store only touches its own bytes.
+"""
+
+import json
+import mmap
+import os
+import pickle
+import struct
+from collections import namedtuple
+
+import torch
+
+RECORD_MAGIC = b"TMOR"
+RECORD_VERSION = 1
+ALIGNMENT = 64
+
+# magic, version, meta length, payload length
+_RECORD_HEADER = struct.Struct("<4sHIQ")
+
+TensorRef = namedtuple("TensorRef", ["index"])
+TensorMeta = namedtuple("TensorMeta", ["dtype", "shape", "offset", "nbytes"])
+IndexEntry = namedtuple("IndexEntry", ["step", "seq", "op_name", "offset", "length"])
+OpRecord = namedtuple("OpRecord", ["step", "seq", "op_name", "args", "kwargs", "out"])
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _extract_tensors(inputs, tensors):
+    """Replaces tensors of a nested structure by TensorRef, collecting them in order"""
+    if isinstance(inputs, torch.Tensor):
+        tensors.append(inputs.detach().cpu().contiguous())
+        return TensorRef(len(tensors) - 1)
+    if isinstance(inputs, list):
+        return [_extract_tensors(x, tensors) for x in inputs]
+    if isinstance(inputs, tuple):
+        return tuple(_extract_tensors(x, tensors) for x in inputs)
+    if isinstance(inputs, dict):
+        return {k: _extract_tensors(v, tensors) for k, v in inputs.items()}
+    return inputs
+
+
+def _restore_tensors(inputs, tensors):
+    """Inverse of _extract_tensors"""
+    if isinstance(inputs, TensorRef):
+        return tensors[inputs.index]
+    if isinstance(inputs, list):
+        return [_restore_tensors(x, tensors) for x in inputs]
+    if isinstance(inputs, tuple):
+        return tuple(_restore_tensors(x, tensors) for x in inputs)
+    if isinstance(inputs, dict):
+        return {k: _restore_tensors(v, tensors) for k, v in inputs.items()}
+    return inputs
+
+
+def _tensor_bytes(tensor):
+    """Returns a buffer of the raw bytes of a contiguous CPU tensor"""
+    if tensor.numel() == 0:
+        return b""
+    return memoryview(tensor.reshape(-1).view(torch.uint8).numpy())
+
+
+class OpRecordStore:
+    """
+    Append-only, indexed store of op records.
+
+    Attributes:
+        path (str): Path of the data file, the index is saved to `path + ".idx"`.
+        mode (str): "a" appends records to the store, "r" only reads it.
+    """
+
+    def __init__(self, path, mode="r"):
+        if mode not in ("r", "a"):
+            raise ValueError(f"mode must be 'r' or 'a', got {mode}")
+        self.path = path
+        self.index_path = path + ".idx"
+        self.mode = mode
+        self.index = []
+        self.data_file = None
+        self.index_file = None
+        self.mmap = None
+        self.mmap_size = 0
+        if mode == "a":
+            # pylint: disable=consider-using-with
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.data_file = open(path, "ab")
+            self.index_file = open(self.index_path, "a", encoding="utf-8")
+        self.load_index()
+
+    def load_index(self):
+        """Loads the index, dropping entries of records not completely written"""
+        self.index = []
+        if not os.path.exists(self.index_path):
+            return
+        data_size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        with open(self.index_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = IndexEntry(*json.loads(line))
+                except (ValueError, TypeError):
+                    break  # truncated line of a killed job
+                if entry.offset + entry.length > data_size:
+                    break
+                self.index.append(entry)
+
+    def append(self, step, seq, op_name, args, kwargs, out):
+        """
+        Appends a record of an op, tensors are copied to CPU if needed.
+
+        Returns:
+        IndexEntry: Index entry of the record.
+        """
+        if self.mode != "a":
+            raise RuntimeError(f"{self.path} is opened read-only")
+        tensors = []
+        structure = _extract_tensors((args, kwargs, out), tensors)
+        metas, payload_len = [], 0
+        for tensor in tensors:
+            nbytes = tensor.numel() * tensor.element_size()
+            metas.append(
+                TensorMeta(str(tensor.dtype), tuple(tensor.shape), payload_len, nbytes)
+            )
+            payload_len = _align(payload_len + nbytes)
+        meta = pickle.dumps((step, seq, op_name, structure, metas))
+        header_len = _align(_RECORD_HEADER.size + len(meta))
+
+        offset = self.data_file.seek(0, os.SEEK_END)
+        self.data_file.write(
+            _RECORD_HEADER.pack(RECORD_MAGIC, RECORD_VERSION, len(meta), payload_len)
+        )
+        self.data_file.write(meta)
+        self.data_file.write(b"\0" * (header_len - _RECORD_HEADER.size - len(meta)))
+        for tensor, tensor_meta in zip(tensors, metas):
+            self.data_file.write(_tensor_bytes(tensor))
+            self.data_file.write(
+                b"\0" * (_align(tensor_meta.nbytes) - tensor_meta.nbytes)
+            )
+        self.data_file.flush()
+
+        entry = IndexEntry(step, seq, op_name, offset, header_len + payload_len)
+        self.index_file.write(json.dumps(list(entry)) + "\n")
+        self.index_file.flush()
+        self.index.append(entry)
+        return entry
+
+    def find(self, op_name=None, step=None, seq=None):
+        """Returns index entries matching all given keys"""
+        return [
+            entry
+            for entry in self.index
+            if (op_name is None or entry.op_name == op_name)
+            and (step is None or entry.step == step)
+            and (seq is None or entry.seq == seq)
+        ]
+
+    def _mapped(self, end):
+        """Returns a memory map of the data file covering [0, end)"""
+        if self.mmap is None or self.mmap_size < end:
+            if self.data_file is not None:
+                self.data_file.flush()
+            with open(self.path, "rb") as f:
+                # copy-on-write pages, so that tensors built on them are writable
+                self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+            self.mmap_size = len(self.mmap)
+        return self.mmap
+
+    def load(self, entry):
+        """
+        Loads a record, whose tensors share memory with the mapped data file.
+
+        Returns:
+        OpRecord: The loaded record.
+        """
+        buf = self._mapped(entry.offset + entry.length)
+        magic, version, meta_len, _ = _RECORD_HEADER.unpack_from(buf, entry.offset)
+        if magic != RECORD_MAGIC or version != RECORD_VERSION:
+            raise ValueError(
+                f"No record of version {RECORD_VERSION} at {entry.offset} of {self.path}"
+            )
+        meta_start = entry.offset + _RECORD_HEADER.size
+        step, seq, op_name, structure, metas = pickle.loads(
+            buf[meta_start : meta_start + meta_len]
+        )
+        payload_start = entry.offset + _align(_RECORD_HEADER.size + meta_len)
+        tensors = []
+        for tensor_meta in metas:
+            dtype = getattr(torch, tensor_meta.dtype.split(".")[-1])
+            if tensor_meta.nbytes == 0:
+                tensors.append(torch.empty(tensor_meta.shape, dtype=dtype))
+                continue
+            raw = torch.frombuffer(
+                buf,
+                dtype=torch.uint8,
+                count=tensor_meta.nbytes,
+                offset=payload_start + tensor_meta.offset,
+            )
+            tensors.append(raw.view(dtype).reshape(tensor_meta.shape))
+        args, kwargs, out = _restore_tensors(structure, tensors)
+        return OpRecord(step, seq, op_name, args, kwargs, out)
+
+    def __iter__(self):
+        for entry in self.index:
+            yield self.load(entry)
+
+    def __len__(self):
+        return len(self.index)
+
+    def close(self):
+        """Closes files of the store, records loaded before must not be used any more"""
+        for f in (self.data_file, self.index_file):
+            if f is not None:
+                f.close()
+        self.data_file = self.index_file = None
+        self.mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -9,9 +9,12 @@ from os import makedirs
 from os.path import realpath, dirname, join, split, exists, relpath
 from typing import NoReturn
 
+from .keyword_map import CompiledKeywordMap, compile_keywords
 from .logger_util import LOGGER
+from .mapping_cache import load_or_build
 
 EXT_REPLACED_MAPPING = {"cuh": "muh", "cu": "mu"}
+ENGINES = ("replace", "single_pass")
 
 
 def read_json(json_file_path: str) -> dict:
@@ -30,7 +33,12 @@ class SimplePorting:
         mapping_rule: dict = None,
         drop_default_mapping: bool = False,
         mapping_dir_path: str = None,
+        engine: str = "replace",
     ):
+        if engine not in ENGINES:
+            raise ValueError(f"engine should be one of {ENGINES}, got {engine}")
+        self.engine = engine
+        self.keyword_map = None
         self.overwrite_default_mapping = drop_default_mapping
         self.mapping_rule = mapping_rule
         self.mapping_dir_path = mapping_dir_path
@@ -70,18 +78,61 @@ class SimplePorting:
         else:
             if not self.mapping_dir_path:
                 self.mapping_dir_path = realpath(join(dirname(__file__), "mapping"))
-            for name in os.listdir(self.mapping_dir_path):
-                if name.endswith(".json") and name != "general.json":
-                    self.mapping_rule.update(
-                        read_json(join(self.mapping_dir_path, name))
-                    )
-                    LOGGER.info("loading %s...", name)
-        self.mapping_rule = sorted(
-            self.mapping_rule.items(), key=lambda x: len(x[0]), reverse=True
-        )
-        print(self.mapping_rule)
+            mapping_files = [
+                join(self.mapping_dir_path, name)
+                for name in sorted(os.listdir(self.mapping_dir_path))
+                if name.endswith(".json") and name != "general.json"
+            ]
+            self.mapping_rule = load_or_build(
+                "simple_porting",
+                mapping_files,
+                lambda: self._merge_mapping_files(mapping_files),
+                extra=self.mapping_rule,
+            )
+            LOGGER.info("Loading %s mapping rules...", len(self.mapping_rule))
+        if isinstance(self.mapping_rule, dict):
+            self.mapping_rule = sorted(
+                self.mapping_rule.items(), key=lambda x: len(x[0]), reverse=True
+            )
+        LOGGER.debug("Mapping rules: %s", self.mapping_rule)
+        if self.engine == "single_pass":
+            self.keyword_map = CompiledKeywordMap(compile_keywords(self.mapping_rule))
         LOGGER.info("Loading all mapping files success.")
 
+    def _merge_mapping_files(self, mapping_files: list) -> list:
+        """Merge mapping files into mapping_rule and sort by key length"""
+        mapping_rule = dict(self.mapping_rule)
+        for path in mapping_files:
+            mapping_rule.update(read_json(path))
+            LOGGER.info("loading %s...", path)
+        return sorted(mapping_rule.items(), key=lambda x: len(x[0]), reverse=True)
+
+    def replace_line(self, line: str) -> str:
+        """Replace line via mapping rules"""
+        if self.engine == "replace":
+            for k, v in self.mapping_rule:
+                # header files in cub library are suffixed with ".cuh" instead of ".muh",
+                # which is not consistent with other musa libraries. So here we need to skip
+                # header files replacement of cub library.
+                if "cub/" not in line:
+                    line = line.replace(k, v)
+            return line
+
+        # single pass over the line, among overlapped keys the leftmost then the
+        # longest one wins, and replaced text is never matched again
+        if "cub/" in line:
+            return line
+        chunks = []
+        last_end_idx = 0
+        for (key, begin_idx), value in self.keyword_map.search_longest(line):
+            chunks.append(line[last_end_idx:begin_idx])
+            chunks.append(value)
+            last_end_idx = begin_idx + len(key)
+        if not chunks:
+            return line
+        chunks.append(line[last_end_idx:])
+        return "".join(chunks)
+
     def modify_file(self, cuda_filepath: str, musa_filepath: str) -> NoReturn:
         """Modify file via mapping files"""
         with open(cuda_filepath, encoding="utf-8") as f:
@@ -90,13 +141,7 @@ class SimplePorting:
                     if line.startswith("*") or line.startswith("/") or line == "":
                         f_musa.write(line)
                         continue
-                    for k, v in self.mapping_rule:
-                        # header files in cub library are suffixed with ".cuh" instead of ".muh",
-                        # which is not consistent with other musa libraries. So here we need to skip
-                        # header files replacement of cub library.
-                        if "cub/" not in line:
-                            line = line.replace(k, v)
-                    f_musa.write(line)
+                    f_musa.write(self.replace_line(line))
 
     def change_filename(self, name) -> str:
         """Change filename to musa related file."""
@@ -181,6 +226,13 @@ if __name__ == "__main__":
         help="Specify where mapping directory locate" "e.g. mapping/",
         default=None,
     )
+    parser.add_argument(
+        "--engine",
+        help="Specify replacing engine, single_pass scans each line once "
+        "instead of calling str.replace for every mapping rule",
+        choices=ENGINES,
+        default="replace",
+    )
     args = parser.parse_args()
     print(vars(args))
     simple_porting_test = SimplePorting(
@@ -189,5 +241,6 @@ if __name__ == "__main__":
         args.mapping_rule,
         args.drop_default_mapping,
         args.mapping_dir_path,
+        args.engine,
     )
     simple_porting_test.run()
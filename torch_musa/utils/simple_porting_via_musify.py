@@ -2,19 +2,25 @@
 
 import argparse
 import glob
+import hashlib
 import json
 import logging
+import os
 import pathlib
 import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from os import rename, makedirs
-from os.path import realpath, join, split, isfile, exists
+from os.path import realpath, join, split, isfile, exists, relpath, dirname
 from typing import List, Dict
 
 from .logger_util import LOGGER
-from .musify_text import init_ac_automaton, transform_file
+from .musify_text import init_ac_automaton, transform_file, transform_file_whole
 
 EXT_REPLACED_MAPPING = {"cuh": "muh", "cu": "mu"}
 SEFL_PATH = str(pathlib.Path(__file__).parent)
+MANIFEST_NAME = ".musify_manifest.json"
+MANIFEST_VERSION = 1
 
 
 def read_json(json_file_path: str) -> dict:
@@ -23,6 +29,46 @@ def read_json(json_file_path: str) -> dict:
         return json.load(f)
 
 
+def hash_file(file_path: str) -> str:
+    """Hash file content"""
+    hasher = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+# porting arguments of a worker process, set once by _init_worker so that tasks
+# only carry their source path
+_WORKER_ARGS = None
+
+
+def _init_worker(porting_args):
+    """Build the automaton once per worker process"""
+    global _WORKER_ARGS
+    _WORKER_ARGS = porting_args
+    logging.basicConfig(
+        format="[%(levelname)s] [%(asctime)s] %(message)s",
+        level=porting_args.log_level,
+    )
+    init_ac_automaton(porting_args)
+
+
+def _transform_file(src, porting_args):
+    """Transform one file and return its elapsed time"""
+    start = time.perf_counter()
+    if porting_args.whole_file:
+        transform_file_whole(src, porting_args)
+    else:
+        transform_file(src, porting_args)
+    return src, time.perf_counter() - start
+
+
+def _transform_worker(src):
+    """Transform one file in a worker process initialized by _init_worker"""
+    return _transform_file(src, _WORKER_ARGS)
+
+
 class SimplePortingViaMusify:
     """Simple porting tool, integrate with musify-text"""
 
@@ -36,6 +82,9 @@ class SimplePortingViaMusify:
         output_method: str = "inplace",
         direction: str = "c2m",
         log_level: str = "INFO",
+        incremental: bool = False,
+        jobs: int = 1,
+        whole_file: bool = False,
     ):
         self.cuda_dir_path = cuda_dir_path
         cuda_dirname = split(self.cuda_dir_path)[-1]
@@ -57,13 +106,21 @@ class SimplePortingViaMusify:
         self.args.output_method = output_method
         self.args.direction = direction
         self.args.log_level = log_level
+        self.args.whole_file = whole_file
         self.ignore_patterns = ignore_patterns if ignore_patterns else []
         self.args.mapping = mapping
         if drop_default_mapping:
             self.args.mapping = []
-        self._delete_srcs()
-        self._copy_srcs()
-        self._collect_srcs()
+        self.incremental = incremental
+        self.jobs = max(1, jobs or os.cpu_count() or 1)
+        self.manifest_path = join(self.musa_dir_path, MANIFEST_NAME)
+        self.manifest = {}
+        if self.incremental:
+            self._collect_stale_srcs()
+        else:
+            self._delete_srcs()
+            self._copy_srcs()
+            self._collect_srcs()
 
     def _delete_srcs(self):
         if exists(self.musa_dir_path):
@@ -90,6 +147,108 @@ class SimplePortingViaMusify:
         self.args.srcs = [file for file in all_files if isfile(file)]
         LOGGER.info("Finish collecting all sources.")
 
+    def _mapping_hash(self) -> str:
+        """Hash the mapping set, a change of it invalidates every ported file"""
+        hasher = hashlib.sha256()
+        for path in self.args.mapping or []:
+            hasher.update(hash_file(path).encode())
+        hasher.update(json.dumps(self.args.extra_mapping, sort_keys=True).encode())
+        hasher.update(self.args.direction.encode())
+        return hasher.hexdigest()
+
+    def _load_manifest(self, mapping_hash: str) -> dict:
+        """Load manifest of previous porting, return empty if it is unusable"""
+        if not isfile(self.manifest_path):
+            return {}
+        try:
+            manifest = read_json(self.manifest_path)
+        except (OSError, ValueError) as exception:
+            LOGGER.warning("Failed to load %s: %s", self.manifest_path, exception)
+            return {}
+        if (
+            manifest.get("version") != MANIFEST_VERSION
+            or manifest.get("mapping_hash") != mapping_hash
+        ):
+            LOGGER.info("Mapping changed since last porting, port all sources.")
+            return {}
+        return manifest.get("files", {})
+
+    def _walk_cuda_srcs(self):
+        """Walk cuda sources with the same ignore rules as `_copy_srcs`"""
+        ignore = shutil.ignore_patterns(*self.ignore_patterns)
+        for root, dirs, files in os.walk(self.cuda_dir_path):
+            ignored = ignore(root, dirs + files)
+            dirs[:] = [d for d in dirs if d not in ignored]
+            for file in files:
+                if file not in ignored:
+                    yield relpath(join(root, file), self.cuda_dir_path)
+
+    def _collect_stale_srcs(self):
+        """Copy only sources changed since last porting"""
+        mapping_hash = self._mapping_hash()
+        old_files = self._load_manifest(mapping_hash)
+        if not old_files:
+            self._delete_srcs()
+        makedirs(self.musa_dir_path, exist_ok=True)
+
+        self.manifest = {"version": MANIFEST_VERSION, "mapping_hash": mapping_hash}
+        files = {}
+        self.args.srcs = []
+        for rel_src in self._walk_cuda_srcs():
+            src_hash = hash_file(join(self.cuda_dir_path, rel_src))
+            rel_dst = self._change_file_ext(rel_src)
+            files[rel_src] = {"hash": src_hash, "output": rel_dst}
+            old = old_files.get(rel_src)
+            if (
+                old
+                and old["hash"] == src_hash
+                and isfile(join(self.musa_dir_path, old["output"]))
+            ):
+                continue
+            musa_src = join(self.musa_dir_path, rel_src)
+            makedirs(dirname(musa_src), exist_ok=True)
+            shutil.copy2(join(self.cuda_dir_path, rel_src), musa_src)
+            self.args.srcs.append(musa_src)
+
+        for rel_src in old_files.keys() - files.keys():
+            stale_output = join(self.musa_dir_path, old_files[rel_src]["output"])
+            if isfile(stale_output):
+                os.remove(stale_output)
+        self.manifest["files"] = files
+        LOGGER.info(
+            "Finish collecting sources, %s of %s need porting.",
+            len(self.args.srcs),
+            len(files),
+        )
+
+    def _save_manifest(self):
+        with open(self.manifest_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f)
+
+    def _transform_srcs(self):
+        """Transform sources serially or shard them across worker processes"""
+        total = len(self.args.srcs)
+        if total == 0:
+            return
+        if self.jobs == 1 or total <= 1:
+            init_ac_automaton(self.args)
+            for i, src in enumerate(self.args.srcs):
+                _, elapsed = _transform_file(src, self.args)
+                LOGGER.info("Ported %s (%s/%s) in %.3fs", src, i + 1, total, elapsed)
+            return
+
+        with ProcessPoolExecutor(
+            max_workers=min(self.jobs, total),
+            initializer=_init_worker,
+            initargs=(self.args,),
+        ) as executor:
+            futures = [
+                executor.submit(_transform_worker, src) for src in self.args.srcs
+            ]
+            for i, future in enumerate(as_completed(futures)):
+                src, elapsed = future.result()
+                LOGGER.info("Ported %s (%s/%s) in %.3fs", src, i + 1, total, elapsed)
+
     def _rename_ext(self):
         for file in self.args.srcs:
             rename(file, self._change_file_ext(file))
@@ -111,13 +270,18 @@ class SimplePortingViaMusify:
             level=self.args.log_level,
         )
         logging.debug("Options: %s", self.args)
-        init_ac_automaton(self.args)
 
-        for src in self.args.srcs:
-            transform_file(src, self.args)
-        LOGGER.info("Finish porting all sources.")
+        start = time.perf_counter()
+        self._transform_srcs()
+        LOGGER.info(
+            "Finish porting %s sources in %.2fs.",
+            len(self.args.srcs),
+            time.perf_counter() - start,
+        )
 
         self._rename_ext()
+        if self.incremental:
+            self._save_manifest()
 
 
 if __name__ == "__main__":
@@ -164,6 +328,22 @@ if __name__ == "__main__":
         choices=["DEBUG", "INFO", "WARNING"],
         default="INFO",
     )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only port sources changed since last porting",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        help="Number of worker processes, 0 means using all cpu cores",
+        default=1,
+    )
+    parser.add_argument(
+        "--whole-file",
+        action="store_true",
+        help="Scan each source as a whole memory-mapped buffer instead of line by line",
+    )
     args = parser.parse_args()
     print(vars(args))
     simple_porting_test = SimplePortingViaMusify(
@@ -172,5 +352,8 @@ if __name__ == "__main__":
         args.extra_mapping,
         args.drop_default_mapping,
         args.mapping,
+        incremental=args.incremental,
+        jobs=args.jobs,
+        whole_file=args.whole_file,
     )
     simple_porting_test.run()